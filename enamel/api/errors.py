@@ -16,6 +16,12 @@ import flask
 import httpexceptor
 
 
+class HTTP501(httpexceptor.HTTPException):
+    """501 Not Implemented"""
+
+    status = __doc__
+
+
 def handle_error(error):
     """Trap an HTTPException and package it for display"""
     # This current implementation is based on the httpexceptor model
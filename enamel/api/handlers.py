@@ -11,48 +11,392 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import hashlib
 import os
 import re
+import threading
 
 import flask
+import httpexceptor
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+import six
+from six.moves.urllib import parse as urlparse
 
 from enamel.api import decorators
+from enamel.api import errors
+from enamel import dispatch
+from enamel.objects import exception as obj_exception
+from enamel.objects import task as task_obj
+from enamel.objects import task_item as task_item_obj
 
+LOG = logging.getLogger(__name__)
 
-def create_link_object(urls):
+BOOT_ACTION = 'boot_server'
+
+# Owner of the tasks created while authentication is off.
+ANONYMOUS = 'anonymous'
+
+# Role allowed to see the tasks of every project.
+ADMIN_ROLE = 'admin'
+
+EVENT_STREAM = 'text/event-stream'
+
+# States after which a task no longer changes.
+FINAL_STATES = (task_obj.COMPLETE, task_obj.ERROR, task_obj.EXPIRED)
+
+
+# Most url_roots whose root document is kept.
+MAX_ROOT_DOCUMENTS = 16
+
+# Seconds clients and caches may reuse the root document.
+ROOT_MAX_AGE = 3600
+
+RESOURCE_PATTERN = re.compile(r'^/[^/]*?$')
+
+
+def create_link_object(urls, url_root=None):
+    if url_root is None:
+        url_root = flask.request.url_root
     links = []
     for url in urls:
         links.append({"rel": "self",
-                      "href": os.path.join(flask.request.url_root, url)})
+                      "href": os.path.join(url_root, url)})
     return links
 
 
-def generate_resource_data(resources):
+def generate_resource_data(resources, url_root=None):
     data = []
     for resource in resources:
         item = {}
         item['name'] = str(resource).split('/')[-1]
-        item['links'] = create_link_object([str(resource)[1:]])
+        item['links'] = create_link_object([str(resource)[1:]], url_root)
         data.append(item)
     return data
 
 
+def find_resources(app):
+    """Return the paths of the app's top level resources."""
+    return [str(rule) for rule in app.url_map.iter_rules()
+            if RESOURCE_PATTERN.match(str(rule))]
+
+
+class RootDocument(object):
+    """The root document of an app, serialized once per url_root.
+
+    :param resources: paths of the resources the document links to
+    :param max_documents: most url_roots whose document is kept; those
+                          beyond are served a document built afresh
+    """
+
+    def __init__(self, resources, max_documents=MAX_ROOT_DOCUMENTS):
+        self.resources = resources
+        self.max_documents = max_documents
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def get(self, url_root):
+        """Return the serialized document and its ETag for url_root."""
+        document = self._documents.get(url_root)
+        if document is not None:
+            return document
+        body = jsonutils.dump_as_bytes(
+            {'resources': generate_resource_data(self.resources, url_root)})
+        document = (body, hashlib.sha1(body).hexdigest())
+        with self._lock:
+            # The url_root comes from the Host header, so
+            # clients choose it; only so many documents are kept.
+            if len(self._documents) < self.max_documents:
+                self._documents[url_root] = document
+        return document
+
+
 @decorators.accept()
 def home():
-    pat = re.compile("^\/[^\/]*?$")
+    root_document = flask.current_app.config['ENAMEL_ROOT_DOCUMENT']
+    body, etag = root_document.get(flask.request.url_root)
+    if flask.request.if_none_match.contains_weak(etag):
+        response = flask.Response(status=304)
+    else:
+        response = flask.Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = ROOT_MAX_AGE
+    return response
+
+
+def task_url(task):
+    return 'tasks/%s' % task.uuid
+
+
+def _isotime(value):
+    return value.isoformat() if value is not None else None
+
+
+def generate_task_data(task):
+    return {
+        'uuid': task.uuid,
+        'action': task.action,
+        'state': task.state,
+        'project_id': task.project_id,
+        'created_at': _isotime(task.created_at),
+        'updated_at': _isotime(task.updated_at),
+        'deadline': _isotime(task.deadline),
+        'links': create_link_object([task_url(task)]),
+    }
+
 
-    resources = []
-    for url in flask.current_app.url_map.iter_rules():
-        if pat.match(str(url)):
-            resources.append(url)
+def _publish(task):
+    transport = flask.current_app.config.get('ENAMEL_TRANSPORT')
+    if transport is None:
+        return
+    try:
+        dispatch.publish_task(transport, task)
+    except Exception:
+        # The task is safely stored; a processor will
+        # find it when it next polls.
+        LOG.exception("Unable to publish task %s", task.uuid)
 
-    return flask.jsonify(resources=generate_resource_data(resources))
+
+def create_task(action, params, deadline=None):
+    """Store a pending task and announce it to the task processors.
+
+    The task is stored with a single item of its action, which the
+    task processor runs with the ItemAction registered for it. Nothing
+    else is done on the request's behalf: the task is run later by a
+    task processor, however long that takes, unless it has a deadline,
+    after which it is abandoned if not started.
+    """
+    headers = flask.request.headers
+    task = task_obj.Task(uuid=uuidutils.generate_uuid(),
+                         action=action,
+                         state=task_obj.PENDING,
+                         request_id=flask.g.request_id,
+                         user_id=headers.get('X-User-Id', ANONYMOUS),
+                         project_id=headers.get('X-Project-Id', ANONYMOUS),
+                         params=jsonutils.dumps(params),
+                         deadline=deadline)
+    item = task_item_obj.TaskItem(uuid=uuidutils.generate_uuid(),
+                                  action=action,
+                                  state=task_item_obj.PENDING)
+    task.create_with_items([item])
+    _publish(task)
+    return task
+
+
+def accepted(task):
+    """Return a 202 response linking to the task doing the work."""
+    response = flask.jsonify(task=generate_task_data(task))
+    response.status_code = 202
+    response.headers['location'] = os.path.join(
+        flask.request.url_root, task_url(task))
+    return response
+
+
+def _deadline(data):
+    """Pop the optional timeout from a request body, returning a deadline.
+
+    The timeout is the number of seconds the caller is willing to wait
+    for the task to start.
+    """
+    timeout = data.pop('timeout', None)
+    if timeout is None:
+        return None
+    valid = isinstance(timeout, six.integer_types)
+    if not valid or isinstance(timeout, bool) or timeout <= 0:
+        raise httpexceptor.HTTP400('timeout must be a positive integer '
+                                   'number of seconds.')
+    return timeutils.utcnow() + datetime.timedelta(seconds=timeout)
 
 
 # TODO(cdent): This should take a decorator like accept (above), but
 # for the content-type header.
 def server_boot():
-    data = flask.request.get_json()
-    # TODO(cdent): Call the task workflow here and return a link to the task
-    task_return = data
-    return flask.jsonify(task_return)
+    data = flask.request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise httpexceptor.HTTP400('Request body must be a JSON object.')
+    if not flask.current_app.config['ENAMEL_SERVER_BOOT']:
+        # A task no action can run would be reported complete without a
+        # server being booted.
+        raise errors.HTTP501('Booting servers is not implemented.')
+    deadline = _deadline(data)
+    return accepted(create_task(BOOT_ACTION, data, deadline=deadline))
+
+
+def _limit():
+    max_limit = flask.current_app.config['ENAMEL_MAX_LIMIT']
+    value = flask.request.args.get('limit')
+    if value is None:
+        return max_limit
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise httpexceptor.HTTP400('limit must be a positive integer.')
+    return min(limit, max_limit)
+
+
+def _restricted_project():
+    """Return the only project whose tasks the caller may see, if any."""
+    project_id = flask.request.headers.get('X-Project-Id')
+    if project_id is None:
+        # Authentication is off.
+        return None
+    roles = flask.request.headers.get('X-Roles', '').split(',')
+    if ADMIN_ROLE in [role.strip() for role in roles]:
+        return None
+    return project_id
+
+
+def _project_ids():
+    """Return the projects whose tasks the caller asks for and may see."""
+    requested = flask.request.args.getlist('project_id')
+    project_id = _restricted_project()
+    if project_id is None:
+        return requested
+    if any(requested_id != project_id for requested_id in requested):
+        raise httpexceptor.HTTP403(
+            'Only the tasks of project %s may be listed.' % project_id)
+    return [project_id]
+
+
+def _next_page_url(marker):
+    args = flask.request.args.to_dict(flat=False)
+    args['marker'] = [marker]
+    return '%s?%s' % (flask.request.base_url,
+                      urlparse.urlencode(args, doseq=True))
+
+
+@decorators.accept()
+def task_list():
+    args = flask.request.args
+    limit = _limit()
+    try:
+        # One task more than the page tells whether there
+        # is a next page.
+        tasks = task_obj.TaskList.get_page(
+            limit + 1, marker=args.get('marker'),
+            states=args.getlist('state'), actions=args.getlist('action'),
+            project_ids=_project_ids())
+    except obj_exception.MarkerNotFound as exc:
+        raise httpexceptor.HTTP400(exc.format_message())
+    data = {'tasks': [generate_task_data(task) for task in tasks[:limit]]}
+    if len(tasks) > limit:
+        data['links'] = [{'rel': 'next',
+                          'href': _next_page_url(tasks[limit - 1].uuid)}]
+    return flask.jsonify(data)
+
+
+def _etag(version):
+    return hashlib.sha1(version.encode('utf-8')).hexdigest()
+
+
+def generate_task_item_data(item):
+    return {
+        'uuid': item.uuid,
+        'action': item.action,
+        'state': item.state,
+    }
+
+
+def _get_version(uuid):
+    """Return the version of a task the caller may see."""
+    try:
+        project_id, version = task_obj.Task.get_version(uuid)
+    except obj_exception.TaskNotFound as exc:
+        raise httpexceptor.HTTP404(exc.format_message())
+    restricted = _restricted_project()
+    if restricted is not None and restricted != project_id:
+        # Other projects are not told the task exists.
+        raise httpexceptor.HTTP404('Task %s could not be found.' % uuid)
+    return version
+
+
+def _get_task_data(uuid):
+    task = task_obj.Task.get_by_uuid(uuid)
+    items = task_item_obj.TaskItemList.get_by_task_id(task.id)
+    data = generate_task_data(task)
+    data['items'] = [generate_task_item_data(item) for item in items]
+    return data
+
+
+def _wait():
+    value = flask.request.args.get('wait')
+    if value is None:
+        return 0
+    try:
+        wait = int(value)
+    except ValueError:
+        wait = -1
+    if wait < 0:
+        raise httpexceptor.HTTP400('wait must be a number of seconds.')
+    return min(wait, flask.current_app.config['ENAMEL_MAX_WAIT'])
+
+
+@decorators.accept()
+def task_get(uuid):
+    version = _get_version(uuid)
+    etag = _etag(version)
+    not_modified = flask.request.if_none_match.contains_weak(etag)
+    wait = _wait()
+    if not_modified and wait:
+        # A long-poll waits for the task to change
+        # without querying the database for itself.
+        notifier = flask.current_app.config['ENAMEL_NOTIFIER']
+        new_version = notifier.wait(uuid, version, wait)
+        if new_version is not None:
+            etag = _etag(new_version)
+            not_modified = False
+    # A poll for a task that did not change is answered
+    # from its version alone, without loading it.
+    if not_modified:
+        response = flask.Response(status=304)
+    else:
+        response = flask.jsonify(task=_get_task_data(uuid))
+    response.set_etag(etag)
+    response.headers['cache-control'] = 'no-cache'
+    return response
+
+
+def _event(etag, data):
+    return 'id: %s\nevent: task\ndata: %s\n\n' % (
+        etag, jsonutils.dumps(data))
+
+
+def _task_event_stream(uuid, version, send):
+    notifier = flask.current_app.config['ENAMEL_NOTIFIER']
+    keepalive = flask.current_app.config['ENAMEL_EVENT_KEEPALIVE']
+    while True:
+        data = _get_task_data(uuid)
+        if send:
+            yield _event(_etag(version), data)
+        if data['state'] in FINAL_STATES:
+            return
+        send = True
+        new_version = notifier.wait(uuid, version, keepalive)
+        while new_version is None:
+            yield ': keepalive\n\n'
+            new_version = notifier.wait(uuid, version, keepalive)
+        version = new_version
+
+
+@decorators.accept(types=[EVENT_STREAM])
+def task_events(uuid):
+    """Stream the versions of a task as server-sent events.
+
+    An event is sent for the task as it is, then for each new version
+    of it, until it reaches a final state. A client reconnecting with
+    the Last-Event-ID of the task's current version is only sent what
+    follows.
+    """
+    version = _get_version(uuid)
+    send = flask.request.headers.get('Last-Event-ID') != _etag(version)
+    response = flask.Response(
+        flask.stream_with_context(_task_event_stream(uuid, version, send)),
+        mimetype=EVENT_STREAM)
+    response.headers['cache-control'] = 'no-cache'
+    return response
@@ -0,0 +1,122 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Waking the requests that wait for tasks to change.
+
+Long-polls and event streams do not each poll the database for their
+task. They wait on the API process's ChangeNotifier, whose thread reads
+the versions of all the tasks being waited for in one query per
+interval and wakes the requests whose task moved to a new version. The
+number of queries depends on the interval, not on how many clients
+wait.
+"""
+
+import threading
+import time
+
+from oslo_log import log as logging
+
+from enamel.objects import task as task_obj
+
+LOG = logging.getLogger(__name__)
+
+# Most tasks whose versions are read in one query.
+BATCH_SIZE = 500
+
+
+class _Watched(object):
+    """A task waited for, and the version the notifier last saw."""
+
+    def __init__(self, lock):
+        self.version = None
+        self.waiters = 0
+        self.changed = threading.Condition(lock)
+
+
+class ChangeNotifier(object):
+    """Wait for tasks to change with one query per interval for all.
+
+    :param interval: seconds between reads of the watched tasks' versions
+    :param get_versions: callable(uuids) returning a dict of task uuid to
+                         (project_id, version)
+    """
+
+    def __init__(self, interval=1.0,
+                 get_versions=task_obj.Task.get_versions):
+        self.interval = interval
+        self._get_versions = get_versions
+        self._lock = threading.Lock()
+        self._watched = {}
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, conf):
+        return cls(interval=conf.api.notify_interval)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def wait(self, uuid, version, timeout):
+        """Wait for a task to move on from a version.
+
+        :returns: the task's new version, or None if it did not change
+                  within timeout seconds
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            watched = self._watched.get(uuid)
+            if watched is None:
+                watched = self._watched[uuid] = _Watched(self._lock)
+            watched.waiters += 1
+            self._start()
+            try:
+                while watched.version is None or watched.version == version:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    watched.changed.wait(remaining)
+                return watched.version
+            finally:
+                watched.waiters -= 1
+                if not watched.waiters:
+                    del self._watched[uuid]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._watched:
+                    # Nothing left to watch; the next wait() starts a
+                    # new thread.
+                    self._thread = None
+                    return
+            self.poll()
+
+    def poll(self):
+        """Read the watched tasks' versions and wake who they concern."""
+        with self._lock:
+            uuids = list(self._watched)
+        for start in range(0, len(uuids), BATCH_SIZE):
+            try:
+                versions = self._get_versions(uuids[start:start + BATCH_SIZE])
+            except Exception:
+                LOG.exception("Unable to read the versions of tasks")
+                return
+            with self._lock:
+                for uuid, (_project_id, version) in versions.items():
+                    watched = self._watched.get(uuid)
+                    if watched is None or watched.version == version:
+                        continue
+                    watched.version = version
+                    watched.changed.notify_all()
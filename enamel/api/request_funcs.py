@@ -34,12 +34,12 @@ def send_request_id(response):
 
 def set_version():
     """A before_request function to set microversion."""
+    negotiator = flask.current_app.config['ENAMEL_VERSION_NEGOTIATOR']
     try:
-        flask.g.request_version = version.extract_version(
-            flask.request.headers)
+        flask.g.request_version = negotiator.negotiate(
+            flask.request.headers.get(version.Version.HEADER))
     except ValueError as exc:
-        flask.g.request_version = version.parse_version_string(
-            version.min_version_string())
+        flask.g.request_version = negotiator.min_version
         raise httpexceptor.HTTP406('unable to use provided version: %s' % exc)
 
 
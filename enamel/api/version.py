@@ -25,6 +25,9 @@ VERSIONS = [
     '0.1',
 ]
 
+# Most distinct version header values whose Version is remembered.
+MAX_CACHED_HEADERS = 256
+
 
 def max_version_string():
     return VERSIONS[-1]
@@ -61,25 +64,32 @@ class Version(collections.namedtuple('Version', 'major minor')):
     Since it is a tuple is automatically comparable.
     """
 
+    __slots__ = ()
+
     HEADER = 'OpenStack-API-Version'
 
-    MIN_VERSION = None
-    MAX_VERSION = None
+    # The parsed bounds of VERSIONS, shared by all versions and keyed by
+    # the strings they were parsed from.
+    _BOUNDS = {}
 
     def __str__(self):
         return '%s.%s' % (self.major, self.minor)
 
+    def _bounds(self):
+        key = (min_version_string(), max_version_string())
+        bounds = self._BOUNDS.get(key)
+        if bounds is None:
+            bounds = self._BOUNDS[key] = (parse_version_string(key[0]),
+                                          parse_version_string(key[1]))
+        return bounds
+
     @property
     def max_version(self):
-        if not self.MAX_VERSION:
-            self.MAX_VERSION = parse_version_string(max_version_string())
-        return self.MAX_VERSION
+        return self._bounds()[1]
 
     @property
     def min_version(self):
-        if not self.MIN_VERSION:
-            self.MIN_VERSION = parse_version_string(min_version_string())
-        return self.MIN_VERSION
+        return self._bounds()[0]
 
     def matches(self, min_version=None, max_version=None):
         if min_version is None:
@@ -89,20 +99,77 @@ class Version(collections.namedtuple('Version', 'major minor')):
         return min_version <= self <= max_version
 
 
-def extract_version(headers):
+def allowed_versions():
+    """Return the set of the Versions in VERSIONS."""
+    return frozenset(parse_version_string(version_string)
+                     for version_string in VERSIONS)
+
+
+def extract_version(headers, allowed=None):
     """Extract the microversion from Version.HEADER
 
     There may be multiple headers and some which don't match our
     service.
+
+    :param allowed: set of the Versions that may be used; by default,
+                    those in VERSIONS
     """
     found_version = microversion_parse.get_version(headers,
                                                    service_type=SERVICE_TYPE)
 
     version_string = found_version or min_version_string()
     request_version = parse_version_string(version_string)
-    # We need a version that is in VERSION and within MIX and MAX.
+    # We need a version that is in VERSION, and so within MIN and MAX.
     # This gives us the option to administratively disable a
     # version if we really need to.
-    if (str(request_version) in VERSIONS and request_version.matches()):
+    if allowed is None:
+        allowed = allowed_versions()
+    if request_version in allowed:
         return request_version
     raise ValueError('Unacceptable version header: %s' % version_string)
+
+
+class VersionNegotiator(object):
+    """Turn the version header values of requests into Versions.
+
+    The versions allowed are those of VERSIONS when the negotiator is
+    made. The outcome for each distinct header value is remembered, so
+    that the requests of a client, which all send the same value, only
+    have it parsed once.
+
+    :param max_cached: most header values whose outcome is remembered;
+                       those beyond are parsed on every request
+    """
+
+    def __init__(self, max_cached=MAX_CACHED_HEADERS):
+        self.max_cached = max_cached
+        self.allowed = allowed_versions()
+        self.min_version = parse_version_string(min_version_string())
+        self.max_version = parse_version_string(max_version_string())
+        self._outcomes = {}
+
+    def _resolve(self, value):
+        headers = {} if value is None else {Version.HEADER: value}
+        try:
+            return extract_version(headers, self.allowed), None
+        except ValueError as exc:
+            return None, str(exc)
+
+    def negotiate(self, value):
+        """Return the Version a version header value asks for.
+
+        :param value: the value of Version.HEADER, or None if the request
+                      did not send it
+        :raises: ValueError if the version is not one allowed
+        """
+        outcome = self._outcomes.get(value)
+        if outcome is None:
+            outcome = self._resolve(value)
+            # Clients choose the values, so only so many
+            # are remembered.
+            if len(self._outcomes) < self.max_cached:
+                self._outcomes[value] = outcome
+        request_version, error = outcome
+        if error is not None:
+            raise ValueError(error)
+        return request_version
@@ -0,0 +1,243 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Caching of image and flavor metadata shared by the workers of a host.
+
+Booting a server needs its image and flavor, which rarely change. Rather
+than asking glance and nova for them in every task, workers look them up
+with get_image() and get_flavor(), which keep what they fetch for a
+while in a SharedCache.
+
+Like the rate limiter's buckets, the cache lives in shared memory created
+by the task processor before it starts its workers, so what one worker
+fetched spares the others the round trip, and an entry invalidated by one
+is gone for all. The cache has a fixed number of entries of a fixed most
+size each; an entry goes to one of a few slots picked by the hash of its
+key, evicting the least recently used of them when all are taken.
+Entries are kept per project, since an image or flavor one project sees
+may be hidden from another.
+"""
+
+import multiprocessing
+import time
+import zlib
+
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+
+from enamel import clients
+from enamel import retry
+
+LOG = logging.getLogger(__name__)
+
+IMAGE = 'image'
+FLAVOR = 'flavor'
+
+# Number of slots an entry may go to.
+PROBE = 8
+
+# Slots of an entry's state in the shared array. The key and resource
+# are hashes of the entry's key and of what it describes, 0 marking a
+# free entry.
+_KEY, _RESOURCE, _EXPIRES, _USED, _LENGTH = range(5)
+_SLOTS = 5
+
+# Slots of the shared hit and miss counts.
+_HITS, _MISSES = range(2)
+
+_CACHE = None
+_TTLS = {}
+
+
+def _hash(value):
+    return float((zlib.crc32(value.encode('utf-8')) & 0xffffffff) + 1)
+
+
+class SharedCache(object):
+    """A cache shared by the processes forked after creating it.
+
+    Values are anything jsonutils can encode in at most max_entry_size
+    bytes; larger ones are not cached.
+
+    :param entries: most entries kept
+    :param max_entry_size: most bytes of an encoded entry
+    """
+
+    def __init__(self, entries=256, max_entry_size=16384):
+        self.entries = entries
+        self.max_entry_size = max_entry_size
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray('d', _SLOTS * entries)
+        self._data = multiprocessing.RawArray('c', max_entry_size * entries)
+        self._stats = multiprocessing.RawArray('d', 2)
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf['metadata-cache']
+        return cls(entries=options.entries,
+                   max_entry_size=options.max_entry_size)
+
+    def _window(self, key_hash):
+        start = int(key_hash) % self.entries
+        for offset in range(min(PROBE, self.entries)):
+            yield ((start + offset) % self.entries) * _SLOTS
+
+    def _find(self, key_hash, now):
+        for base in self._window(key_hash):
+            if self._state[base + _KEY] != key_hash:
+                continue
+            if self._state[base + _EXPIRES] > now:
+                return base
+        return None
+
+    def get(self, key):
+        """Return the value cached for key, or None."""
+        key_hash = _hash(key)
+        now = time.time()
+        with self._lock:
+            base = self._find(key_hash, now)
+            if base is None:
+                self._stats[_MISSES] += 1
+                return None
+            self._state[base + _USED] = now
+            offset = base // _SLOTS * self.max_entry_size
+            length = int(self._state[base + _LENGTH])
+            data = self._data[offset:offset + length]
+        stored_key, value = jsonutils.loads(data.decode('utf-8'))
+        # Another key with the same hash is a miss.
+        hit = stored_key == key
+        with self._lock:
+            self._stats[_HITS if hit else _MISSES] += 1
+        if not hit:
+            return None
+        return value
+
+    def set(self, key, value, ttl, resource=None):
+        """Cache value for key for ttl seconds.
+
+        :param resource: what the value describes, for invalidate(); by
+                         default, key
+        """
+        data = jsonutils.dumps([key, value]).encode('utf-8')
+        if len(data) > self.max_entry_size:
+            LOG.debug("Not caching %(key)s, %(size)d bytes is too large",
+                      {'key': key, 'size': len(data)})
+            return
+        key_hash = _hash(key)
+        now = time.time()
+        with self._lock:
+            chosen = chosen_used = None
+            for base in self._window(key_hash):
+                if self._state[base + _KEY] == key_hash:
+                    chosen = base
+                    break
+                if self._state[base + _EXPIRES] <= now:
+                    used = -1
+                else:
+                    used = self._state[base + _USED]
+                if chosen is None or used < chosen_used:
+                    chosen, chosen_used = base, used
+            state = self._state
+            state[chosen + _KEY] = key_hash
+            state[chosen + _RESOURCE] = _hash(resource or key)
+            state[chosen + _EXPIRES] = now + ttl
+            state[chosen + _USED] = now
+            state[chosen + _LENGTH] = len(data)
+            offset = chosen // _SLOTS * self.max_entry_size
+            self._data[offset:offset + len(data)] = data
+
+    def invalidate(self, resource):
+        """Drop the entries describing resource, whatever their key.
+
+        :returns: the number of entries dropped
+        """
+        resource_hash = _hash(resource)
+        dropped = 0
+        with self._lock:
+            for i in range(self.entries):
+                base = i * _SLOTS
+                if self._state[base + _RESOURCE] == resource_hash:
+                    self._state[base + _KEY] = 0
+                    self._state[base + _RESOURCE] = 0
+                    self._state[base + _EXPIRES] = 0
+                    dropped += 1
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            for i in range(len(self._state)):
+                self._state[i] = 0
+
+    def stats(self):
+        """Return the numbers of hits and misses so far."""
+        with self._lock:
+            return int(self._stats[_HITS]), int(self._stats[_MISSES])
+
+
+def init(conf, cache):
+    """Make this process cache metadata in cache for conf's TTLs."""
+    global _CACHE, _TTLS
+    options = conf['metadata-cache']
+    _CACHE = cache
+    _TTLS = {IMAGE: options.image_ttl, FLAVOR: options.flavor_ttl}
+
+
+def _resource(kind, region_name, resource_id):
+    return '%s:%s:%s' % (kind, region_name or '', resource_id)
+
+
+def _cached(kind, credentials, region_name, resource_id, load):
+    cache = _CACHE
+    ttl = _TTLS.get(kind)
+    if cache is None or not ttl:
+        return load(credentials, region_name, resource_id)
+    resource = _resource(kind, region_name, resource_id)
+    scope = credentials.get('project_id') or credentials['handle']
+    key = '%s:%s' % (resource, scope)
+    value = cache.get(key)
+    if value is None:
+        value = load(credentials, region_name, resource_id)
+        cache.set(key, value, ttl, resource=resource)
+    return value
+
+
+def _load_image(credentials, region_name, image_id):
+    glance = clients.client('image', credentials, region_name)
+    return dict(retry.call('image', 'show', glance.images.get, image_id))
+
+
+def _load_flavor(credentials, region_name, flavor_id):
+    nova = clients.client('compute', credentials, region_name)
+    return retry.call('compute', 'show', nova.flavors.get,
+                      flavor_id).to_dict()
+
+
+def get_image(credentials, region_name, image_id):
+    """Return the glance metadata of an image as a dict."""
+    return _cached(IMAGE, credentials, region_name, image_id, _load_image)
+
+
+def get_flavor(credentials, region_name, flavor_id):
+    """Return a nova flavor as a dict."""
+    return _cached(FLAVOR, credentials, region_name, flavor_id,
+                   _load_flavor)
+
+
+def invalidate_image(region_name, image_id):
+    """Forget an image, say once it was found changed or deleted."""
+    if _CACHE is not None:
+        _CACHE.invalidate(_resource(IMAGE, region_name, image_id))
+
+
+def invalidate_flavor(region_name, flavor_id):
+    """Forget a flavor, say once it was found changed or deleted."""
+    if _CACHE is not None:
+        _CACHE.invalidate(_resource(FLAVOR, region_name, flavor_id))
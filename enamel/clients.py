@@ -0,0 +1,187 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Clients of the OpenStack services that task items call.
+
+Each worker process keeps a pool of authenticated keystone sessions, one
+per credential handle and region, along with the service clients built
+on them. A session holds on to its token and service catalog and its
+HTTP connections are kept alive, so authenticating, looking up
+endpoints and TLS handshakes happen once per user rather than once per
+task item. The least recently used sessions are closed once the pool is
+full.
+"""
+
+import collections
+import threading
+
+from cinderclient import client as cinder_client
+from glanceclient import client as glance_client
+from keystoneauth1 import loading
+from keystoneauth1 import session as ks_session
+from neutronclient.v2_0 import client as neutron_client
+from novaclient import client as nova_client
+import requests
+from requests import adapters
+
+COMPUTE_API_VERSION = '2.1'
+IMAGE_API_VERSION = '2'
+VOLUME_API_VERSION = '3'
+
+
+def _compute(session, region_name):
+    return nova_client.Client(COMPUTE_API_VERSION, session=session,
+                              region_name=region_name)
+
+
+def _image(session, region_name):
+    return glance_client.Client(IMAGE_API_VERSION, session=session,
+                                region_name=region_name)
+
+
+def _network(session, region_name):
+    return neutron_client.Client(session=session, region_name=region_name)
+
+
+def _volume(session, region_name):
+    return cinder_client.Client(VOLUME_API_VERSION, session=session,
+                                region_name=region_name)
+
+
+# How to build the client of each service type.
+CLIENTS = {
+    'compute': _compute,
+    'image': _image,
+    'network': _network,
+    'volume': _volume,
+}
+
+_POOL = None
+
+
+def load_auth(credentials):
+    """Return the keystoneauth plugin for a dict of credentials.
+
+    The dict names the plugin with 'auth_type' (v3token if missing) and
+    holds the plugin's options, such as auth_url, token and project_id.
+    Its 'handle' entry is ignored.
+    """
+    options = dict(credentials)
+    options.pop('handle', None)
+    loader = loading.get_plugin_loader(options.pop('auth_type', 'v3token'))
+    return loader.load_from_options(**options)
+
+
+class _Entry(object):
+
+    def __init__(self, session):
+        self.session = session
+        self.clients = {}
+
+
+class ClientPool(object):
+    """Authenticated sessions and service clients, kept for reuse.
+
+    :param max_sessions: most sessions kept open; the least recently
+                         used one is closed to make room for a new one
+    :param connections: most HTTP connections a session keeps alive to
+                        each host
+    :param verify: whether to verify TLS certificates, or a CA bundle
+    :param timeout: seconds a request to a service may take
+    """
+
+    def __init__(self, max_sessions=64, connections=10, verify=True,
+                 timeout=None):
+        self.max_sessions = max_sessions
+        self.connections = connections
+        self.verify = verify
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        # Version discovery documents are the same for every user.
+        self._discovery_cache = {}
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf.clients
+        verify = options.cafile or not options.insecure
+        return cls(max_sessions=options.max_sessions,
+                   connections=options.connections,
+                   verify=verify,
+                   timeout=options.timeout)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _new_session(self, credentials):
+        http = requests.Session()
+        adapter = adapters.HTTPAdapter(pool_maxsize=self.connections)
+        http.mount('https://', adapter)
+        http.mount('http://', adapter)
+        return ks_session.Session(auth=load_auth(credentials), session=http,
+                                  verify=self.verify, timeout=self.timeout,
+                                  discovery_cache=self._discovery_cache)
+
+    def _entry(self, credentials, region_name):
+        key = (credentials['handle'], region_name)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            entry = _Entry(self._new_session(credentials))
+            while len(self._entries) >= self.max_sessions:
+                _key, evicted = self._entries.popitem(last=False)
+                evicted.session.session.close()
+        self._entries[key] = entry
+        return entry
+
+    def session(self, credentials, region_name=None):
+        """Return the session for the credentials in the region.
+
+        :param credentials: dict of the options of a keystoneauth plugin,
+                            with a 'handle' entry naming them; credentials
+                            with the same handle share a session
+        """
+        with self._lock:
+            return self._entry(credentials, region_name).session
+
+    def client(self, service, credentials, region_name=None):
+        """Return the client of a service type for the credentials."""
+        with self._lock:
+            entry = self._entry(credentials, region_name)
+            client = entry.clients.get(service)
+            if client is None:
+                client = CLIENTS[service](entry.session, region_name)
+                entry.clients[service] = client
+            return client
+
+    def invalidate(self, handle):
+        """Close the sessions of a handle, say once its token is revoked."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == handle]:
+                self._entries.pop(key).session.session.close()
+
+    def close(self):
+        with self._lock:
+            for entry in self._entries.values():
+                entry.session.session.close()
+            self._entries.clear()
+
+
+def init(conf):
+    """Start this process off with an empty pool."""
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+    _POOL = ClientPool.from_config(conf)
+
+
+def client(service, credentials, region_name=None):
+    """Return a pooled client of a service type for the credentials."""
+    return _POOL.client(service, credentials, region_name)
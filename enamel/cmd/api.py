@@ -18,11 +18,16 @@ import flask
 import httpexceptor
 from keystonemiddleware import auth_token
 from oslo_config import cfg
+from oslo_db import options as db_options
 from oslo_log import log as logging
 
 from enamel.api import errors
 from enamel.api import handlers
+from enamel.api import notifier
 from enamel.api import request_funcs
+from enamel.api import version
+from enamel.db import utils as db_utils
+from enamel import dispatch
 from enamel import objects
 from enamel import opts
 
@@ -31,10 +36,21 @@ LOG = logging.getLogger(__name__)
 
 
 def create_app(conf):
+    objects.register_all()
+    db_utils.init(conf)
     app = flask.Flask(__name__)
+    app.config['ENAMEL_VERSION_NEGOTIATOR'] = version.VersionNegotiator()
+    app.config['ENAMEL_TRANSPORT'] = dispatch.get_transport(conf)
+    app.config['ENAMEL_MAX_LIMIT'] = conf.api.max_limit
+    app.config['ENAMEL_SERVER_BOOT'] = conf.api.server_boot
+    app.config['ENAMEL_MAX_WAIT'] = conf.api.max_wait
+    app.config['ENAMEL_EVENT_KEEPALIVE'] = conf.api.event_keepalive
+    app.config['ENAMEL_NOTIFIER'] = notifier.ChangeNotifier.from_config(conf)
     _load_error_handlers(app)
     _load_request_handlers(app)
     _load_routes(app)
+    app.config['ENAMEL_ROOT_DOCUMENT'] = handlers.RootDocument(
+        handlers.find_resources(app))
     # Here we work around keystone middleware's desire to be brought
     # into being via paste. Since we don't want to use paste we need
     # to tell the middleware that our keystone config is located in
@@ -53,6 +69,7 @@ def prepare_service(args=None):
         args = []
     conf = cfg.ConfigOpts()
     logging.register_options(conf)
+    db_options.set_defaults(conf)
     conf(args, project='enamel')
     logging.setup(conf, 'enamel')
     for group, options in opts.list_opts():
@@ -63,7 +80,6 @@ def prepare_service(args=None):
 
 
 def main(args=sys.argv[1:]):
-    objects.register_all()
     conf = prepare_service(args)
 
     app = create_app(conf)
@@ -87,6 +103,12 @@ def _load_routes(app):
     app.add_url_rule('/', 'home', handlers.home, methods=['GET'])
     app.add_url_rule('/servers', 'server_boot', handlers.server_boot,
                      methods=['POST'])
+    app.add_url_rule('/tasks', 'task_list', handlers.task_list,
+                     methods=['GET'])
+    app.add_url_rule('/tasks/<uuid>', 'task_get', handlers.task_get,
+                     methods=['GET'])
+    app.add_url_rule('/tasks/<uuid>/events', 'task_events',
+                     handlers.task_events, methods=['GET'])
 
 
 def _load_request_handlers(app):
@@ -19,6 +19,7 @@ import sys
 import daemon
 import extras
 from oslo_config import cfg
+from oslo_db import options as db_options
 from oslo_log import log as logging
 
 # NOTE(jaypipes): This code taken from Zuul
@@ -26,6 +27,8 @@ from oslo_log import log as logging
 # instead it depends on lockfile-0.9.1 which uses pidfile.
 pid_file_module = extras.try_imports(['daemon.pidlockfile', 'daemon.pidfile'])
 
+from enamel.db import utils as db_utils
+from enamel import objects
 from enamel import opts
 import enamel.task_processor
 
@@ -56,7 +59,7 @@ class TaskProcessorApp(object):
         # USR1 is usually reserved for special user initiated
         # actions like dumping a guru meditation report.
         signal.signal(signal.SIGUSR1, self.exit_handler)
-        while True:
+        while self.server.is_running():
             try:
                 signal.pause()
             except KeyboardInterrupt:
@@ -71,6 +74,7 @@ def setup(args=None):
         args = []
     conf = cfg.ConfigOpts()
     logging.register_options(conf)
+    db_options.set_defaults(conf)
     conf(args, project='enamel')
     logging.setup(conf, 'enamel')
     for group, options in opts.list_opts():
@@ -81,11 +85,13 @@ def setup(args=None):
 
 
 def main():
+    objects.register_all()
     conf = setup()
+    db_utils.init(conf)
     app = TaskProcessorApp(conf)
     args = app.parse_arguments()
 
-    pid_path = os.path.expanduser(conf.task_processor.pidfile)
+    pid_path = os.path.expanduser(conf['task-processor'].pidfile)
     pid = pid_file_module.TimeoutPIDLockFile(pid_path, 10)
 
     if args.no_daemon:
@@ -0,0 +1,144 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Coalescing of like tasks into batches run together.
+
+Many small server boots of one project, all asking for the same flavor,
+image and so on, are cheaper for nova as a single boot with a larger
+min_count and max_count. The task processor holds tasks of the actions
+configured for coalescing for a short window; tasks that arrive within
+it and only differ in the fields listed in PER_TASK_PARAMS are handed to
+one worker as a batch, which runs their items as one flow and then
+splits the results back onto each task.
+
+A batch is worth starting as long as one of its tasks is, so its
+deadline is the latest of its tasks' deadlines, or none if one of them
+has none. The worker leaves out the tasks already overdue when it runs
+the batch.
+"""
+
+import collections
+import time
+
+from oslo_serialization import jsonutils
+
+# Task params that may differ between the tasks of a batch.
+PER_TASK_PARAMS = ('name', 'min_count', 'max_count')
+
+
+def batch_key(task):
+    """Return what tasks must share to be run in one batch with task."""
+    params = jsonutils.loads(task.params) if task.params else {}
+    for name in PER_TASK_PARAMS:
+        params.pop(name, None)
+    return (task.action, task.project_id,
+            jsonutils.dumps(params, sort_keys=True))
+
+
+def merge_params(tasks):
+    """Return the params of a batch of tasks run as one.
+
+    The counts of servers asked for by each task are added up.
+    """
+    merged = {}
+    min_count = max_count = 0
+    for task in tasks:
+        params = jsonutils.loads(task.params) if task.params else {}
+        min_count += int(params.get('min_count', 1))
+        max_count += int(params.get('max_count', params.get('min_count', 1)))
+        for name, value in params.items():
+            merged.setdefault(name, value)
+    merged.pop('name', None)
+    merged['min_count'] = min_count
+    merged['max_count'] = max_count
+    return merged
+
+
+class _Batch(object):
+
+    def __init__(self, action, project_id, opened_at):
+        self.action = action
+        self.project_id = project_id
+        self.opened_at = opened_at
+        self.uuids = []
+        self.deadline = None
+        self._open_ended = False
+
+    def add(self, task):
+        self.uuids.append(task.uuid)
+        deadline = task.deadline_time()
+        if deadline is None:
+            self._open_ended = True
+            self.deadline = None
+        elif not self._open_ended:
+            self.deadline = max(self.deadline or deadline, deadline)
+
+
+class Coalescer(object):
+    """Group like tasks arriving within a window into batches.
+
+    :param window: seconds a batch stays open for more tasks after its
+                   first one arrived
+    :param max_batch: number of tasks closing a batch before its window
+                      is over
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self._batches = collections.OrderedDict()
+        self._full = []
+
+    def __len__(self):
+        """Return the number of batches not yet handed out."""
+        return len(self._batches) + len(self._full)
+
+    def _all(self):
+        return list(self._batches.values()) + self._full
+
+    def add(self, task):
+        key = batch_key(task)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = _Batch(task.action, task.project_id, time.time())
+            self._batches[key] = batch
+        batch.add(task)
+        if len(batch.uuids) >= self.max_batch:
+            del self._batches[key]
+            self._full.append(batch)
+
+    def ready(self):
+        """Remove and return the batches closed by now.
+
+        :returns: list of (action, uuids, project_id, deadline), where
+                  uuids is a tuple of the uuids of the batch's tasks and
+                  deadline is the batch's in seconds since the epoch
+        """
+        now = time.time()
+        closed, self._full = self._full, []
+        for key, batch in list(self._batches.items()):
+            if now - batch.opened_at >= self.window:
+                del self._batches[key]
+                closed.append(batch)
+        return [(batch.action, tuple(batch.uuids), batch.project_id,
+                 batch.deadline)
+                for batch in closed]
+
+    def depth_by_action(self):
+        """Return the number of tasks in open batches by action."""
+        depths = collections.Counter()
+        for batch in self._all():
+            depths[batch.action] += len(batch.uuids)
+        return depths
+
+    def uuids(self):
+        """Return the uuids of all tasks in open batches."""
+        return set(uuid for batch in self._all() for uuid in batch.uuids)
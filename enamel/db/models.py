@@ -16,7 +16,9 @@ from oslo_utils import timeutils
 from sqlalchemy import Column
 from sqlalchemy import DateTime
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import Text
@@ -31,6 +33,20 @@ Base = declarative_base(cls=ModelBase)
 
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('tasks_state_id_idx', 'state', 'id'),
+        Index('tasks_state_lease_expires_at_idx', 'state',
+              'lease_expires_at'),
+        Index('tasks_state_deadline_idx', 'state', 'deadline'),
+        Index('tasks_uuid_idx', 'uuid', unique=True),
+        Index('tasks_created_at_id_idx', 'created_at', 'id'),
+        Index('tasks_state_created_at_id_idx', 'state', 'created_at', 'id'),
+        Index('tasks_action_created_at_id_idx', 'action', 'created_at',
+              'id'),
+        Index('tasks_project_id_created_at_id_idx', 'project_id',
+              'created_at', 'id'),
+        ModelBase.__table_args__,
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     uuid = Column(String(36), nullable=False)
@@ -40,6 +56,9 @@ class Task(Base):
     user_id = Column(String(255), nullable=False)
     project_id = Column(String(255), nullable=False)
     params = Column(Text, nullable=False)
+    owner = Column(String(255))
+    lease_expires_at = Column(DateTime)
+    deadline = Column(DateTime)
     created_at = Column(DateTime, default=timeutils.utcnow)
     updated_at = Column(DateTime, default=timeutils.utcnow,
                         onupdate=timeutils.utcnow)
@@ -54,7 +73,30 @@ class TaskItem(Base):
     action = Column(String(255), nullable=False)
     state = Column(String(255), nullable=False)
     task_id = Column(Integer, ForeignKey('tasks.id'))
+    result = Column(Text)
+    started_at = Column(DateTime)
+    queue_wait = Column(Float)
     created_at = Column(DateTime, default=timeutils.utcnow)
     updated_at = Column(DateTime, default=timeutils.utcnow,
                         onupdate=timeutils.utcnow)
     ended_at = Column(DateTime)
+
+
+class PooledPort(Base):
+    """A neutron port created ahead of the boot it is handed to."""
+    __tablename__ = 'pooled_ports'
+    __table_args__ = (
+        Index('pooled_ports_project_id_network_id_idx', 'project_id',
+              'network_id'),
+        Index('pooled_ports_taken_at_idx', 'taken_at'),
+        ModelBase.__table_args__,
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    port_id = Column(String(36), nullable=False)
+    project_id = Column(String(255), nullable=False)
+    network_id = Column(String(36), nullable=False)
+    taken_at = Column(DateTime)
+    created_at = Column(DateTime, default=timeutils.utcnow)
+    updated_at = Column(DateTime, default=timeutils.utcnow,
+                        onupdate=timeutils.utcnow)
@@ -11,14 +11,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
 from oslo_db.sqlalchemy import session
+import sqlalchemy
 
 _FACADE = None
 
+_QUERY_LOCK = threading.Lock()
+_QUERY_COUNT = [0]
+
+
+def _count_query(*args, **kwargs):
+    with _QUERY_LOCK:
+        _QUERY_COUNT[0] += 1
+
 
 def init(conf):
     global _FACADE
     _FACADE = session.EngineFacade.from_config(conf)
+    sqlalchemy.event.listen(_FACADE.get_engine(), 'before_cursor_execute',
+                            _count_query)
+
+
+def query_count():
+    """Return the number of statements this process sent the database."""
+    return _QUERY_COUNT[0]
 
 
 def get_session(**kwargs):
@@ -27,3 +45,9 @@ def get_session(**kwargs):
 
 def get_engine():
     return _FACADE.get_engine()
+
+
+def dispose():
+    """Drop pooled connections, such as ones inherited over a fork."""
+    if _FACADE is not None:
+        _FACADE.get_engine().dispose()
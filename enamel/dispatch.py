@@ -0,0 +1,233 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Push dispatch of new tasks to task processors.
+
+Tasks are published as serialized Task objects to a topic named after
+the task's action. Task processors consume the topics they serve and
+claim the announced tasks straight away instead of waiting to find them
+when they next poll the tasks table.
+
+The database stays the source of truth: a message that is lost, or
+that no one is listening for, only means the task is found by the next
+poll instead.
+"""
+
+import errno
+import fcntl
+import os
+import socket
+import threading
+
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from six.moves import queue
+
+from enamel import exception
+from enamel.objects import task as task_obj
+
+LOG = logging.getLogger(__name__)
+
+# Topic consumed by task processors that serve every action, and
+# published to when no processor serves a task's own topic.
+DEFAULT_TOPIC = 'default'
+
+MAX_MESSAGE_SIZE = 65536
+
+
+class Transport(object):
+    """Carry messages from publishers to consumers of a topic."""
+
+    def __init__(self, conf=None):
+        self.conf = conf
+
+    def publish(self, topic, message):
+        """Send message to topic, returning True if it was delivered."""
+        raise NotImplementedError()
+
+    def consumer(self, topic):
+        """Return a consumer receiving the messages sent to topic."""
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class Consumer(object):
+
+    def receive(self, timeout=None):
+        """Return the next message, or None if none came within timeout."""
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+_LOCAL_QUEUES = {}
+_LOCAL_LOCK = threading.Lock()
+
+
+class _LocalConsumer(Consumer):
+
+    def __init__(self, topic, messages):
+        self.topic = topic
+        self._messages = messages
+
+    def receive(self, timeout=None):
+        try:
+            if timeout == 0:
+                return self._messages.get_nowait()
+            return self._messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with _LOCAL_LOCK:
+            if _LOCAL_QUEUES.get(self.topic) is self._messages:
+                del _LOCAL_QUEUES[self.topic]
+
+
+class LocalTransport(Transport):
+    """Pass messages between threads of a single process."""
+
+    def publish(self, topic, message):
+        with _LOCAL_LOCK:
+            messages = _LOCAL_QUEUES.get(topic)
+            if messages is None:
+                messages = _LOCAL_QUEUES.get(DEFAULT_TOPIC)
+        if messages is None:
+            return False
+        messages.put(message)
+        return True
+
+    def consumer(self, topic):
+        with _LOCAL_LOCK:
+            messages = _LOCAL_QUEUES.setdefault(topic, queue.Queue())
+        return _LocalConsumer(topic, messages)
+
+
+class _UnixSocketConsumer(Consumer):
+    """Receive the datagrams sent to a topic's socket.
+
+    The consumer holds a lock on a file next to the socket for as long
+    as it is open. Only the lock's holder binds and removes the socket,
+    so a second consumer of the topic on the host is refused instead of
+    taking over the socket, and a socket left behind by a consumer that
+    died is replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._lock_file = open(path + '.lock', 'a')
+        except (IOError, OSError) as exc:
+            raise exception.DispatchSocketError(path=path, reason=exc)
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as exc:
+            self._lock_file.close()
+            if exc.errno in (errno.EACCES, errno.EAGAIN):
+                raise exception.DispatchSocketInUse(path=path)
+            raise exception.DispatchSocketError(path=path, reason=exc)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+            self._sock.bind(path)
+        except (IOError, OSError) as exc:
+            self.close()
+            raise exception.DispatchSocketError(path=path, reason=exc)
+
+    def receive(self, timeout=None):
+        self._sock.settimeout(timeout)
+        try:
+            data = self._sock.recv(MAX_MESSAGE_SIZE)
+        except socket.timeout:
+            return None
+        except socket.error as exc:
+            if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return None
+            raise
+        return data.decode('utf-8')
+
+    def close(self):
+        self._sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        # Another consumer may take the topic from here on.
+        self._lock_file.close()
+
+
+class UnixSocketTransport(Transport):
+    """Send messages as datagrams to Unix sockets on the local host.
+
+    Each consumed topic is a socket named after it in socket_dir.
+    """
+
+    def __init__(self, conf):
+        super(UnixSocketTransport, self).__init__(conf)
+        self.socket_dir = conf.dispatch.socket_dir
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def _path(self, topic):
+        return os.path.join(self.socket_dir, '%s.sock' % topic)
+
+    def publish(self, topic, message):
+        data = message.encode('utf-8')
+        for path in (self._path(topic), self._path(DEFAULT_TOPIC)):
+            try:
+                self._sock.sendto(data, path)
+                return True
+            except socket.error as exc:
+                if exc.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                    LOG.warning("Unable to publish to %(path)s: %(exc)s",
+                                {'path': path, 'exc': exc})
+                    return False
+        return False
+
+    def consumer(self, topic):
+        return _UnixSocketConsumer(self._path(topic))
+
+    def close(self):
+        self._sock.close()
+
+
+TRANSPORTS = {
+    'local': LocalTransport,
+    'unix': UnixSocketTransport,
+}
+
+
+def get_transport(conf):
+    """Return the configured transport, or None if push is disabled."""
+    name = conf.dispatch.transport
+    if not name:
+        return None
+    return TRANSPORTS[name](conf)
+
+
+def publish_task(transport, task):
+    """Announce a newly created task to the processors serving it."""
+    message = jsonutils.dumps(task.obj_to_primitive())
+    if len(message) > MAX_MESSAGE_SIZE:
+        LOG.debug("Task %s is too large to publish, leaving it to be "
+                  "claimed from the database", task.uuid)
+        return False
+    return transport.publish(task.action, message)
+
+
+def decode_task(message):
+    return task_obj.Task.obj_from_primitive(jsonutils.loads(message))
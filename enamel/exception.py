@@ -41,3 +41,37 @@ class EnamelException(Exception):
         # which should be our full VersionedObjectsException message,
         # (see __init__)
         return self.args[0]
+
+
+class UnknownItemAction(EnamelException):
+    msg_fmt = ("No implementation is registered for task item action "
+               "%(action)s.")
+
+
+class ItemUnitsFailed(EnamelException):
+    msg_fmt = "%(count)d units of task item action %(action)s failed."
+
+
+class ServerWaitTimeout(EnamelException):
+    msg_fmt = ("Timed out waiting for server %(server_id)s to become "
+               "%(states)s.")
+
+
+class RateLimited(EnamelException):
+    msg_fmt = ("Timed out waiting for the rate limit to allow a call to "
+               "%(service)s.")
+
+
+class CircuitOpen(EnamelException):
+    msg_fmt = ("Calls to %(endpoint)s keep failing, not making more for "
+               "now.")
+
+
+class DispatchSocketError(EnamelException):
+    msg_fmt = ("Unable to consume dispatched tasks at %(path)s: "
+               "%(reason)s")
+
+
+class DispatchSocketInUse(EnamelException):
+    msg_fmt = ("Another process of this host already consumes dispatched "
+               "tasks at %(path)s.")
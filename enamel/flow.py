@@ -0,0 +1,321 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Execution of a Task's items as a taskflow flow.
+
+Each TaskItem becomes one taskflow task, implemented by the ItemAction
+registered for the item's action. Items are linked into a graph flow by
+what their actions require and provide, so the parallel engine runs an
+item as soon as the items it depends on are done and runs independent
+items at the same time.
+
+Every item is checkpointed as it completes: its state and its output
+are saved together on the TaskItem. When a task is run again, say by
+another worker after the first one died, completed items are not
+repeated; their saved outputs are handed to the items still to run.
+
+A batch of like tasks coalesced by the task processor runs as the flow
+of its first task, with the params of all of them merged. The state and
+output of each item are then saved on the item of the same action of
+every task in the batch.
+
+An item standing for many like units of work, such as each server of a
+boot asking for hundreds, is a WindowedItemAction. It runs its units a
+window at a time and only creates the TaskItem of a unit when the unit
+starts; each unit's result is saved on its own item as soon as it is
+done rather than gathered in memory.
+"""
+
+import threading
+
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+import taskflow.engines
+from taskflow.patterns import graph_flow
+from taskflow import states
+from taskflow import task as tf_task
+from taskflow.types import notifier
+
+from enamel import coalesce
+from enamel import exception
+from enamel import metrics
+from enamel.objects import task_item as task_item_obj
+
+LOG = logging.getLogger(__name__)
+
+ACTIONS = {}
+
+# Actions of the units of windowed items, which are not part of the flow.
+UNIT_ACTIONS = set()
+
+# How taskflow's task states show up in the state of the TaskItem.
+ITEM_STATES = {
+    states.RUNNING: task_item_obj.RUNNING,
+    states.SUCCESS: task_item_obj.COMPLETE,
+    states.FAILURE: task_item_obj.ERROR,
+}
+
+
+def register(action):
+    """Register an ItemAction class as the implementation of an action."""
+    def decorator(cls):
+        ACTIONS[action] = cls
+        if getattr(cls, 'unit_action', None):
+            UNIT_ACTIONS.add(cls.unit_action)
+        return cls
+    return decorator
+
+
+class ItemAction(tf_task.Task):
+    """The taskflow task executing one TaskItem.
+
+    Subclasses implement execute() and declare what it provides with
+    default_provides. The arguments of execute() are what the action
+    requires, either from other items or from the flow's store, which
+    holds the Task as 'task', its decoded params as 'params' and the
+    most units a windowed item may run at once as 'item_window'.
+
+    When a batch of tasks runs together, 'tasks' holds all of them and
+    'params' their merged params. An action whose result is to be split
+    between the tasks sets splits_batch and then returns a list with the
+    result of each task, in the order of 'tasks'.
+
+    Calls to other services go through enamel.retry.call(), which holds
+    them to the rate limits, retries them and fails them fast while the
+    service is down.
+    """
+
+    splits_batch = False
+
+    def __init__(self, item, **kwargs):
+        super(ItemAction, self).__init__(name=item.uuid, **kwargs)
+        self.item = item
+
+
+def _item_running(item, now):
+    item.state = task_item_obj.RUNNING
+    item.started_at = now
+    if item.obj_attr_is_set('created_at') and item.created_at:
+        item.queue_wait = max(0.0, timeutils.delta_seconds(
+            item.created_at, item.started_at))
+
+
+def _record_item(item):
+    metrics.record_item(
+        item.action, item.state,
+        timeutils.delta_seconds(item.started_at, item.ended_at),
+        item.queue_wait if item.obj_attr_is_set('queue_wait') else None)
+
+
+class WindowedItemAction(ItemAction):
+    """An item made of many like units, run a window at a time.
+
+    Subclasses set unit_action to the action of the TaskItems of the
+    units and implement unit_count() and execute_unit(). Units of a
+    task resumed after its worker died are not run again once complete.
+    The item's own result is the number of units run.
+    """
+
+    unit_action = None
+
+    def unit_count(self, params):
+        """Return the number of units the item is made of."""
+        raise NotImplementedError()
+
+    def execute_unit(self, index, params):
+        """Run a unit, returning what to save as its result."""
+        raise NotImplementedError()
+
+    def execute(self, task, params, item_window):
+        return stream_units(task, self.unit_action, self.unit_count(params),
+                            item_window,
+                            lambda index: self.execute_unit(index, params))
+
+
+def _run_unit(item, index, run_unit, failures, slots):
+    try:
+        _item_running(item, timeutils.utcnow())
+        item.save()
+        item.result = jsonutils.dumps(run_unit(index))
+        item.state = task_item_obj.COMPLETE
+    except Exception:
+        LOG.exception("Unit %(index)d of %(action)s failed",
+                      {'index': index, 'action': item.action})
+        item.state = task_item_obj.ERROR
+        failures.append(index)
+    finally:
+        item.ended_at = timeutils.utcnow()
+        try:
+            item.save()
+            _record_item(item)
+        finally:
+            slots.release()
+
+
+def stream_units(task, action, count, window, run_unit):
+    """Run count units of a task, at most window of them at a time.
+
+    Units left unfinished by an earlier run are run again first. No new
+    unit is started once one has failed.
+
+    :param run_unit: callable taking the index of a unit and returning
+                     its result
+    :returns: count
+    :raises: ItemUnitsFailed if any unit failed
+    """
+    slots = threading.Semaphore(window)
+    failures = []
+
+    def start(item, index):
+        thread = threading.Thread(
+            target=_run_unit, args=(item, index, run_unit, failures, slots))
+        thread.daemon = True
+        thread.start()
+
+    unfinished = task_item_obj.TaskItemList.get_by_task_id(
+        task.id, actions=[action],
+        states=[task_item_obj.PENDING, task_item_obj.RUNNING,
+                task_item_obj.ERROR])
+    for item in unfinished:
+        slots.acquire()
+        start(item, task_item_obj.TaskItemList.count_by_task_id(
+            task.id, actions=[action], before_id=item.id))
+    del unfinished
+    created = task_item_obj.TaskItemList.count_by_task_id(
+        task.id, actions=[action])
+    for index in range(created, count):
+        slots.acquire()
+        if failures:
+            slots.release()
+            break
+        item = task_item_obj.TaskItem(uuid=uuidutils.generate_uuid(),
+                                      action=action,
+                                      state=task_item_obj.PENDING,
+                                      task_id=task.id)
+        item.create()
+        start(item, index)
+    # Wait for the units still running.
+    for _i in range(window):
+        slots.acquire()
+    if failures:
+        raise exception.ItemUnitsFailed(action=action, count=len(failures))
+    return count
+
+
+def _item_action(item):
+    try:
+        action_cls = ACTIONS[item.action]
+    except KeyError:
+        raise exception.UnknownItemAction(action=item.action)
+    return action_cls(item)
+
+
+def build_flow(task, items):
+    """Return a graph flow running the items of task not yet complete."""
+    flow = graph_flow.Flow('task-%s' % task.uuid)
+    for item in items:
+        if item.state != task_item_obj.COMPLETE:
+            flow.add(_item_action(item))
+    return flow
+
+
+def restore_outputs(items):
+    """Return the saved outputs of completed items, by name provided."""
+    outputs = {}
+    for item in items:
+        if item.state != task_item_obj.COMPLETE:
+            continue
+        result = jsonutils.loads(item.result) if item.result else None
+        for name, index in _item_action(item).save_as.items():
+            outputs[name] = result if index is None else result[index]
+    return outputs
+
+
+def _save_item_state(targets, state, details):
+    """Save the state of a flow's task on the items it runs for.
+
+    :param targets: dict of flow task name to a list of (item, index)
+                    where index picks the item's share of a split result,
+                    or is None if the item gets all of it
+    """
+    item_state = ITEM_STATES.get(state)
+    items = targets.get(details['task_name'])
+    if item_state is None or not items:
+        return
+    now = timeutils.utcnow()
+    for item, index in items:
+        if item_state == task_item_obj.RUNNING:
+            _item_running(item, now)
+        else:
+            item.state = item_state
+            item.ended_at = now
+        if item_state == task_item_obj.COMPLETE:
+            result = details.get('result')
+            if index is not None:
+                result = result[index]
+            item.result = jsonutils.dumps(result)
+        item.save()
+    item = items[0][0]
+    if item_state != task_item_obj.RUNNING and item.started_at:
+        _record_item(item)
+
+
+def _run(conf, flow, store, targets):
+    options = conf['task-processor']
+    store['item_window'] = options.item_window
+    engine = taskflow.engines.load(flow, store=store, engine='parallel',
+                                   executor=options.flow_executor,
+                                   max_workers=options.flow_max_workers)
+    engine.atom_notifier.register(
+        notifier.Notifier.ANY,
+        lambda state, details: _save_item_state(targets, state, details))
+    engine.run()
+
+
+def run_flow(conf, task, items):
+    """Run the items of task, independent ones in parallel.
+
+    The state of each item is saved as it starts, completes or fails,
+    along with its output once it completes. Items already complete are
+    skipped.
+    """
+    store = restore_outputs(items)
+    store.update({
+        'task': task,
+        'params': jsonutils.loads(task.params) if task.params else {},
+    })
+    targets = {item.uuid: [(item, None)] for item in items}
+    _run(conf, build_flow(task, items), store, targets)
+
+
+def run_batch(conf, tasks, items):
+    """Run a batch of like tasks as a single flow.
+
+    :param tasks: the tasks of the batch, none of which has started
+    :param items: list of the items of each task, in the order of tasks
+    """
+    leader = tasks[0]
+    flow = build_flow(leader, items[0])
+    store = {
+        'task': leader,
+        'tasks': tasks,
+        'params': coalesce.merge_params(tasks),
+    }
+    targets = {}
+    for item in items[0]:
+        split = ACTIONS[item.action].splits_batch
+        targets[item.uuid] = [
+            (task_item, index if split else None)
+            for index, task_items in enumerate(items)
+            for task_item in task_items if task_item.action == item.action]
+    _run(conf, flow, store, targets)
@@ -0,0 +1,353 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Metrics of the task processor, in the Prometheus text format.
+
+The supervisor keeps the metrics in a Registry and serves them over
+HTTP. Worker processes cannot update that registry themselves; instead
+each worker keeps a report of what it did since it last finished a
+task, such as how long each item took and how many database round trips
+it made, and sends it back to the supervisor with the task's result.
+"""
+
+import collections
+import math
+import threading
+
+from oslo_log import log as logging
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+from enamel.db import utils as db_utils
+
+LOG = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds, in seconds, of the buckets of duration histograms.
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+                    600)
+
+# Quantiles reported by summaries.
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in zip(names, values))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, _format_labels(self.labels, key), value
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        for name, labels, value in self._samples():
+            lines.append('%s%s %s' % (name, labels, _format_value(value)))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def replace(self, values):
+        """Set the values of all label sets at once, dropping others.
+
+        :param values: dict of label values tuple to value
+        """
+        with self._lock:
+            self._values = dict(values)
+
+
+class _HistogramValue(object):
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = _HistogramValue(self.buckets)
+                self._values[key] = histogram
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram.counts[index] += 1
+                    break
+            histogram.sum += value
+            histogram.count += 1
+
+    def get(self, **labels):
+        histogram = self._values.get(self._key(labels))
+        return histogram.count if histogram is not None else 0
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, (list(value.counts), value.sum,
+                                   value.count))
+                            for key, value in self._values.items())
+        names = self.labels + ('le',)
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (self.name + '_bucket',
+                       _format_labels(names, key + (_format_value(bound),)),
+                       cumulative)
+            yield (self.name + '_bucket',
+                   _format_labels(names, key + ('+Inf',)), count)
+            labels = _format_labels(self.labels, key)
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+
+class LogHistogram(object):
+    """Counts of values in buckets growing by a fixed ratio.
+
+    Values from minimum up to minimum * growth ** buckets are counted
+    with a relative error of at most half the growth, in a fixed amount
+    of memory however many values are added. Smaller and larger values
+    are counted in the first and last buckets.
+    """
+
+    def __init__(self, minimum=0.001, growth=1.1, buckets=200):
+        self.minimum = minimum
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, value):
+        index = 0
+        if value > self.minimum:
+            index = min(len(self.counts) - 1, 1 + int(
+                math.log(value / self.minimum) / self._log_growth))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Return an estimate of the q quantile of the values added."""
+        if not self.count:
+            return float('nan')
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                break
+        if index == 0:
+            return self.minimum
+        # The geometric middle of the bucket.
+        return self.minimum * self.growth ** (index - 0.5)
+
+
+class Summary(_Metric):
+    """Quantiles of observed values, kept in fixed memory per label set."""
+    kind = 'summary'
+
+    def __init__(self, name, help, labels=(), quantiles=QUANTILES):
+        super(Summary, self).__init__(name, help, labels)
+        self.quantiles = tuple(quantiles)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = LogHistogram()
+            histogram.add(value)
+
+    def get(self, **labels):
+        histogram = self._values.get(self._key(labels))
+        return histogram.count if histogram is not None else 0
+
+    def quantile(self, q, **labels):
+        with self._lock:
+            histogram = self._values.get(self._key(labels))
+            if histogram is None:
+                return float('nan')
+            return histogram.quantile(q)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(
+                (key, ([histogram.quantile(q) for q in self.quantiles],
+                       histogram.sum, histogram.count))
+                for key, histogram in self._values.items())
+        names = self.labels + ('quantile',)
+        for key, (estimates, total, count) in values:
+            for q, estimate in zip(self.quantiles, estimates):
+                yield (self.name, _format_labels(names, key + (repr(q),)),
+                       estimate)
+            labels = _format_labels(self.labels, key)
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+
+class Registry(object):
+    """A set of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def summary(self, name, help, labels=(), quantiles=QUANTILES):
+        return self._add(Summary(name, help, labels, quantiles))
+
+    def add_collector(self, collector):
+        """Call collector to bring metrics up to date before rendering."""
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# What this worker process did since the last report was taken.
+_REPORT_LOCK = threading.Lock()
+_ITEMS = []
+_LAST_QUERY_COUNT = [0]
+
+
+def record_item(action, state, seconds, queue_wait):
+    """Record how long an item of the given action waited and ran."""
+    with _REPORT_LOCK:
+        _ITEMS.append((action, state, seconds, queue_wait))
+
+
+def take_report():
+    """Return and reset what this process did since the last report."""
+    queries = db_utils.query_count()
+    with _REPORT_LOCK:
+        items = list(_ITEMS)
+        del _ITEMS[:]
+        report = {
+            'items': items,
+            'db_queries': queries - _LAST_QUERY_COUNT[0],
+        }
+        _LAST_QUERY_COUNT[0] = queries
+    return report
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOG.debug("Metrics request: " + format, *args)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serve the metrics of a registry over HTTP at /metrics."""
+
+    daemon_threads = True
+
+    def __init__(self, registry, address, port):
+        BaseHTTPServer.HTTPServer.__init__(self, (address, port), _Handler)
+        self.registry = registry
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
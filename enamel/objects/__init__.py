@@ -22,5 +22,6 @@ def register_all():
     # NOTE(danms): You must make sure your object gets imported in this
     # function in order for it to be registered by services that may
     # need to receive it via RPC.
+    __import__('enamel.objects.pooled_port')
     __import__('enamel.objects.task')
     __import__('enamel.objects.task_item')
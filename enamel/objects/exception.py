@@ -29,3 +29,7 @@ class TaskNotFound(NotFound):
 
 class TaskItemNotFound(NotFound):
     msg_fmt = 'TaskItem %(uuid)s could not be found.'
+
+
+class MarkerNotFound(NotFound):
+    msg_fmt = 'Marker %(marker)s could not be found.'
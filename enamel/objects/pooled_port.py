@@ -0,0 +1,190 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from oslo_utils import timeutils
+from oslo_versionedobjects import base as ovo_base
+from oslo_versionedobjects import fields
+import sqlalchemy as sa
+
+from enamel.db import models as db_models
+from enamel.db import utils as db_utils
+from enamel.objects import base
+
+# Times a taker looks for another port after losing one to another taker.
+TAKE_ATTEMPTS = 5
+
+
+@ovo_base.VersionedObjectRegistry.register
+class PooledPort(base.EnamelTimestampObject, base.EnamelObject):
+    # Version 1.0: Initial version
+    # Version 1.1: Added taken_at
+    VERSION = '1.1'
+
+    fields = {
+        'id': fields.IntegerField(read_only=True),
+        'port_id': fields.UUIDField(),
+        'project_id': fields.StringField(),
+        'network_id': fields.UUIDField(),
+        'taken_at': fields.DateTimeField(nullable=True),
+    }
+
+    @staticmethod
+    def _from_db_object(port, db_port):
+        for key in port.fields:
+            setattr(port, key, db_port[key])
+        port.obj_reset_changes()
+        return port
+
+    @staticmethod
+    def _create_in_db(updates):
+        session = db_utils.get_session()
+        db_port = db_models.PooledPort()
+        db_port.update(updates)
+        db_port.save(session)
+        return db_port
+
+    def create(self):
+        db_port = self._create_in_db(self.obj_get_changes())
+        self._from_db_object(self, db_port)
+
+    @staticmethod
+    def _destroy_in_db(port_id):
+        session = db_utils.get_session()
+        return session.query(db_models.PooledPort).filter_by(
+            id=port_id, taken_at=None).delete(synchronize_session=False)
+
+    def destroy(self):
+        """Remove the port from its pool.
+
+        :returns: whether it was still in the pool, rather than taken
+        """
+        return bool(self._destroy_in_db(self.id))
+
+    @staticmethod
+    def _take_in_db(port_id, taken_at):
+        session = db_utils.get_session()
+        return session.query(db_models.PooledPort).filter_by(
+            id=port_id, taken_at=None).update(
+                {'taken_at': taken_at}, synchronize_session=False)
+
+    @staticmethod
+    def _forget_in_db(port_id):
+        session = db_utils.get_session()
+        session.query(db_models.PooledPort).filter_by(id=port_id).delete(
+            synchronize_session=False)
+
+    def forget(self):
+        """Drop the port's row, whether taken or not."""
+        self._forget_in_db(self.id)
+
+    @staticmethod
+    def _oldest_in_db(project_id, network_id):
+        session = db_utils.get_session()
+        return session.query(db_models.PooledPort).filter_by(
+            project_id=project_id, network_id=network_id,
+            taken_at=None).order_by(db_models.PooledPort.id).first()
+
+    @classmethod
+    def take(cls, project_id, network_id):
+        """Take the oldest port of a pool out of it and return it.
+
+        Concurrent takers never get the same port. The row is kept,
+        marked taken, so that the port is not mistaken for one whose row
+        was lost while the boot it was taken for has yet to bind it.
+
+        :returns: the PooledPort, or None if the pool is empty
+        """
+        for _i in range(TAKE_ATTEMPTS):
+            db_port = cls._oldest_in_db(project_id, network_id)
+            if db_port is None:
+                return None
+            port = cls._from_db_object(cls(), db_port)
+            taken_at = timeutils.utcnow()
+            # Whoever marks the row taken owns the port.
+            if cls._take_in_db(port.id, taken_at):
+                port.taken_at = taken_at
+                port.obj_reset_changes()
+                return port
+        return None
+
+
+@ovo_base.VersionedObjectRegistry.register
+class PooledPortList(ovo_base.ObjectListBase, base.EnamelObject):
+    # Version 1.0: Initial version
+    # Version 1.1: PooledPort version 1.1
+    VERSION = '1.1'
+
+    fields = {
+        'objects': fields.ListOfObjectsField('PooledPort'),
+    }
+
+    @staticmethod
+    def _get_created_before_from_db(created_before):
+        session = db_utils.get_session()
+        return session.query(db_models.PooledPort).filter(
+            db_models.PooledPort.created_at < created_before,
+            db_models.PooledPort.taken_at.is_(None)).order_by(
+                db_models.PooledPort.id).all()
+
+    @classmethod
+    def get_created_before(cls, created_before):
+        """Return the untaken ports created before a time, of all pools."""
+        db_ports = cls._get_created_before_from_db(created_before)
+        ports = cls(objects=[
+            PooledPort._from_db_object(PooledPort(), db_port)
+            for db_port in db_ports])
+        ports.obj_reset_changes()
+        return ports
+
+    @staticmethod
+    def _get_port_ids_from_db():
+        session = db_utils.get_session()
+        return session.query(db_models.PooledPort.port_id).all()
+
+    @classmethod
+    def get_port_ids(cls):
+        """Return the set of the neutron ids of all ports, taken or not."""
+        return set(port_id for (port_id,) in cls._get_port_ids_from_db())
+
+    @staticmethod
+    def _forget_taken_before_in_db(taken_before):
+        session = db_utils.get_session()
+        return session.query(db_models.PooledPort).filter(
+            db_models.PooledPort.taken_at < taken_before).delete(
+                synchronize_session=False)
+
+    @classmethod
+    def forget_taken_before(cls, taken_before):
+        """Drop the rows of the ports taken before a time.
+
+        :returns: the number of rows dropped
+        """
+        return cls._forget_taken_before_in_db(taken_before)
+
+    @staticmethod
+    def _count_by_pool_in_db():
+        session = db_utils.get_session()
+        return session.query(
+            db_models.PooledPort.project_id,
+            db_models.PooledPort.network_id,
+            sa.func.count(db_models.PooledPort.id)).filter(
+                db_models.PooledPort.taken_at.is_(None)).group_by(
+                db_models.PooledPort.project_id,
+                db_models.PooledPort.network_id).all()
+
+    @classmethod
+    def count_by_pool(cls):
+        """Return a dict of (project_id, network_id) to untaken ports."""
+        return {(project_id, network_id): count
+                for project_id, network_id, count
+                in cls._count_by_pool_in_db()}
@@ -11,19 +11,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import calendar
+import datetime
+
+from oslo_utils import timeutils
 from oslo_versionedobjects import base as ovo_base
 from oslo_versionedobjects import fields
+import sqlalchemy as sa
 
 from enamel.db import models as db_models
 from enamel.db import utils as db_utils
 from enamel.objects import base
 from enamel.objects import exception as obj_exception
 
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETE = 'complete'
+ERROR = 'error'
+# Abandoned without being run because its deadline had passed.
+EXPIRED = 'expired'
+
+# Database backends able to skip rows locked by another transaction
+# with SELECT ... FOR UPDATE SKIP LOCKED.
+SKIP_LOCKED_DIALECTS = ('mysql', 'postgresql')
+
+
+def _lease_expiry(lease_time):
+    return timeutils.utcnow() + datetime.timedelta(seconds=lease_time)
+
 
 @ovo_base.VersionedObjectRegistry.register
 class Task(base.EnamelTimestampObject, base.EnamelObject):
     # Version 1.0: Initial version
-    VERSION = '1.0'
+    # Version 1.1: Added owner field and claim()
+    # Version 1.2: Added lease_expires_at field
+    # Version 1.3: Added deadline field
+    VERSION = '1.3'
 
     fields = {
         'id': fields.IntegerField(read_only=True),
@@ -34,6 +57,9 @@ class Task(base.EnamelTimestampObject, base.EnamelObject):
         'user_id': fields.StringField(),
         'project_id': fields.StringField(),
         'params': fields.StringField(),
+        'owner': fields.StringField(nullable=True),
+        'lease_expires_at': fields.DateTimeField(nullable=True),
+        'deadline': fields.DateTimeField(nullable=True),
         'ended_at': fields.DateTimeField(nullable=True),
     }
 
@@ -44,6 +70,21 @@ class Task(base.EnamelTimestampObject, base.EnamelObject):
             task.obj_reset_changes()
         return task
 
+    def is_overdue(self, now=None):
+        """Return whether the task's deadline, if it has one, has passed."""
+        if not self.obj_attr_is_set('deadline') or self.deadline is None:
+            return False
+        now = now or timeutils.utcnow()
+        return timeutils.normalize_time(self.deadline) < now
+
+    def deadline_time(self):
+        """Return the deadline in seconds since the epoch, or None."""
+        if not self.obj_attr_is_set('deadline') or self.deadline is None:
+            return None
+        deadline = timeutils.normalize_time(self.deadline)
+        seconds = calendar.timegm(deadline.timetuple())
+        return seconds + deadline.microsecond / 1e6
+
     # TODO(alaski): Pass context through from middleware so oslo.db
     # EngineFacade work can be used.
     @staticmethod
@@ -60,6 +101,62 @@ class Task(base.EnamelTimestampObject, base.EnamelObject):
         db_task = cls._get_by_uuid_from_db(uuid)
         return cls._from_db_object(cls(), db_task)
 
+    @staticmethod
+    def _get_versions_from_db(uuids):
+        session = db_utils.get_session()
+        return session.query(
+            db_models.Task.uuid, db_models.Task.project_id,
+            db_models.Task.state, db_models.Task.updated_at,
+            db_models.TaskItem.state,
+            sa.func.count(db_models.TaskItem.id)).outerjoin(
+                db_models.TaskItem,
+                db_models.TaskItem.task_id == db_models.Task.id).filter(
+                    db_models.Task.uuid.in_(uuids)).group_by(
+                        db_models.Task.uuid, db_models.Task.project_id,
+                        db_models.Task.state, db_models.Task.updated_at,
+                        db_models.TaskItem.state).all()
+
+    @classmethod
+    def get_versions(cls, uuids):
+        """Return the projects of tasks and stamps of their versions.
+
+        A task's stamp changes whenever the task or the state of one of
+        its items changes. Only the few columns it is made of are read,
+        so it is a cheap way to tell whether tasks changed.
+
+        :returns: a dict of task uuid to (project_id, version), without
+                  the tasks not found
+        """
+        if not uuids:
+            return {}
+        tasks = {}
+        item_counts = {}
+        for (uuid, project_id, state, updated_at, item_state,
+             count) in cls._get_versions_from_db(list(uuids)):
+            if updated_at is not None:
+                updated_at = updated_at.isoformat()
+            tasks[uuid] = (project_id, '%s;%s' % (state, updated_at))
+            counts = item_counts.setdefault(uuid, [])
+            if item_state is not None:
+                counts.append('%s=%d' % (item_state, count))
+        versions = {}
+        for uuid, (project_id, version) in tasks.items():
+            counts = ','.join(sorted(item_counts[uuid]))
+            versions[uuid] = (project_id, '%s;%s' % (version, counts))
+        return versions
+
+    @classmethod
+    def get_version(cls, uuid):
+        """Return the project of a task and a stamp of its version.
+
+        :returns: (project_id, version), see get_versions()
+        :raises: TaskNotFound
+        """
+        versions = cls.get_versions([uuid])
+        if uuid not in versions:
+            raise obj_exception.TaskNotFound(uuid=uuid)
+        return versions[uuid]
+
     @staticmethod
     def _create_in_db(updates):
         session = db_utils.get_session()
@@ -71,3 +168,230 @@ class Task(base.EnamelTimestampObject, base.EnamelObject):
     def create(self):
         db_task = self._create_in_db(self.obj_get_changes())
         self._from_db_object(self, db_task)
+
+    @staticmethod
+    def _create_with_items_in_db(updates, item_updates):
+        session = db_utils.get_session()
+        with session.begin():
+            db_task = db_models.Task()
+            db_task.update(updates)
+            db_task.save(session)
+            db_items = []
+            for updates in item_updates:
+                db_item = db_models.TaskItem()
+                db_item.update(updates)
+                db_item.task_id = db_task.id
+                db_item.save(session)
+                db_items.append(db_item)
+        return db_task, db_items
+
+    def create_with_items(self, items):
+        """Store the task and its new TaskItems in one transaction.
+
+        A processor never claims a pending task before its items exist,
+        which would run none and report the task complete.
+        """
+        db_task, db_items = self._create_with_items_in_db(
+            self.obj_get_changes(),
+            [item.obj_get_changes() for item in items])
+        self._from_db_object(self, db_task)
+        for item, db_item in zip(items, db_items):
+            item._from_db_object(item, db_item)
+
+    @staticmethod
+    def _save_in_db(task_id, updates):
+        session = db_utils.get_session()
+        session.query(db_models.Task).filter_by(id=task_id).update(
+            updates, synchronize_session=False)
+
+    def save(self):
+        updates = self.obj_get_changes()
+        if not updates:
+            return
+        updates['updated_at'] = timeutils.utcnow()
+        self._save_in_db(self.id, updates)
+        self.updated_at = updates['updated_at']
+        self.obj_reset_changes()
+
+    @staticmethod
+    def _claim_in_db(owner, limit, lease_expires_at, actions=None,
+                     uuids=None):
+        session = db_utils.get_session()
+        with session.begin():
+            query = session.query(db_models.Task.id).filter_by(
+                state=PENDING)
+            if actions:
+                query = query.filter(db_models.Task.action.in_(actions))
+            if uuids:
+                query = query.filter(db_models.Task.uuid.in_(uuids))
+            query = query.order_by(db_models.Task.id).limit(limit)
+            if session.bind.dialect.name in SKIP_LOCKED_DIALECTS:
+                query = query.with_for_update(skip_locked=True)
+            ids = [row.id for row in query]
+            if not ids:
+                return []
+            # Without row locks (SQLite) another claimer
+            # may have taken some of these rows since we read them. Only
+            # update rows still pending and read back what we got.
+            session.query(db_models.Task).filter(
+                db_models.Task.id.in_(ids),
+                db_models.Task.state == PENDING).update(
+                    {'state': RUNNING, 'owner': owner,
+                     'lease_expires_at': lease_expires_at},
+                    synchronize_session=False)
+            return session.query(db_models.Task).filter(
+                db_models.Task.id.in_(ids),
+                db_models.Task.state == RUNNING,
+                db_models.Task.owner == owner).order_by(
+                    db_models.Task.id).all()
+
+    @classmethod
+    def claim(cls, owner, limit=1, actions=None, uuids=None,
+              lease_time=60):
+        """Atomically claim up to limit pending tasks for owner.
+
+        Claimed tasks are moved to the running state and leased to owner
+        for lease_time seconds. Concurrent claimers never receive the same
+        task. The candidates may be narrowed to a list of actions or of
+        task uuids.
+        """
+        lease_expires_at = _lease_expiry(lease_time)
+        return [cls._from_db_object(cls(), db_task)
+                for db_task in cls._claim_in_db(owner, limit,
+                                                lease_expires_at,
+                                                actions=actions,
+                                                uuids=uuids)]
+
+    @staticmethod
+    def _renew_leases_in_db(owner, uuids, lease_expires_at):
+        session = db_utils.get_session()
+        return session.query(db_models.Task).filter(
+            db_models.Task.uuid.in_(uuids),
+            db_models.Task.owner == owner,
+            db_models.Task.state == RUNNING).update(
+                {'lease_expires_at': lease_expires_at},
+                synchronize_session=False)
+
+    @classmethod
+    def renew_leases(cls, owner, uuids, lease_time=60):
+        """Extend owner's leases on the tasks in uuids by lease_time.
+
+        All leases are renewed in a single statement. Returns how many
+        were renewed; fewer than asked for means some leases had already
+        expired and the tasks were handed out again.
+        """
+        if not uuids:
+            return 0
+        return cls._renew_leases_in_db(owner, list(uuids),
+                                       _lease_expiry(lease_time))
+
+    @staticmethod
+    def _reap_expired_leases_in_db(now):
+        session = db_utils.get_session()
+        return session.query(db_models.Task).filter(
+            db_models.Task.state == RUNNING,
+            db_models.Task.lease_expires_at < now).update(
+                {'state': PENDING, 'owner': None, 'lease_expires_at': None},
+                synchronize_session=False)
+
+    @classmethod
+    def reap_expired_leases(cls):
+        """Return running tasks whose lease has expired to pending.
+
+        Returns the number of tasks made available to be claimed again.
+        """
+        return cls._reap_expired_leases_in_db(timeutils.utcnow())
+
+    @staticmethod
+    def _expire_in_db(now, state, owner=None, uuids=None):
+        session = db_utils.get_session()
+        query = session.query(db_models.Task).filter(
+            db_models.Task.state == state,
+            db_models.Task.deadline < now)
+        if owner is not None:
+            query = query.filter(db_models.Task.owner == owner,
+                                 db_models.Task.uuid.in_(uuids))
+        return query.update({'state': EXPIRED, 'ended_at': now,
+                             'lease_expires_at': None},
+                            synchronize_session=False)
+
+    @classmethod
+    def expire_overdue(cls):
+        """Abandon the pending tasks whose deadline has passed.
+
+        Returns the number of tasks moved to the expired state.
+        """
+        return cls._expire_in_db(timeutils.utcnow(), PENDING)
+
+    @classmethod
+    def expire(cls, owner, uuids):
+        """Abandon the overdue tasks in uuids that owner is running.
+
+        Tasks whose deadline has not passed are left alone. Returns the
+        number of tasks moved to the expired state.
+        """
+        if not uuids:
+            return 0
+        return cls._expire_in_db(timeutils.utcnow(), RUNNING, owner=owner,
+                                 uuids=list(uuids))
+
+
+@ovo_base.VersionedObjectRegistry.register
+class TaskList(ovo_base.ObjectListBase, base.EnamelObject):
+    # Version 1.0: Initial version
+    VERSION = '1.0'
+
+    fields = {
+        'objects': fields.ListOfObjectsField('Task'),
+    }
+
+    @staticmethod
+    def _get_page_from_db(limit, marker=None, states=None, actions=None,
+                          project_ids=None):
+        session = db_utils.get_session()
+        query = session.query(db_models.Task)
+        if states:
+            query = query.filter(db_models.Task.state.in_(states))
+        if actions:
+            query = query.filter(db_models.Task.action.in_(actions))
+        if project_ids:
+            query = query.filter(db_models.Task.project_id.in_(project_ids))
+        if marker is not None:
+            marker_query = session.query(
+                db_models.Task.created_at, db_models.Task.id).filter_by(
+                    uuid=marker)
+            if project_ids:
+                # Whether another project's task exists is not told.
+                marker_query = marker_query.filter(
+                    db_models.Task.project_id.in_(project_ids))
+            db_marker = marker_query.first()
+            if db_marker is None:
+                raise obj_exception.MarkerNotFound(marker=marker)
+            # Seek past the marker rather than skip an offset, so that a
+            # page costs the same however deep it is.
+            query = query.filter(sa.or_(
+                db_models.Task.created_at < db_marker.created_at,
+                sa.and_(db_models.Task.created_at == db_marker.created_at,
+                        db_models.Task.id < db_marker.id)))
+        return query.order_by(db_models.Task.created_at.desc(),
+                              db_models.Task.id.desc()).limit(limit).all()
+
+    @classmethod
+    def get_page(cls, limit, marker=None, states=None, actions=None,
+                 project_ids=None):
+        """Return a page of tasks, the most recently created first.
+
+        :param limit: most tasks returned
+        :param marker: uuid of the last task of the previous page
+        :param states: only return tasks in these states
+        :param actions: only return tasks of these actions
+        :param project_ids: only return tasks of these projects
+        :raises: MarkerNotFound if there is no task with the marker's uuid
+                 in project_ids
+        """
+        db_tasks = cls._get_page_from_db(limit, marker, states, actions,
+                                         project_ids)
+        tasks = cls(objects=[Task._from_db_object(Task(), db_task)
+                             for db_task in db_tasks])
+        tasks.obj_reset_changes()
+        return tasks
@@ -11,6 +11,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from oslo_utils import timeutils
 from oslo_versionedobjects import base as ovo_base
 from oslo_versionedobjects import fields
 
@@ -19,11 +20,18 @@ from enamel.db import utils as db_utils
 from enamel.objects import base
 from enamel.objects import exception as obj_exception
 
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETE = 'complete'
+ERROR = 'error'
+
 
 @ovo_base.VersionedObjectRegistry.register
 class TaskItem(base.EnamelTimestampObject, base.EnamelObject):
     # Version 1.0: Initial version
-    VERSION = '1.0'
+    # Version 1.1: Added result field
+    # Version 1.2: Added started_at and queue_wait fields
+    VERSION = '1.2'
 
     fields = {
         'id': fields.IntegerField(read_only=True),
@@ -31,6 +39,12 @@ class TaskItem(base.EnamelTimestampObject, base.EnamelObject):
         'action': fields.StringField(),
         'state': fields.StringField(),
         'task_id': fields.IntegerField(),
+        # JSON encoded output of a completed item, kept so that a task
+        # can be resumed without running the item again.
+        'result': fields.StringField(nullable=True),
+        'started_at': fields.DateTimeField(nullable=True),
+        # Seconds between the item being created and it starting.
+        'queue_wait': fields.FloatField(nullable=True),
         'ended_at': fields.DateTimeField(nullable=True),
     }
 
@@ -70,3 +84,84 @@ class TaskItem(base.EnamelTimestampObject, base.EnamelObject):
     def create(self):
         db_task_item = self._create_in_db(self.obj_get_changes())
         self._from_db_object(self, db_task_item)
+
+    @staticmethod
+    def _save_in_db(task_item_id, updates):
+        session = db_utils.get_session()
+        session.query(db_models.TaskItem).filter_by(id=task_item_id).update(
+            updates, synchronize_session=False)
+
+    def save(self):
+        updates = self.obj_get_changes()
+        if not updates:
+            return
+        updates['updated_at'] = timeutils.utcnow()
+        self._save_in_db(self.id, updates)
+        self.updated_at = updates['updated_at']
+        self.obj_reset_changes()
+
+
+@ovo_base.VersionedObjectRegistry.register
+class TaskItemList(ovo_base.ObjectListBase, base.EnamelObject):
+    # Version 1.0: Initial version
+    # Version 1.1: TaskItem version 1.1
+    # Version 1.2: TaskItem version 1.2
+    VERSION = '1.2'
+
+    fields = {
+        'objects': fields.ListOfObjectsField('TaskItem'),
+    }
+
+    @staticmethod
+    def _task_items_query(session, task_id, actions=None,
+                          exclude_actions=None, states=None):
+        query = session.query(db_models.TaskItem).filter_by(task_id=task_id)
+        if actions:
+            query = query.filter(db_models.TaskItem.action.in_(actions))
+        if exclude_actions:
+            query = query.filter(
+                ~db_models.TaskItem.action.in_(exclude_actions))
+        if states:
+            query = query.filter(db_models.TaskItem.state.in_(states))
+        return query
+
+    @staticmethod
+    def _get_by_task_id_from_db(task_id, actions=None, exclude_actions=None,
+                                states=None):
+        session = db_utils.get_session()
+        query = TaskItemList._task_items_query(
+            session, task_id, actions, exclude_actions, states)
+        return query.order_by(db_models.TaskItem.id).all()
+
+    @staticmethod
+    def _count_by_task_id_in_db(task_id, actions=None, before_id=None):
+        session = db_utils.get_session()
+        query = TaskItemList._task_items_query(session, task_id, actions)
+        if before_id is not None:
+            query = query.filter(db_models.TaskItem.id < before_id)
+        return query.count()
+
+    @classmethod
+    def count_by_task_id(cls, task_id, actions=None, before_id=None):
+        """Return the number of items of a task, or of some actions of it.
+
+        :param before_id: only count the items created before this one
+        """
+        return cls._count_by_task_id_in_db(task_id, actions, before_id)
+
+    @classmethod
+    def get_by_task_id(cls, task_id, actions=None, exclude_actions=None,
+                       states=None):
+        """Return the items of a task, in the order they were created.
+
+        :param actions: only return items of these actions
+        :param exclude_actions: leave out items of these actions
+        :param states: only return items in these states
+        """
+        db_task_items = cls._get_by_task_id_from_db(
+            task_id, actions, exclude_actions, states)
+        task_items = cls(objects=[
+            TaskItem._from_db_object(TaskItem(), db_task_item)
+            for db_task_item in db_task_items])
+        task_items.obj_reset_changes()
+        return task_items
@@ -26,19 +26,396 @@ def list_opts():
                        default='keystone',
                        help='The authentication strategy. '
                             'Set to None to disable auth.'),
+            cfg.IntOpt('max_limit',
+                       default=1000,
+                       min=1,
+                       help='The most items a page of a listing holds, '
+                            'and how many it holds when no limit is '
+                            'asked for.'),
+            cfg.IntOpt('max_wait',
+                       default=60,
+                       min=0,
+                       help='Most seconds a request for a task waits for '
+                            'it to change when asked to wait.'),
+            cfg.FloatOpt('notify_interval',
+                         default=1.0,
+                         min=0.1,
+                         help='Seconds between checks of the tasks that '
+                              'requests are waiting for. The tasks are '
+                              'checked together, whatever their number.'),
+            cfg.BoolOpt('server_boot',
+                        default=False,
+                        help='Accept requests to boot servers. Enable it '
+                             'once the task processors run an action for '
+                             'boot_server tasks; until then POST /servers '
+                             'answers 501 Not Implemented.'),
+            cfg.IntOpt('event_keepalive',
+                       default=15,
+                       min=1,
+                       help='Seconds after which a stream of task events '
+                            'that had nothing to send sends a comment, '
+                            'keeping the connection alive.'),
         )),
         ("task-processor", (
             cfg.PortOpt(
                 'bind_port',
-                default=5050,
-                help='The port for the Enamel task processor worker.'),
+                default=5051,
+                help='The port on which the Enamel task processor serves '
+                     'its metrics.'),
             cfg.StrOpt(
                 'bind_address',
                 default='0.0.0.0',
-                help='The listen IP for the Enamel task processor worker.'),
+                help='The listen IP on which the Enamel task processor '
+                     'serves its metrics.'),
             cfg.StrOpt(
                 'pidfile',
                 default='/var/run/enamel-task-processor.pid',
                 help='The path to the pidfile for the task processor daemon.'),
+            cfg.IntOpt(
+                'workers',
+                min=1,
+                help='Most worker processes the task processor runs. '
+                     'Defaults to the number of CPUs on the host.'),
+            cfg.IntOpt(
+                'min_workers',
+                default=1,
+                min=1,
+                help='Fewest worker processes the task processor runs. '
+                     'The pool grows towards workers while tasks are '
+                     'waiting and shrinks back while workers are idle. '
+                     'Set it to workers for a pool of a fixed size.'),
+            cfg.FloatOpt(
+                'scale_interval',
+                default=5.0,
+                min=0,
+                help='Seconds between decisions to grow or shrink the '
+                     'worker pool.'),
+            cfg.FloatOpt(
+                'scale_drain_time',
+                default=30.0,
+                min=0.001,
+                help='Seconds within which the worker pool should be able '
+                     'to start the tasks waiting for a worker. The time the '
+                     'waiting tasks need is estimated from the median time '
+                     'their action\'s task items took, and the pool grows '
+                     'by as many workers as it takes to get through them '
+                     'in this time.'),
+            cfg.FloatOpt(
+                'scale_down_delay',
+                default=60.0,
+                min=0,
+                help='Seconds the worker pool must have more workers than '
+                     'it needs before idle workers are stopped. The pool '
+                     'grows as soon as tasks are waiting, so this keeps it '
+                     'from shrinking and growing again with each burst.'),
+            cfg.DictOpt(
+                'action_concurrency',
+                default={},
+                help='Maximum number of tasks of a given action that may '
+                     'run at once, as a comma-separated list of '
+                     'action:limit pairs.'),
+            cfg.IntOpt(
+                'default_action_concurrency',
+                default=0,
+                min=0,
+                help='Maximum number of tasks of an action not listed in '
+                     'action_concurrency that may run at once. 0 means '
+                     'only the number of workers limits it.'),
+            cfg.DictOpt(
+                'action_priorities',
+                default={},
+                help='Priority class of tasks of a given action, as a '
+                     'comma-separated list of action:priority pairs, '
+                     'priorities being integers. Tasks of a higher class '
+                     'are started first. Unlisted actions are in class '
+                     '0.'),
+            cfg.DictOpt(
+                'project_weights',
+                default={},
+                help='Share of the workers given to a project while other '
+                     'projects also have tasks waiting, as a '
+                     'comma-separated list of project_id:weight pairs. '
+                     'Weights must be positive; unlisted projects have '
+                     'weight 1.'),
+            cfg.ListOpt(
+                'coalesce_actions',
+                default=['boot_server'],
+                help='Task actions whose like tasks are run together as '
+                     'a batch when they arrive within coalesce_window of '
+                     'each other. Tasks are alike when they are of the '
+                     'same project and their params only differ in name, '
+                     'min_count and max_count.'),
+            cfg.FloatOpt(
+                'coalesce_window',
+                default=0,
+                min=0,
+                help='Seconds a task of one of the coalesce_actions waits '
+                     'for like tasks to be run with. 0 disables '
+                     'coalescing.'),
+            cfg.IntOpt(
+                'coalesce_max_batch',
+                default=10,
+                min=1,
+                help='Most tasks run together as one batch. A batch that '
+                     'is full starts without waiting for the rest of '
+                     'coalesce_window.'),
+            cfg.IntOpt(
+                'claim_batch_size',
+                default=10,
+                min=1,
+                help='Maximum number of pending tasks claimed from the '
+                     'database in one round trip.'),
+            cfg.FloatOpt(
+                'claim_interval',
+                default=1.0,
+                min=0,
+                help='Seconds between attempts to claim pending tasks '
+                     'while workers are idle. 0 disables claiming tasks '
+                     'from the database. When tasks are pushed over the '
+                     'dispatch transport this only needs to be frequent '
+                     'enough to pick up tasks whose message was lost.'),
+            cfg.ListOpt(
+                'topics',
+                default=[],
+                help='Task actions this task processor runs. Leave empty '
+                     'to run tasks of every action.'),
+            cfg.IntOpt(
+                'lease_time',
+                default=60,
+                min=1,
+                help='Seconds a claimed task stays leased to the task '
+                     'processor that claimed it without being renewed. A '
+                     'task whose lease expires is handed out again.'),
+            cfg.IntOpt(
+                'heartbeat_interval',
+                default=10,
+                min=1,
+                help='Seconds between renewals of the leases on the tasks '
+                     'the task processor holds. Each renewal also hands '
+                     'out again tasks whose lease has expired. Must be '
+                     'shorter than lease_time.'),
+            cfg.IntOpt(
+                'item_window',
+                default=20,
+                min=1,
+                help='Most units of a task item run at once, such as the '
+                     'servers of a boot asking for many. The item of '
+                     'each unit is only created when the unit starts.'),
+            cfg.FloatOpt(
+                'server_poll_min_interval',
+                default=1.0,
+                min=0.1,
+                help='Seconds between the list calls a worker makes to '
+                     'nova while the servers its tasks wait for are '
+                     'changing state.'),
+            cfg.FloatOpt(
+                'server_poll_max_interval',
+                default=10.0,
+                min=0.1,
+                help='Most seconds between the list calls a worker makes '
+                     'to nova while none of the servers its tasks wait '
+                     'for change state.'),
+            cfg.StrOpt(
+                'flow_executor',
+                default='threaded',
+                choices=('threaded', 'processes'),
+                help='How a worker runs the independent items of a task '
+                     'at the same time: in threads or in child processes.'),
+            cfg.IntOpt(
+                'flow_max_workers',
+                default=8,
+                min=1,
+                help='Maximum number of items of a single task a worker '
+                     'runs at the same time.'),
+        )),
+        ("dispatch", (
+            cfg.StrOpt(
+                'transport',
+                choices=('local', 'unix'),
+                help='How new tasks are pushed from the API to task '
+                     'processors. "unix" sends them over Unix sockets on '
+                     'the local host, "local" only reaches a task '
+                     'processor running in the same process. Unset by '
+                     'default, leaving task processors to find new tasks '
+                     'by polling the database alone.'),
+            cfg.StrOpt(
+                'socket_dir',
+                default='/var/run/enamel',
+                help='Directory holding the Unix sockets of the unix '
+                     'dispatch transport, created if missing. Only one '
+                     'task processor of a host may consume a topic.'),
+        )),
+        ("clients", (
+            cfg.IntOpt(
+                'max_sessions',
+                default=64,
+                min=1,
+                help='Most authenticated sessions with other services a '
+                     'task processor worker keeps open, one for each set '
+                     'of credentials and region. The least recently used '
+                     'session is closed to make room for a new one.'),
+            cfg.IntOpt(
+                'connections',
+                default=10,
+                min=1,
+                help='Most HTTP connections a session keeps alive to each '
+                     'service endpoint.'),
+            cfg.FloatOpt(
+                'timeout',
+                min=0,
+                help='Seconds a request to another service may take. By '
+                     'default requests do not time out.'),
+            cfg.StrOpt(
+                'cafile',
+                help='CA bundle verifying the TLS certificates of other '
+                     'services.'),
+            cfg.BoolOpt(
+                'insecure',
+                default=False,
+                help='Skip verifying the TLS certificates of other '
+                     'services.'),
+        )),
+        ("rate-limit", (
+            cfg.DictOpt(
+                'limits',
+                default={},
+                help='Most requests per second the workers of a task '
+                     'processor together make to a service, as a '
+                     'comma-separated list of name:rate pairs. A name is '
+                     'a service type, such as compute, or a service type '
+                     'and endpoint class, such as compute.boot; a call is '
+                     'held to the limits of both. Rates must be positive; '
+                     'services not listed are not limited.'),
+            cfg.FloatOpt(
+                'burst_seconds',
+                default=1.0,
+                min=0,
+                help='Seconds worth of requests that may be made at once '
+                     'after a quiet period. Must be positive.'),
+            cfg.FloatOpt(
+                'recovery_time',
+                default=60.0,
+                min=0,
+                help='The rate of calls to a service is halved each time '
+                     'it answers that it is overloaded. This is the number '
+                     'of seconds a halved rate takes to climb back to its '
+                     'limit. 0 keeps the rate at its limit.'),
+            cfg.FloatOpt(
+                'max_wait',
+                default=30.0,
+                min=0,
+                help='Most seconds a worker waits for the rate limit to '
+                     'allow a call before failing it. 0 waits as long as '
+                     'it takes.'),
+        )),
+        ("metadata-cache", (
+            cfg.IntOpt(
+                'entries',
+                default=256,
+                min=1,
+                help='Most image and flavor descriptions the workers of a '
+                     'task processor keep cached together.'),
+            cfg.IntOpt(
+                'max_entry_size',
+                default=16384,
+                min=256,
+                help='Most bytes a cached description may take. Larger '
+                     'ones are fetched every time. The cache takes '
+                     'entries times this much shared memory.'),
+            cfg.IntOpt(
+                'image_ttl',
+                default=300,
+                min=0,
+                help='Seconds an image\'s glance metadata is cached for. '
+                     '0 disables caching images.'),
+            cfg.IntOpt(
+                'flavor_ttl',
+                default=3600,
+                min=0,
+                help='Seconds a nova flavor is cached for. 0 disables '
+                     'caching flavors.'),
+        )),
+        ("port-pool", (
+            cfg.ListOpt(
+                'pools',
+                default=[],
+                help='Pairs of project and network, given as '
+                     'project_id:network_id, for which the task processor '
+                     'creates ports ahead of the boots that need them. '
+                     'Leave empty to pool no ports.'),
+            cfg.IntOpt(
+                'low_watermark',
+                default=2,
+                min=0,
+                help='Ports a pool may fall to before it is topped up. '
+                     'An empty pool is always topped up.'),
+            cfg.IntOpt(
+                'high_watermark',
+                default=5,
+                min=1,
+                help='Ports a pool running low is topped up to.'),
+            cfg.IntOpt(
+                'max_age',
+                default=3600,
+                min=1,
+                help='Seconds after which a pooled port nobody took is '
+                     'deleted.'),
+            cfg.FloatOpt(
+                'interval',
+                default=30.0,
+                min=1,
+                help='Seconds between checks of the pools.'),
+            cfg.DictOpt(
+                'credentials',
+                default={},
+                secret=True,
+                help='Keystone credentials allowed to create ports for the '
+                     'projects of the pools, as a comma-separated list of '
+                     'name:value pairs of the auth plugin\'s options, such '
+                     'as auth_type:password,auth_url:...,username:...'),
+            cfg.StrOpt(
+                'region_name',
+                help='Region of the networks of the pools.'),
+        )),
+        ("retry", (
+            cfg.IntOpt(
+                'max_attempts',
+                default=3,
+                min=1,
+                help='Most times a worker makes a call to a service that '
+                     'fails for a reason likely to pass, such as a refused '
+                     'connection or a 503. 1 disables retries.'),
+            cfg.FloatOpt(
+                'base_delay',
+                default=0.5,
+                min=0,
+                help='Most seconds a worker waits before the first retry '
+                     'of a call. The ceiling doubles with each further '
+                     'retry, and the delay is picked at random below it.'),
+            cfg.FloatOpt(
+                'max_delay',
+                default=10.0,
+                min=0,
+                help='Most seconds a worker waits before retrying a call.'),
+            cfg.IntOpt(
+                'failure_threshold',
+                default=5,
+                min=1,
+                help='Failed calls in a row to an endpoint of a service '
+                     'after which the workers stop calling it and fail '
+                     'the calls at once.'),
+            cfg.FloatOpt(
+                'reset_timeout',
+                default=30.0,
+                min=0,
+                help='Seconds the workers stop calling a failing endpoint '
+                     'for before trying a single call to see whether it '
+                     'is back.'),
+            cfg.IntOpt(
+                'breakers',
+                default=64,
+                min=1,
+                help='Most endpoints whose failures the workers of a task '
+                     'processor keep track of together.'),
         )),
     ]
@@ -0,0 +1,237 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Pools of neutron ports created ahead of the boots that use them.
+
+Creating a port before booting a server onto it costs a neutron round
+trip on the path of every boot. For the (project, network) pairs listed
+in the [port-pool] pools option, the task processor keeps ports created
+in advance: whenever a pool falls below low_watermark ports it is topped
+up to high_watermark. A boot flow asks take_port() for a port and only
+creates one itself when the pool is empty.
+
+Pooled ports are recorded in the database, so that every worker of every
+task processor draws from the same pools and a port is never handed out
+twice. A taken port keeps its row, marked taken, for max_age, by when
+the boot it was taken for has bound or deleted it. Ports that sat unused
+for longer than max_age, and those of pools no longer configured, are
+deleted. So are ports named as pooled ones that have no row, such as
+those created by a processor that died before recording them.
+"""
+
+import datetime
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from enamel import clients
+from enamel.objects import pooled_port as pooled_port_obj
+from enamel import ratelimit
+from enamel import retry
+
+LOG = logging.getLogger(__name__)
+
+# Name given to pooled ports, telling them apart from the users' own.
+PORT_NAME = 'enamel-pooled-port'
+
+
+def create_port(neutron, project_id, network_id):
+    """Create a port of project_id on network_id and return its id."""
+    port = retry.call('network', 'create_port', neutron.create_port, {
+        'port': {
+            'name': PORT_NAME,
+            'network_id': network_id,
+            'project_id': project_id,
+        },
+    }, idempotent=False)
+    return port['port']['id']
+
+
+def delete_port(neutron, port_id):
+    """Delete a port, which may be gone already."""
+    try:
+        retry.call('network', 'delete_port', neutron.delete_port, port_id)
+    except Exception as exc:
+        if ratelimit.status_code(exc) != 404:
+            raise
+
+
+def list_ports(neutron):
+    """Return the ports named as pooled ones, whether taken or not."""
+    return retry.call('network', 'list_ports', neutron.list_ports,
+                      name=PORT_NAME)['ports']
+
+
+def parse_pools(pools):
+    """Return the (project_id, network_id) pairs of the pools option."""
+    result = []
+    for pool in pools:
+        project_id, _sep, network_id = pool.partition(':')
+        if not project_id or not network_id:
+            raise ValueError("Port pools are given as project_id:network_id, "
+                             "not %s" % pool)
+        result.append((project_id, network_id))
+    return result
+
+
+class PortPools(object):
+    """Keep the pools of ports topped up and their stale ports deleted.
+
+    :param pools: list of (project_id, network_id) to keep ports for
+    :param low_watermark: ports below which a pool is topped up
+    :param high_watermark: ports a pool is topped up to
+    :param max_age: seconds after which an unused pooled port is deleted
+    :param credentials: credentials allowed to create ports for the
+                        projects of the pools
+    :param client_pool: the ClientPool to get a neutron client from
+    """
+
+    def __init__(self, pools, low_watermark, high_watermark, max_age,
+                 credentials, region_name=None, client_pool=None):
+        self.pools = pools
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark)
+        self.max_age = max_age
+        self.credentials = credentials
+        self.region_name = region_name
+        self._client_pool = client_pool or clients.ClientPool()
+        # Ports without a row nor a device at the previous reconcile().
+        self._orphans = set()
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf['port-pool']
+        credentials = dict(options.credentials)
+        credentials.setdefault('handle', 'port-pool')
+        return cls(parse_pools(options.pools),
+                   low_watermark=options.low_watermark,
+                   high_watermark=options.high_watermark,
+                   max_age=options.max_age,
+                   credentials=credentials,
+                   region_name=options.region_name,
+                   client_pool=clients.ClientPool.from_config(conf))
+
+    def _neutron(self):
+        return self._client_pool.client('network', self.credentials,
+                                        self.region_name)
+
+    def maintain(self):
+        """Delete stale pooled ports, then top up the pools running low."""
+        self.collect_garbage()
+        try:
+            self.reconcile()
+        except Exception:
+            LOG.exception("Unable to look for orphaned pooled ports")
+        counts = pooled_port_obj.PooledPortList.count_by_pool()
+        # An empty pool is topped up even with a low_watermark of 0.
+        low_watermark = max(1, self.low_watermark)
+        for project_id, network_id in self.pools:
+            count = counts.get((project_id, network_id), 0)
+            if count >= low_watermark:
+                continue
+            try:
+                self._top_up(project_id, network_id,
+                             self.high_watermark - count)
+            except Exception:
+                # Don't let one pool starve the others.
+                LOG.exception("Unable to add ports to the pool of project "
+                              "%(project)s on network %(network)s",
+                              {'project': project_id, 'network': network_id})
+
+    def _top_up(self, project_id, network_id, count):
+        LOG.debug("Adding %(count)d ports to the pool of project "
+                  "%(project)s on network %(network)s",
+                  {'count': count, 'project': project_id,
+                   'network': network_id})
+        for _i in range(count):
+            port_id = create_port(self._neutron(), project_id, network_id)
+            pooled_port_obj.PooledPort(
+                port_id=port_id, project_id=project_id,
+                network_id=network_id).create()
+
+    def reconcile(self):
+        """Delete the pooled ports neutron has but the database lost.
+
+        Ports taken by a boot keep their row until max_age after, so are
+        spared while the boot binds them. A port is only deleted once two
+        passes in a row found it with neither a row nor a device, as one
+        just created may not have its row yet.
+
+        :returns: the number of ports deleted
+        """
+        neutron = self._neutron()
+        pooled = pooled_port_obj.PooledPortList.get_port_ids()
+        orphans = set()
+        for port in list_ports(neutron):
+            if port['id'] not in pooled and not port.get('device_id'):
+                orphans.add(port['id'])
+        deleted = 0
+        for port_id in orphans & self._orphans:
+            LOG.info("Deleting orphaned pooled port %s", port_id)
+            try:
+                delete_port(neutron, port_id)
+            except Exception:
+                LOG.exception("Unable to delete pooled port %s", port_id)
+                continue
+            orphans.discard(port_id)
+            deleted += 1
+        self._orphans = orphans
+        return deleted
+
+    def collect_garbage(self):
+        """Delete the pooled ports too old or of pools no longer kept.
+
+        :returns: the number of ports deleted
+        """
+        deleted = 0
+        pools = set(self.pools)
+        for pool in pooled_port_obj.PooledPortList.count_by_pool():
+            if pool in pools:
+                continue
+            port = pooled_port_obj.PooledPort.take(*pool)
+            while port is not None:
+                deleted += self._discard(port)
+                port.forget()
+                port = pooled_port_obj.PooledPort.take(*pool)
+        max_age_ago = timeutils.utcnow() - datetime.timedelta(
+            seconds=self.max_age)
+        for port in pooled_port_obj.PooledPortList.get_created_before(
+                max_age_ago):
+            # A boot may have taken it meanwhile.
+            if port.destroy():
+                deleted += self._discard(port)
+        # The boots have bound the ports taken so long ago, or given up and
+        # deleted them.
+        pooled_port_obj.PooledPortList.forget_taken_before(max_age_ago)
+        return deleted
+
+    def _discard(self, port):
+        try:
+            delete_port(self._neutron(), port.port_id)
+        except Exception:
+            LOG.exception("Unable to delete pooled port %s", port.port_id)
+            return 0
+        return 1
+
+
+def take_port(project_id, network_id):
+    """Take a pooled port of project_id on network_id for a boot.
+
+    The port is the caller's from then on; a boot that fails should
+    delete it. Its row is kept, marked taken, for max_age, sparing the
+    port from reconcile() until the boot has bound it.
+
+    :returns: the port's id, or None if no port is pooled
+    """
+    port = pooled_port_obj.PooledPort.take(project_id, network_id)
+    if port is None:
+        return None
+    return port.port_id
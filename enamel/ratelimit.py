@@ -0,0 +1,210 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Rate limiting of the calls task workers make to other services.
+
+Limits are token buckets, one per service (say "compute") and optionally
+one per class of endpoint of a service (say "compute.boot"). A call
+takes a token from the bucket of its service and from that of its
+endpoint class, waiting for both to have one.
+
+The buckets live in shared memory created by the task processor before
+it starts its workers, so every worker process on the host draws from
+the same buckets.
+
+A configured rate is a ceiling, not a target. When a service answers
+that it is overloaded, the rate of its buckets is halved; it then climbs
+back to the ceiling over recovery_time seconds. The rate thereby settles
+at what the service can take instead of feeding a storm of retries.
+"""
+
+import contextlib
+import multiprocessing
+import time
+
+from enamel import exception
+
+# HTTP statuses by which a service says it is overloaded.
+THROTTLED_STATUSES = (429, 503)
+
+# A bucket's rate is never backed off below this fraction of its ceiling.
+MIN_RATE_FRACTION = 0.05
+
+# Slots of a bucket's state in the shared array.
+_TOKENS, _STAMP, _RATE = range(3)
+_SLOTS = 3
+
+_LIMITER = None
+
+
+def status_code(exc):
+    """Return the HTTP status of an exception raised by a client, if any."""
+    for attr in ('http_status', 'status_code', 'code'):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+class RateLimiter(object):
+    """Token buckets shared by the processes forked after creating them.
+
+    :param limits: dict of bucket name to the most requests per second
+                   it allows; a name is a service or service.endpoint_class
+    :param burst_seconds: seconds worth of requests a full bucket holds
+    :param recovery_time: seconds a backed off rate takes to climb back
+                          to its ceiling
+    :param max_wait: most seconds acquire() waits for a token, or None to
+                     wait as long as it takes
+    """
+
+    def __init__(self, limits, burst_seconds=1.0, recovery_time=60.0,
+                 max_wait=None):
+        self._ceilings = {}
+        for key, rate in limits.items():
+            try:
+                rate = float(rate)
+            except ValueError:
+                rate = None
+            # A rate of 0 would never refill its bucket.
+            if rate is None or not 0 < rate < float('inf'):
+                raise ValueError("The rate limit of %s must be a positive "
+                                 "number of requests per second, not %s"
+                                 % (key, limits[key]))
+            self._ceilings[key] = rate
+        if not 0 < burst_seconds < float('inf'):
+            raise ValueError("The burst of rate limits must be a positive "
+                             "number of seconds, not %s" % burst_seconds)
+        self._index = {key: i for i, key in enumerate(sorted(limits))}
+        self.burst_seconds = burst_seconds
+        self.recovery_time = recovery_time
+        self.max_wait = max_wait
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray('d', _SLOTS * len(limits))
+        now = time.time()
+        for key in self._index:
+            base = self._index[key] * _SLOTS
+            self._state[base + _TOKENS] = self._capacity(key)
+            self._state[base + _STAMP] = now
+            self._state[base + _RATE] = self._ceilings[key]
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf['rate-limit']
+        return cls(options.limits,
+                   burst_seconds=options.burst_seconds,
+                   recovery_time=options.recovery_time,
+                   max_wait=options.max_wait or None)
+
+    def _capacity(self, key):
+        return max(1.0, self._ceilings[key] * self.burst_seconds)
+
+    def _keys(self, service, endpoint_class):
+        keys = [service]
+        if endpoint_class is not None:
+            keys.append('%s.%s' % (service, endpoint_class))
+        return [key for key in keys if key in self._index]
+
+    def _refill(self, key, now):
+        base = self._index[key] * _SLOTS
+        state = self._state
+        ceiling = self._ceilings[key]
+        elapsed = max(0.0, now - state[base + _STAMP])
+        rate = state[base + _RATE]
+        state[base + _TOKENS] = min(self._capacity(key),
+                                    state[base + _TOKENS] + elapsed * rate)
+        if self.recovery_time:
+            rate = min(ceiling, rate + ceiling * elapsed / self.recovery_time)
+        else:
+            rate = ceiling
+        state[base + _RATE] = rate
+        state[base + _STAMP] = now
+        return base
+
+    def _take(self, keys, now):
+        """Take a token from each bucket, or say how long until we can."""
+        wait = 0.0
+        bases = []
+        for key in keys:
+            base = self._refill(key, now)
+            tokens = self._state[base + _TOKENS]
+            if tokens < 1.0:
+                wait = max(wait, (1.0 - tokens) / self._state[base + _RATE])
+            bases.append(base)
+        if not wait:
+            for base in bases:
+                self._state[base + _TOKENS] -= 1.0
+        return wait
+
+    def acquire(self, service, endpoint_class=None):
+        """Wait until a call to the service's endpoint class is allowed.
+
+        :raises: RateLimited if that would take longer than max_wait
+        """
+        keys = self._keys(service, endpoint_class)
+        if not keys:
+            return
+        deadline = None
+        if self.max_wait is not None:
+            deadline = time.time() + self.max_wait
+        while True:
+            now = time.time()
+            with self._lock:
+                wait = self._take(keys, now)
+            if not wait:
+                return
+            if deadline is not None and now + wait > deadline:
+                raise exception.RateLimited(service=service)
+            time.sleep(wait)
+
+    def backoff(self, service, endpoint_class=None):
+        """Halve the rate of calls after the service said it is overloaded."""
+        now = time.time()
+        with self._lock:
+            for key in self._keys(service, endpoint_class):
+                base = self._refill(key, now)
+                self._state[base + _RATE] = max(
+                    self._state[base + _RATE] / 2.0,
+                    self._ceilings[key] * MIN_RATE_FRACTION)
+
+    def rate(self, service, endpoint_class=None):
+        """Return the rate now allowed for the bucket, or None if unlimited."""
+        keys = self._keys(service, endpoint_class)
+        if not keys:
+            return None
+        with self._lock:
+            return self._state[self._refill(keys[-1], time.time()) + _RATE]
+
+
+def set_limiter(limiter):
+    """Make limiter the one used by limited() in this process."""
+    global _LIMITER
+    _LIMITER = limiter
+
+
+@contextlib.contextmanager
+def limited(service, endpoint_class=None):
+    """Run the enclosed client call within the service's rate limits.
+
+    Waits for the call to be allowed, and backs the rate off if the call
+    fails because the service is overloaded.
+    """
+    limiter = _LIMITER
+    if limiter is None:
+        yield
+        return
+    limiter.acquire(service, endpoint_class)
+    try:
+        yield
+    except Exception as exc:
+        if status_code(exc) in THROTTLED_STATUSES:
+            limiter.backoff(service, endpoint_class)
+        raise
@@ -0,0 +1,345 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Retries and circuit breakers around the calls workers make to services.
+
+Calls that fail for reasons likely to pass, such as a refused connection
+or a 503, are retried a few times, each after a random delay of up to an
+exponentially growing ceiling. The randomness keeps the workers that hit
+the same failure from retrying in lockstep.
+
+Retrying does not help a service that is down and only adds to its load,
+so each endpoint (a service, say "compute", or a class of its endpoints,
+say "compute.boot") has a circuit breaker. After failure_threshold
+failures in a row the breaker opens and calls to the endpoint fail at
+once with CircuitOpen, freeing the worker for tasks that can make
+progress. Once reset_timeout seconds have passed, the breaker is half
+open: a single call is let through as a probe, and its outcome closes
+the breaker again or keeps it open for another reset_timeout.
+
+Like the rate limiter's buckets, the breakers live in shared memory
+created by the task processor before it starts its workers, so one
+worker finding an endpoint down spares the others the discovery.
+"""
+
+import multiprocessing
+import random
+import time
+import zlib
+
+from keystoneauth1 import exceptions as ks_exceptions
+from oslo_log import log as logging
+import requests
+from requests.packages.urllib3 import exceptions as urllib3_exceptions
+
+from enamel import exception
+from enamel import ratelimit
+
+LOG = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = range(3)
+
+# Exceptions raised when the connection to the service failed. keystoneauth
+# raises ConnectFailure for connections broken after the request was sent
+# too, so the service may have acted on it.
+CONNECT_ERRORS = (ks_exceptions.ConnectFailure,
+                  requests.exceptions.ConnectionError)
+
+# Exceptions, raised or found among the causes of those raised, showing
+# that no connection to the service was made, such as a refused one or a
+# host name that did not resolve. Those are safe to retry whatever the
+# request.
+NOT_CONNECTED_ERRORS = (requests.exceptions.ConnectTimeout,
+                        urllib3_exceptions.ConnectTimeoutError)
+
+# Attributes an exception may keep its cause in, urllib3's MaxRetryError
+# keeping the error of its last try as reason.
+_CAUSES = ('reason', '__cause__', '__context__')
+
+# Exceptions raised when the service may or may not have acted on the
+# request.
+TRANSIENT_ERRORS = CONNECT_ERRORS + (ks_exceptions.ConnectionError,
+                                     ks_exceptions.RetriableConnectionFailure,
+                                     requests.exceptions.Timeout)
+
+# Slots of a breaker's state in the shared array. The key is a hash of
+# the endpoint's name, 0 marking a free breaker.
+_KEY, _STATE, _FAILURES, _OPENED_AT, _PROBE_AT = range(5)
+_SLOTS = 5
+
+_POLICY = None
+_BREAKERS = None
+
+
+def is_transient(exc):
+    """Return whether a call failing with exc may succeed if repeated."""
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return True
+    code = ratelimit.status_code(exc)
+    if code is None:
+        return False
+    return code >= 500 or code in ratelimit.THROTTLED_STATUSES
+
+
+def is_safe_to_retry(exc, idempotent):
+    """Return whether a call failing with exc may be made again.
+
+    A call that is not idempotent, such as a boot, is only retried when
+    the service cannot have acted on it.
+    """
+    if idempotent:
+        return is_transient(exc)
+    if not_connected(exc):
+        return True
+    return ratelimit.status_code(exc) in ratelimit.THROTTLED_STATUSES
+
+
+def not_connected(exc):
+    """Return whether exc shows that no connection was made to the service.
+
+    Client libraries wrap the error of the connection in their own, so its
+    causes are looked at as well.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, NOT_CONNECTED_ERRORS):
+            return True
+        seen.add(id(exc))
+        causes = [getattr(exc, name, None) for name in _CAUSES]
+        exc = next((cause for cause in causes if cause is not None), None)
+    return False
+
+
+def _endpoint(service, endpoint_class):
+    if endpoint_class is None:
+        return service
+    return '%s.%s' % (service, endpoint_class)
+
+
+def _hash(endpoint):
+    return float((zlib.crc32(endpoint.encode('utf-8')) & 0xffffffff) + 1)
+
+
+class RetryPolicy(object):
+    """How often and after how long a failed call is made again.
+
+    :param max_attempts: most times a call is made, the first included
+    :param base_delay: ceiling, in seconds, of the delay before the first
+                       retry, doubling for each further one
+    :param max_delay: most seconds to wait before a retry
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=10.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf.retry
+        return cls(max_attempts=options.max_attempts,
+                   base_delay=options.base_delay,
+                   max_delay=options.max_delay)
+
+    def delay(self, attempt):
+        """Return the seconds to wait before retrying a failed attempt.
+
+        :param attempt: number of the attempt that failed, from 1
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreakers(object):
+    """Circuit breakers shared by the processes forked after creating them.
+
+    :param failure_threshold: failures in a row opening a breaker
+    :param reset_timeout: seconds an open breaker waits before letting a
+                          probe call through
+    :param size: most endpoints tracked; calls to endpoints beyond those
+                 are not guarded
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, size=64):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.size = size
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray('d', _SLOTS * size)
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf.retry
+        return cls(failure_threshold=options.failure_threshold,
+                   reset_timeout=options.reset_timeout,
+                   size=options.breakers)
+
+    def _find(self, endpoint):
+        """Return the base of endpoint's breaker, taking a free one if new.
+
+        Breakers are found by linear probing from the hash of the
+        endpoint's name. Must be called with the lock held.
+        """
+        key = _hash(endpoint)
+        start = int(key) % self.size
+        for offset in range(self.size):
+            base = ((start + offset) % self.size) * _SLOTS
+            if self._state[base + _KEY] == key:
+                return base
+            if not self._state[base + _KEY]:
+                self._state[base + _KEY] = key
+                return base
+        return None
+
+    def allow(self, service, endpoint_class=None):
+        """Check that a call to the endpoint may be made now.
+
+        :raises: CircuitOpen if the endpoint's breaker is open
+        """
+        endpoint = _endpoint(service, endpoint_class)
+        now = time.time()
+        with self._lock:
+            base = self._find(endpoint)
+            if base is None:
+                return
+            state = self._state
+            if state[base + _STATE] == CLOSED:
+                return
+            if state[base + _STATE] == OPEN:
+                if now - state[base + _OPENED_AT] < self.reset_timeout:
+                    raise exception.CircuitOpen(endpoint=endpoint)
+                state[base + _STATE] = HALF_OPEN
+            elif now - state[base + _PROBE_AT] < self.reset_timeout:
+                # Another worker's probe is in flight. One
+                # that never reported back is given up on after a while.
+                raise exception.CircuitOpen(endpoint=endpoint)
+            state[base + _PROBE_AT] = now
+
+    def record_success(self, service, endpoint_class=None):
+        with self._lock:
+            base = self._find(_endpoint(service, endpoint_class))
+            if base is None:
+                return
+            if self._state[base + _STATE] != CLOSED:
+                LOG.info("Calls to %s succeed again",
+                         _endpoint(service, endpoint_class))
+            self._state[base + _STATE] = CLOSED
+            self._state[base + _FAILURES] = 0
+
+    def record_failure(self, service, endpoint_class=None):
+        endpoint = _endpoint(service, endpoint_class)
+        with self._lock:
+            base = self._find(endpoint)
+            if base is None:
+                return
+            state = self._state
+            state[base + _FAILURES] += 1
+            probing = state[base + _STATE] == HALF_OPEN
+            if probing or state[base + _FAILURES] >= self.failure_threshold:
+                if state[base + _STATE] == CLOSED:
+                    LOG.warning("Calls to %(endpoint)s failed %(count)d "
+                                "times in a row, failing them for "
+                                "%(timeout)s seconds",
+                                {'endpoint': endpoint,
+                                 'count': state[base + _FAILURES],
+                                 'timeout': self.reset_timeout})
+                state[base + _STATE] = OPEN
+                state[base + _OPENED_AT] = time.time()
+
+    def release_probe(self, service, endpoint_class=None):
+        """Let another probe through after one that proved nothing."""
+        with self._lock:
+            base = self._find(_endpoint(service, endpoint_class))
+            if base is None:
+                return
+            if self._state[base + _STATE] == HALF_OPEN:
+                self._state[base + _PROBE_AT] = 0
+
+    def state(self, service, endpoint_class=None):
+        """Return CLOSED, OPEN or HALF_OPEN."""
+        with self._lock:
+            base = self._find(_endpoint(service, endpoint_class))
+            if base is None:
+                return CLOSED
+            return int(self._state[base + _STATE])
+
+    def open_count(self):
+        """Return the number of breakers not closed."""
+        with self._lock:
+            return sum(1 for i in range(self.size)
+                       if self._state[i * _SLOTS + _STATE] != CLOSED)
+
+
+def init(conf, breakers):
+    """Make this process retry with conf's policy and use breakers."""
+    global _POLICY, _BREAKERS
+    _POLICY = RetryPolicy.from_config(conf)
+    _BREAKERS = breakers
+
+
+def call(service, endpoint_class, func, *args, **kwargs):
+    """Call func(*args, **kwargs) to make a call to a service's endpoint.
+
+    The call is held to the service's rate limits, guarded by the
+    endpoint's circuit breaker and retried while it fails for reasons
+    likely to pass. Pass idempotent=False for a call that must not be
+    made twice, such as a boot; it is only retried when the service
+    cannot have acted on it.
+
+    :raises: CircuitOpen if calls to the endpoint keep failing, or what
+             the last attempt raised
+    """
+    idempotent = kwargs.pop('idempotent', True)
+    policy = _POLICY or RetryPolicy(max_attempts=1)
+    breakers = _BREAKERS
+    attempt = 0
+    while True:
+        attempt += 1
+        if breakers is not None:
+            breakers.allow(service, endpoint_class)
+        try:
+            with ratelimit.limited(service, endpoint_class):
+                result = func(*args, **kwargs)
+        except exception.RateLimited:
+            # The limiter gave up before the call was made, which tells
+            # nothing of the endpoint.
+            if breakers is not None:
+                breakers.release_probe(service, endpoint_class)
+            raise
+        except Exception as exc:
+            if breakers is not None:
+                code = ratelimit.status_code(exc)
+                if code == 429:
+                    # The service is up and asks us to slow
+                    # down, which is the rate limiter's business. A probe
+                    # answered so tells nothing; let the next call probe
+                    # rather than hold the breaker half-open.
+                    breakers.release_probe(service, endpoint_class)
+                elif is_transient(exc):
+                    breakers.record_failure(service, endpoint_class)
+                else:
+                    # An error such as a 404 still shows the endpoint
+                    # works.
+                    breakers.record_success(service, endpoint_class)
+            if attempt >= policy.max_attempts:
+                raise
+            if not is_safe_to_retry(exc, idempotent):
+                raise
+            delay = policy.delay(attempt)
+            LOG.debug("Call to %(endpoint)s failed (%(error)s), retrying "
+                      "in %(delay).2f seconds",
+                      {'endpoint': _endpoint(service, endpoint_class),
+                       'error': exc, 'delay': delay})
+            time.sleep(delay)
+            continue
+        if breakers is not None:
+            breakers.record_success(service, endpoint_class)
+        return result
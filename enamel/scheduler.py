@@ -0,0 +1,263 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Ordering of the tasks waiting in a task processor.
+
+Tasks fall into priority classes by action. A task of a higher class
+always goes before tasks of lower classes. Within a class, projects
+share the workers by weighted fair queuing: each project has a virtual
+clock that advances by 1/weight for every task of the project started,
+and the next task comes from the project whose clock is furthest
+behind. A project that has been idle starts at the current virtual time,
+so it cannot save up a claim on the workers while it has nothing
+queued. A project with many queued tasks therefore only delays the
+others by its share, however deep its backlog.
+
+Fair share decides whose turn it is; which of that project's tasks goes
+is decided earliest deadline first, tasks without a deadline going after
+those with one, in the order they were queued. Tasks whose deadline
+passes while they are queued are not worth starting any more: expire()
+takes them out. As each queue is ordered by deadline, only the head of
+each needs looking at to find them.
+"""
+
+import collections
+import heapq
+import itertools
+import time
+
+import six
+
+
+class _Project(object):
+
+    def __init__(self, weight, virtual_time):
+        self.weight = weight
+        self.virtual_time = virtual_time
+        self.queues = collections.OrderedDict()
+        self.depth = 0
+
+    def head(self, eligible):
+        """Return the oldest queued task whose action is eligible."""
+        best = None
+        for action, queue in self.queues.items():
+            if eligible is not None and not eligible(action):
+                continue
+            if best is None or queue[0] < best:
+                best = queue[0]
+        return best
+
+
+class _Entry(object):
+
+    def __init__(self, seq, action, uuid, queued_at, deadline=None):
+        self.seq = seq
+        self.action = action
+        self.uuid = uuid
+        self.queued_at = queued_at
+        self.deadline = deadline
+        self.key = (float('inf') if deadline is None else deadline, seq)
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class _ClassStats(object):
+
+    def __init__(self):
+        self.started = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class FairShareScheduler(object):
+    """Queue tasks by priority class and fair share per project.
+
+    :param priorities: dict of action to priority class; higher classes
+                       go first and unlisted actions are in class 0
+    :param weights: dict of project_id to the project's share weight;
+                    unlisted projects have weight 1
+    """
+
+    def __init__(self, priorities=None, weights=None):
+        self._priorities = priorities or {}
+        self._weights = weights or {}
+        for action, priority in self._priorities.items():
+            if not isinstance(priority, six.integer_types):
+                raise ValueError("The priority of action %s must be an "
+                                 "integer, not %r" % (action, priority))
+        for project_id, weight in self._weights.items():
+            # A weight of 0 would stop the project's clock and a negative
+            # one turn it back, giving it all the workers.
+            if not 0 < weight < float('inf'):
+                raise ValueError("The weight of project %s must be a "
+                                 "positive number, not %r"
+                                 % (project_id, weight))
+        self._classes = {}
+        self._virtual_time = collections.defaultdict(float)
+        self._stats = collections.defaultdict(_ClassStats)
+        self._seq = itertools.count()
+        self._depth = 0
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf['task-processor']
+        priorities = {}
+        for action, priority in options.action_priorities.items():
+            try:
+                priorities[action] = int(priority)
+            except ValueError:
+                raise ValueError("The priority of action %s must be an "
+                                 "integer, not %s" % (action, priority))
+        weights = {}
+        for project_id, weight in options.project_weights.items():
+            try:
+                weights[project_id] = float(weight)
+            except ValueError:
+                raise ValueError("The weight of project %s must be a "
+                                 "positive number, not %s"
+                                 % (project_id, weight))
+        return cls(priorities=priorities, weights=weights)
+
+    def __len__(self):
+        return self._depth
+
+    def priority(self, action):
+        return self._priorities.get(action, 0)
+
+    def weight(self, project_id):
+        return self._weights.get(project_id, 1.0)
+
+    def push(self, action, uuid, project_id=None, deadline=None):
+        """Queue a task.
+
+        :param deadline: optional time, in seconds since the epoch, after
+                         which the task is not worth starting
+        """
+        priority = self.priority(action)
+        projects = self._classes.setdefault(priority, {})
+        project = projects.get(project_id)
+        if project is None:
+            project = _Project(self.weight(project_id),
+                               self._virtual_time[priority])
+            projects[project_id] = project
+        entry = _Entry(next(self._seq), action, uuid, time.time(), deadline)
+        heapq.heappush(project.queues.setdefault(action, []), entry)
+        project.depth += 1
+        self._depth += 1
+
+    def pop(self, eligible=None):
+        """Remove and return the next (action, uuid) to run.
+
+        :param eligible: optional callable telling whether a task of the
+                         given action may start now
+        :returns: (action, uuid), or None if no queued task may start
+        """
+        for priority in sorted(self._classes, reverse=True):
+            projects = self._classes[priority]
+            chosen = None
+            for project_id, project in projects.items():
+                entry = project.head(eligible)
+                if entry is None:
+                    continue
+                key = (project.virtual_time, entry.key)
+                if chosen is None or key < chosen[0]:
+                    chosen = (key, project_id, entry)
+            if chosen is None:
+                continue
+            _key, project_id, entry = chosen
+            self._started(priority, projects[project_id], entry)
+            self._remove(priority, project_id, entry)
+            return entry.action, entry.uuid
+        return None
+
+    def expire(self, now=None):
+        """Remove and return the queued tasks whose deadline has passed.
+
+        :returns: list of (action, uuid)
+        """
+        now = time.time() if now is None else now
+        expired = []
+        for priority, projects in list(self._classes.items()):
+            for project_id, project in list(projects.items()):
+                for queue in list(project.queues.values()):
+                    while queue and queue[0].deadline is not None and (
+                            queue[0].deadline < now):
+                        entry = queue[0]
+                        self._remove(priority, project_id, entry)
+                        expired.append((entry.action, entry.uuid))
+        return expired
+
+    def _remove(self, priority, project_id, entry):
+        """Remove entry, the head of its queue."""
+        projects = self._classes[priority]
+        project = projects[project_id]
+        queue = project.queues[entry.action]
+        heapq.heappop(queue)
+        if not queue:
+            del project.queues[entry.action]
+        project.depth -= 1
+        self._depth -= 1
+        if not project.depth:
+            del projects[project_id]
+            if not projects:
+                del self._classes[priority]
+
+    def _started(self, priority, project, entry):
+        self._virtual_time[priority] = max(self._virtual_time[priority],
+                                           project.virtual_time)
+        project.virtual_time += 1.0 / project.weight
+
+        wait = time.time() - entry.queued_at
+        stats = self._stats[priority]
+        stats.started += 1
+        stats.wait_total += wait
+        stats.wait_max = max(stats.wait_max, wait)
+
+    def entries(self):
+        """Return (action, uuid) for all queued tasks."""
+        return [(entry.action, entry.uuid)
+                for projects in self._classes.values()
+                for project in projects.values()
+                for queue in project.queues.values()
+                for entry in queue]
+
+    def uuids(self):
+        """Return the uuids of all queued tasks."""
+        return set(uuid for _action, uuid in self.entries())
+
+    def stats(self):
+        """Return queue depth and wait time statistics.
+
+        For each priority class this gives the number of queued tasks in
+        total and by project, how long the oldest of them has waited,
+        and the number of tasks started so far with the total and
+        longest time they waited. Times are in seconds.
+        """
+        now = time.time()
+        result = {}
+        for priority in set(self._classes) | set(self._stats):
+            projects = self._classes.get(priority, {})
+            oldest = min([entry.queued_at
+                          for project in projects.values()
+                          for queue in project.queues.values()
+                          for entry in queue] or [now])
+            stats = self._stats[priority]
+            result[priority] = {
+                'depth': sum(project.depth for project in projects.values()),
+                'projects': {project_id: project.depth
+                             for project_id, project in projects.items()},
+                'oldest_wait': now - oldest,
+                'started': stats.started,
+                'wait_total': stats.wait_total,
+                'wait_max': stats.wait_max,
+            }
+        return result
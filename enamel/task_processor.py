@@ -10,23 +10,805 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import timeutils
+from six.moves import queue
+
+from enamel import cache
+from enamel import clients
+from enamel import coalesce
+from enamel.db import utils as db_utils
+from enamel import dispatch
+from enamel import flow
+from enamel import metrics
+from enamel.objects import task as task_obj
+from enamel.objects import task_item as task_item_obj
+from enamel import opts
+from enamel import port_pool
+from enamel import ratelimit
+from enamel import retry
+from enamel import scheduler
+from enamel import watcher
+
+LOG = logging.getLogger(__name__)
+
+# Seconds the supervisor waits on worker results before it looks at
+# its workers and pending tasks again.
+SUPERVISE_INTERVAL = 0.5
+
+
+def _default_config():
+    conf = cfg.ConfigOpts()
+    for group, options in opts.list_opts():
+        conf.register_opts(list(options),
+                           group=None if group == "DEFAULT" else group)
+    return conf
+
+
+def _task_uuids(uuid):
+    """Return the uuids of a queued task or batch of tasks."""
+    return uuid if isinstance(uuid, tuple) else (uuid,)
+
+
+def _top_items(task):
+    """Return the items of task making up its flow."""
+    return task_item_obj.TaskItemList.get_by_task_id(
+        task.id, exclude_actions=sorted(flow.UNIT_ACTIONS))
+
+
+def _started(items):
+    return any(item.state == task_item_obj.COMPLETE for item in items)
+
+
+def _expire_if_overdue(task, items):
+    """Abandon task if its deadline passed before it was started.
+
+    A task partly run by a worker that died is seen through whatever
+    its deadline.
+
+    :returns: whether the task was abandoned
+    """
+    if not task.is_overdue() or _started(items):
+        return False
+    LOG.info("Task %(uuid)s (%(action)s) is past its deadline, "
+             "abandoning it", {'action': task.action, 'uuid': task.uuid})
+    _finish([task], task_obj.EXPIRED)
+    return True
+
+
+def _finish(tasks, state):
+    for task in tasks:
+        task.state = state
+        task.ended_at = timeutils.utcnow()
+        task.save()
+
+
+def _run_task(conf, task, items):
+    try:
+        flow.run_flow(conf, task, items)
+    except Exception:
+        _finish([task], task_obj.ERROR)
+        raise
+    _finish([task], task_obj.COMPLETE)
+
+
+def execute_task(conf, action, uuid):
+    """Run a single task inside a worker process.
+
+    :returns: whether the task ran, rather than being abandoned for
+              being past its deadline
+    """
+    task = task_obj.Task.get_by_uuid(uuid)
+    items = _top_items(task)
+    if _expire_if_overdue(task, items):
+        return False
+    _run_task(conf, task, items)
+    return True
+
+
+def execute_batch(conf, action, uuids):
+    """Run a batch of coalesced tasks inside a worker process.
+
+    :returns: whether every task of the batch succeeded
+    """
+    succeeded = True
+    tasks = []
+    items = []
+    for uuid in uuids:
+        task = task_obj.Task.get_by_uuid(uuid)
+        task_items = _top_items(task)
+        if _expire_if_overdue(task, task_items):
+            succeeded = False
+            continue
+        if not _started(task_items):
+            tasks.append(task)
+            items.append(task_items)
+            continue
+        # A task that was partly done by a worker that
+        # died resumes on its own, since the others did not share its
+        # first run.
+        try:
+            _run_task(conf, task, task_items)
+        except Exception:
+            succeeded = False
+            LOG.exception("Task %(uuid)s (%(action)s) failed",
+                          {'action': action, 'uuid': uuid})
+    if tasks:
+        try:
+            flow.run_batch(conf, tasks, items)
+        except Exception:
+            _finish(tasks, task_obj.ERROR)
+            raise
+        _finish(tasks, task_obj.COMPLETE)
+    return succeeded
+
+
+def _worker_main(conf, index, work_queue, result_queue, rate_limiter,
+                 breakers, metadata_cache):
+    """Run tasks handed out by the supervisor until told to stop.
+
+    A None on the work queue is the signal to exit. Each task taken
+    off the queue is acknowledged on the result queue, whatever its
+    outcome, so the supervisor can free its concurrency slot. The
+    acknowledgement carries the worker's metrics report.
+    """
+    # The supervisor decides when workers stop; don't
+    # let a ctrl-c sent to the process group kill a task halfway.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    db_utils.dispose()
+    clients.init(conf)
+    watcher.init(conf)
+    ratelimit.set_limiter(rate_limiter)
+    retry.init(conf, breakers)
+    cache.init(conf, metadata_cache)
+    # Don't report what the supervisor did before forking this worker.
+    metrics.take_report()
+    while True:
+        item = work_queue.get()
+        if item is None:
+            break
+        action, uuid = item
+        succeeded = True
+        try:
+            if isinstance(uuid, tuple):
+                succeeded = execute_batch(conf, action, uuid)
+            else:
+                succeeded = execute_task(conf, action, uuid)
+        except Exception:
+            succeeded = False
+            LOG.exception("Task %(uuid)s (%(action)s) failed",
+                          {'action': action, 'uuid': uuid})
+        result_queue.put((index, action, uuid, succeeded,
+                          metrics.take_report()))
+
+
+class _Worker(object):
+    """The supervisor's handle on one worker process."""
+
+    def __init__(self, index, process, work_queue):
+        self.index = index
+        self.process = process
+        self.work_queue = work_queue
+        self.task = None
+        self.started_at = None
 
 
 class TaskProcessor(object):
+    """Supervise a pool of worker processes executing tasks.
+
+    Tasks handed to the processor with submit() wait in a fair-share
+    scheduler, by priority class and project. The supervisor thread hands
+    them to idle workers in the order the scheduler picks, never running
+    more tasks of one action at once than that action's concurrency
+    limit allows, so that a flood of one kind of task cannot starve the
+    others.
+
+    Tasks of the actions listed in coalesce_actions are first held for
+    coalesce_window seconds, so that like tasks arriving meanwhile are
+    run together as a batch by a single worker.
+
+    Each project's tasks go earliest deadline first. Tasks whose deadline
+    passes before they start are abandoned in the expired state, whether
+    still pending in the database or queued here, so that under overload
+    the workers go to tasks that can still be of use.
+
+    The pool starts with min_workers workers and grows up to workers
+    while tasks wait for one, by as many as it takes to start the waiting
+    tasks within scale_drain_time going by how long their items usually
+    take. It grows at once but only shrinks, by stopping idle workers,
+    once it has had more workers than it needed for scale_down_delay.
+    """
     log = logging.getLogger(__name__)
 
     def __init__(self, config=None):
         self._running = False
+        if config is None:
+            config = _default_config()
         self._config = config
+        self._lock = threading.Lock()
+        self._scheduler = scheduler.FairShareScheduler.from_config(config)
+        self._coalescer = coalesce.Coalescer(
+            self._options.coalesce_window, self._options.coalesce_max_batch)
+        self._in_flight = collections.Counter()
+        self._rate_limiter = ratelimit.RateLimiter.from_config(config)
+        self._breakers = retry.CircuitBreakers.from_config(config)
+        self._metadata_cache = cache.SharedCache.from_config(config)
+        self._cache_stats_seen = (0, 0)
+        self._workers = {}
+        self._retired = []
+        self._next_worker_index = 0
+        self._last_scale = 0
+        self._surplus_since = None
+        self._supervisor = None
+        self._result_queue = None
+        self._transport = None
+        self._consumers = []
+        self._heartbeat_thread = None
+        self._port_pool_thread = None
+        self._stopped = threading.Event()
+        self._last_claim = 0
+        self.owner = '%s:%d' % (socket.gethostname(), os.getpid())
+        self._metrics_server = None
+        self._db_queries_seen = db_utils.query_count()
+        self._register_metrics()
+
+    def _register_metrics(self):
+        registry = self.metrics = metrics.Registry()
+        self._queued_metric = registry.gauge(
+            'enamel_tasks_queued',
+            'Claimed tasks waiting for a worker.', ['action'])
+        self._claimed_metric = registry.counter(
+            'enamel_tasks_claimed_total',
+            'Tasks claimed by this task processor.', ['action'])
+        self._expired_metric = registry.counter(
+            'enamel_tasks_expired_total',
+            'Queued tasks abandoned for being past their deadline.',
+            ['action'])
+        self._completed_metric = registry.counter(
+            'enamel_tasks_completed_total',
+            'Tasks run to completion or failure.', ['action', 'result'])
+        self._item_duration_metric = registry.histogram(
+            'enamel_task_item_duration_seconds',
+            'Time taken to run a task item.', ['action', 'state'])
+        self._item_latency_metric = registry.summary(
+            'enamel_task_item_latency_seconds',
+            'Quantiles of the time taken to run a task item.', ['action'])
+        self._item_queue_wait_metric = registry.summary(
+            'enamel_task_item_queue_wait_seconds',
+            'Quantiles of the time a task item waited to start.',
+            ['action'])
+        self._workers_metric = registry.gauge(
+            'enamel_workers', 'Worker processes.')
+        self._busy_workers_metric = registry.gauge(
+            'enamel_workers_busy', 'Worker processes running a task.')
+        self._scaled_metric = registry.counter(
+            'enamel_worker_scaling_total',
+            'Worker processes started or stopped to resize the pool.',
+            ['direction'])
+        self._busy_seconds_metric = registry.counter(
+            'enamel_worker_busy_seconds_total',
+            'Time worker processes spent running tasks.')
+        self._open_breakers_metric = registry.gauge(
+            'enamel_circuit_breakers_open',
+            'Service endpoints whose calls are failed without being made.')
+        self._cache_lookups_metric = registry.counter(
+            'enamel_metadata_cache_lookups_total',
+            'Image and flavor lookups by workers.', ['result'])
+        self._db_queries_metric = registry.counter(
+            'enamel_db_queries_total',
+            'Statements sent to the database.', ['process'])
+        registry.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        queued = collections.Counter()
+        with self._lock:
+            for action, uuid in self._scheduler.entries():
+                queued[action] += len(_task_uuids(uuid))
+            queued.update(self._coalescer.depth_by_action())
+        self._queued_metric.replace(
+            {(action, ): count for action, count in queued.items()})
+        workers = list(self._workers.values())
+        self._workers_metric.set(len(workers))
+        self._busy_workers_metric.set(
+            sum(1 for worker in workers if worker.task is not None))
+        self._open_breakers_metric.set(self._breakers.open_count())
+        hits, misses = self._metadata_cache.stats()
+        seen_hits, seen_misses = self._cache_stats_seen
+        self._cache_lookups_metric.inc(hits - seen_hits, result='hit')
+        self._cache_lookups_metric.inc(misses - seen_misses, result='miss')
+        self._cache_stats_seen = (hits, misses)
+        queries = db_utils.query_count()
+        self._db_queries_metric.inc(queries - self._db_queries_seen,
+                                    process='supervisor')
+        self._db_queries_seen = queries
+
+    def _record_report(self, report):
+        for action, state, seconds, queue_wait in report['items']:
+            self._item_duration_metric.observe(seconds, action=action,
+                                               state=state)
+            self._item_latency_metric.observe(seconds, action=action)
+            if queue_wait is not None:
+                self._item_queue_wait_metric.observe(queue_wait,
+                                                     action=action)
+        self._db_queries_metric.inc(report['db_queries'], process='worker')
+
+    @property
+    def _options(self):
+        return self._config['task-processor']
+
+    @property
+    def worker_count(self):
+        """Return the most workers the pool may grow to."""
+        return self._options.workers or multiprocessing.cpu_count()
+
+    @property
+    def min_worker_count(self):
+        """Return the fewest workers the pool may shrink to."""
+        return min(self._options.min_workers, self.worker_count)
+
+    def action_limit(self, action):
+        """Return how many tasks of the action may run at once."""
+        limit = self._options.action_concurrency.get(action)
+        if limit is None:
+            limit = self._options.default_action_concurrency
+        limit = int(limit)
+        if limit <= 0 or limit > self.worker_count:
+            return self.worker_count
+        return limit
 
     def is_running(self):
         return self._running
 
+    def submit(self, action, uuid, project_id=None, deadline=None):
+        """Queue a task for execution by the worker pool.
+
+        :param deadline: optional time, in seconds since the epoch, after
+                         which the task is not worth starting
+        """
+        with self._lock:
+            self._scheduler.push(action, uuid, project_id, deadline)
+
+    def stats(self):
+        """Return scheduler queue depth and wait time statistics."""
+        with self._lock:
+            return self._scheduler.stats()
+
+    def item_latency(self, action, quantile):
+        """Return an estimate of a quantile of an action's item durations.
+
+        :returns: seconds, or NaN if no item of the action has run yet
+        """
+        return self._item_latency_metric.quantile(quantile, action=action)
+
     def stop(self):
+        if not self._running:
+            return
         self._running = False
+        self._stopped.set()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        if self._port_pool_thread is not None:
+            self._port_pool_thread.join()
+            self._port_pool_thread = None
+        for consumer, thread in self._consumers:
+            thread.join()
+            consumer.close()
+        self._consumers = []
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._supervisor is not None:
+            self._supervisor.join()
+            self._supervisor = None
+        for worker in self._workers.values():
+            worker.work_queue.put(None)
+        for worker in list(self._workers.values()) + self._retired:
+            worker.process.join()
+        self._workers = {}
+        self._retired = []
 
     def run(self):
         """Main execution loop."""
         self._running = True
-        return
+        self._stopped.clear()
+        self._result_queue = multiprocessing.Queue()
+        for _i in range(self.min_worker_count):
+            self._spawn_worker()
+        self._supervisor = threading.Thread(target=self._supervise)
+        self._supervisor.daemon = True
+        self._supervisor.start()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat)
+        self._heartbeat_thread.daemon = True
+        self._heartbeat_thread.start()
+        self._start_consumers()
+        self._start_metrics_server()
+        self._start_port_pools()
+
+    def _start_metrics_server(self):
+        try:
+            self._metrics_server = metrics.MetricsServer(
+                self.metrics, self._options.bind_address,
+                self._options.bind_port)
+        except Exception:
+            self.log.exception("Unable to serve metrics on %(address)s:"
+                               "%(port)s",
+                               {'address': self._options.bind_address,
+                                'port': self._options.bind_port})
+            return
+        self._metrics_server.start()
+
+    def _start_port_pools(self):
+        if not self._config['port-pool'].pools:
+            return
+        # The pools' neutron calls share the workers'
+        # rate limits.
+        ratelimit.set_limiter(self._rate_limiter)
+        retry.init(self._config, self._breakers)
+        try:
+            pools = port_pool.PortPools.from_config(self._config)
+        except Exception:
+            self.log.exception("Unable to keep pools of ports")
+            return
+        self._port_pool_thread = threading.Thread(
+            target=self._maintain_port_pools, args=(pools,))
+        self._port_pool_thread.daemon = True
+        self._port_pool_thread.start()
+
+    def _maintain_port_pools(self, pools):
+        while True:
+            try:
+                pools.maintain()
+            except Exception:
+                self.log.exception("Unable to maintain the pools of ports")
+            if self._stopped.wait(self._config['port-pool'].interval):
+                return
+
+    def _held_tasks(self):
+        """Return the uuids of the claimed tasks not yet finished."""
+        with self._lock:
+            queued = self._scheduler.uuids()
+            held = self._coalescer.uuids()
+        queued.update(worker.task[1] for worker in list(self._workers.values())
+                      if worker.task is not None)
+        for uuid in queued:
+            held.update(_task_uuids(uuid))
+        return held
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self._options.heartbeat_interval):
+            self._renew_leases()
+
+    def _renew_leases(self):
+        """Renew the leases of held tasks and reap expired ones."""
+        held = self._held_tasks()
+        try:
+            renewed = task_obj.Task.renew_leases(
+                self.owner, held, lease_time=self._options.lease_time)
+            if renewed < len(held):
+                # Tasks that finished since we looked are
+                # not renewed either, so this is not necessarily a lost
+                # lease.
+                self.log.debug("%d held tasks were finished or lost their "
+                               "lease", len(held) - renewed)
+            reaped = task_obj.Task.reap_expired_leases()
+            if reaped:
+                self.log.info("Handed out again %d tasks whose lease "
+                              "expired", reaped)
+            expired = task_obj.Task.expire_overdue()
+            if expired:
+                self.log.info("Abandoned %d pending tasks past their "
+                              "deadline", expired)
+        except Exception:
+            self.log.exception("Unable to renew task leases")
+
+    def _start_consumers(self):
+        try:
+            self._transport = dispatch.get_transport(self._config)
+        except Exception:
+            self.log.exception("Unable to consume dispatched tasks, "
+                               "relying on claiming them from the database")
+            return
+        if self._transport is None:
+            return
+        for topic in self._options.topics or [dispatch.DEFAULT_TOPIC]:
+            try:
+                consumer = self._transport.consumer(topic)
+            except Exception:
+                self.log.exception("Unable to consume tasks dispatched to "
+                                   "%s, relying on claiming them from the "
+                                   "database", topic)
+                continue
+            thread = threading.Thread(target=self._consume,
+                                      args=(consumer,))
+            thread.daemon = True
+            thread.start()
+            self._consumers.append((consumer, thread))
+
+    def _consume(self, consumer):
+        while self._running:
+            message = consumer.receive(SUPERVISE_INTERVAL)
+            if message is None:
+                continue
+            messages = [message]
+            while len(messages) < self._options.claim_batch_size:
+                message = consumer.receive(0)
+                if message is None:
+                    break
+                messages.append(message)
+            self._claim_dispatched(messages)
+
+    def _claim_dispatched(self, messages):
+        """Claim the tasks announced by a batch of dispatch messages."""
+        uuids = []
+        for message in messages:
+            try:
+                uuids.append(dispatch.decode_task(message).uuid)
+            except Exception:
+                self.log.exception("Ignoring undecodable task message")
+        if not uuids:
+            return
+        try:
+            tasks = task_obj.Task.claim(self.owner, len(uuids), uuids=uuids,
+                                        lease_time=self._options.lease_time)
+        except Exception:
+            self.log.exception("Unable to claim dispatched tasks")
+            return
+        self._accept(tasks)
+        if tasks:
+            # Wake the supervisor so the tasks start now rather than
+            # on its next pass.
+            self._result_queue.put(None)
+
+    def _spawn_worker(self):
+        index = self._next_worker_index
+        self._next_worker_index += 1
+        work_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_worker_main,
+            args=(self._config, index, work_queue, self._result_queue,
+                  self._rate_limiter, self._breakers,
+                  self._metadata_cache))
+        process.daemon = True
+        process.start()
+        worker = _Worker(index, process, work_queue)
+        self._workers[index] = worker
+        return worker
+
+    def _supervise(self):
+        while self._running:
+            try:
+                self._supervise_once()
+            except Exception:
+                # A pass that failed must not leave the queued tasks with
+                # no one to hand them out.
+                self.log.exception("Unable to supervise the workers")
+                self._stopped.wait(SUPERVISE_INTERVAL)
+
+    def _supervise_once(self):
+        self._collect_results(SUPERVISE_INTERVAL)
+        self._replace_dead_workers()
+        self._claim()
+        self._flush_batches()
+        self._expire_overdue()
+        self._autoscale()
+        self._dispatch()
+
+    def _claim(self):
+        """Claim pending tasks from the database for idle workers."""
+        interval = self._options.claim_interval
+        now = time.time()
+        if not interval or now - self._last_claim < interval:
+            return
+        with self._lock:
+            waiting = len(self._scheduler) + len(self._coalescer)
+        idle = sum(1 for worker in self._workers.values()
+                   if worker.task is None)
+        # Claim for the workers the pool may still grow by as well, so
+        # that the backlog it grows on can build up.
+        spare = max(0, self.worker_count - len(self._workers))
+        wanted = min(idle + spare - waiting, self._options.claim_batch_size)
+        if wanted <= 0:
+            return
+        self._last_claim = now
+        try:
+            tasks = task_obj.Task.claim(self.owner, wanted,
+                                        actions=self._options.topics,
+                                        lease_time=self._options.lease_time)
+        except Exception:
+            self.log.exception("Unable to claim pending tasks")
+            return
+        self._accept(tasks)
+
+    def _accept(self, tasks):
+        """Queue claimed tasks, holding back those to be coalesced."""
+        for task in tasks:
+            self._claimed_metric.inc(action=task.action)
+            coalesced = task.action in self._options.coalesce_actions
+            if self._options.coalesce_window and coalesced:
+                with self._lock:
+                    self._coalescer.add(task)
+            else:
+                self.submit(task.action, task.uuid, task.project_id,
+                            task.deadline_time())
+
+    def _flush_batches(self):
+        """Queue the batches of coalesced tasks whose window is over."""
+        with self._lock:
+            ready = self._coalescer.ready()
+        for action, uuids, project_id, deadline in ready:
+            if len(uuids) == 1:
+                uuids = uuids[0]
+            self.submit(action, uuids, project_id, deadline)
+
+    def _expire_overdue(self):
+        """Abandon the queued tasks whose deadline passed meanwhile."""
+        with self._lock:
+            expired = self._scheduler.expire()
+        if not expired:
+            return
+        uuids = set()
+        for action, uuid in expired:
+            uuids.update(_task_uuids(uuid))
+            self._expired_metric.inc(len(_task_uuids(uuid)), action=action)
+        self.log.info("Abandoned %d queued tasks past their deadline",
+                      len(uuids))
+        try:
+            task_obj.Task.expire(self.owner, uuids)
+        except Exception:
+            # No longer held, their leases run out and
+            # they are expired once back to pending.
+            self.log.exception("Unable to expire overdue tasks")
+
+    def _collect_results(self, timeout):
+        """Wait for worker results and account for all that arrived.
+
+        A None result only wakes the supervisor up.
+        """
+        try:
+            result = self._result_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            if result is not None:
+                index, action, uuid, succeeded, report = result
+                worker = self._workers.get(index)
+                if worker is not None:
+                    self._busy_seconds_metric.inc(
+                        time.time() - worker.started_at)
+                    worker.task = None
+                self._record_report(report)
+                self._task_done(action, uuid, succeeded)
+            try:
+                result = self._result_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _task_done(self, action, uuid, succeeded):
+        self._completed_metric.inc(len(_task_uuids(uuid)), action=action,
+                                   result='success' if succeeded
+                                   else 'failure')
+        with self._lock:
+            self._in_flight[action] -= 1
+            if self._in_flight[action] <= 0:
+                del self._in_flight[action]
+
+    def _replace_dead_workers(self):
+        self._retired = [worker for worker in self._retired
+                         if worker.process.is_alive()]
+        for worker in list(self._workers.values()):
+            if worker.process.is_alive():
+                continue
+            self.log.warning("Worker %(pid)s exited with %(code)s, "
+                             "replacing it",
+                             {'pid': worker.process.pid,
+                              'code': worker.process.exitcode})
+            del self._workers[worker.index]
+            if worker.task is not None:
+                action, uuid = worker.task
+                self._task_done(action, uuid, False)
+            self._spawn_worker()
+
+    def desired_workers(self):
+        """Return how many workers the running and waiting tasks need.
+
+        Waiting tasks that their action's concurrency limit keeps from
+        starting need no worker. The others are counted as taking as
+        long as their action's median task item; until an item of the
+        action has run, each is given a worker of its own.
+        """
+        drain_time = self._options.scale_drain_time
+        queued = collections.Counter()
+        with self._lock:
+            for action, _uuid in self._scheduler.entries():
+                queued[action] += 1
+            in_flight = collections.Counter(self._in_flight)
+        wanted = sum(1 for worker in self._workers.values()
+                     if worker.task is not None)
+        for action, count in queued.items():
+            slots = max(0, self.action_limit(action) - in_flight[action])
+            latency = self.item_latency(action, 0.5)
+            if math.isnan(latency):
+                latency = drain_time
+            wanted += min(slots, count,
+                          int(math.ceil(count * latency / drain_time)))
+        return max(self.min_worker_count, min(self.worker_count, wanted))
+
+    def _autoscale(self):
+        """Grow or shrink the worker pool to the workers needed."""
+        now = time.time()
+        if now - self._last_scale < self._options.scale_interval:
+            return
+        self._last_scale = now
+        desired = self.desired_workers()
+        current = len(self._workers)
+        if desired >= current:
+            self._surplus_since = None
+            if desired > current:
+                self.log.info("Growing the worker pool from %(current)d to "
+                              "%(desired)d workers",
+                              {'current': current, 'desired': desired})
+                for _i in range(desired - current):
+                    self._spawn_worker()
+                self._scaled_metric.inc(desired - current, direction='up')
+            return
+        if self._surplus_since is None:
+            self._surplus_since = now
+        if now - self._surplus_since < self._options.scale_down_delay:
+            return
+        self._surplus_since = None
+        self._retire_workers(current - desired)
+
+    def _retire_workers(self, count):
+        """Stop up to count idle workers, the newest first."""
+        idle = sorted((worker for worker in self._workers.values()
+                       if worker.task is None),
+                      key=lambda worker: worker.index, reverse=True)[:count]
+        if not idle:
+            return
+        self.log.info("Shrinking the worker pool from %(current)d to "
+                      "%(desired)d workers",
+                      {'current': len(self._workers),
+                       'desired': len(self._workers) - len(idle)})
+        for worker in idle:
+            del self._workers[worker.index]
+            worker.work_queue.put(None)
+            self._retired.append(worker)
+        self._scaled_metric.inc(len(idle), direction='down')
+
+    def _next_batch(self, free):
+        """Pick up to free queued tasks to start now."""
+        def eligible(action):
+            return self._in_flight[action] < self.action_limit(action)
+
+        batch = []
+        with self._lock:
+            while free > 0:
+                item = self._scheduler.pop(eligible)
+                if item is None:
+                    break
+                batch.append(item)
+                self._in_flight[item[0]] += 1
+                free -= 1
+        return batch
+
+    def _dispatch(self):
+        idle = [worker for worker in self._workers.values()
+                if worker.task is None]
+        for worker, item in zip(idle, self._next_batch(len(idle))):
+            worker.task = item
+            worker.started_at = time.time()
+            worker.work_queue.put(item)
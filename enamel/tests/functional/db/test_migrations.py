@@ -143,6 +143,41 @@ class WalkVersionsMixin(object):
         task_items_table = sql_utils.get_table(engine, 'task_items')
         self.assertIsNotNone(task_items_table)
 
+    def _check_c5a5f99b9b54(self, engine, data):
+        tasks_table = sql_utils.get_table(engine, 'tasks')
+        self.assertIn('owner', tasks_table.c)
+
+    def _check_1afe71bdc4e6(self, engine, data):
+        task_items_table = sql_utils.get_table(engine, 'task_items')
+        self.assertIn('result', task_items_table.c)
+
+    def _check_70e723baa548(self, engine, data):
+        tasks_table = sql_utils.get_table(engine, 'tasks')
+        self.assertIn('lease_expires_at', tasks_table.c)
+
+    def _check_5d1b3c2a9e47(self, engine, data):
+        task_items_table = sql_utils.get_table(engine, 'task_items')
+        self.assertIn('started_at', task_items_table.c)
+        self.assertIn('queue_wait', task_items_table.c)
+
+    def _check_b3e8f61c0d25(self, engine, data):
+        tasks_table = sql_utils.get_table(engine, 'tasks')
+        self.assertIn('deadline', tasks_table.c)
+
+    def _check_e91a4c07b8d3(self, engine, data):
+        pooled_ports_table = sql_utils.get_table(engine, 'pooled_ports')
+        self.assertIn('port_id', pooled_ports_table.c)
+
+    def _check_a4c2d9e87f13(self, engine, data):
+        tasks_table = sql_utils.get_table(engine, 'tasks')
+        self.assertIn(['project_id', 'created_at', 'id'],
+                      [[column.name for column in index.columns]
+                       for index in tasks_table.indexes])
+
+    def _check_d7f3a1c58e20(self, engine, data):
+        pooled_ports_table = sql_utils.get_table(engine, 'pooled_ports')
+        self.assertIn('taken_at', pooled_ports_table.c)
+
 
 class TestMigrationsSQLite(WalkVersionsMixin,
                            test_base.DbTestCase):
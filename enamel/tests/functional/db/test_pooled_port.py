@@ -0,0 +1,200 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+import mock
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+
+from enamel.objects import pooled_port
+from enamel import port_pool
+from enamel.tests import fixtures
+from enamel.tests.unit import base as test_base
+
+NETWORK = '5d6d3fb4-2a8e-4d4e-9b3c-1b9d5a0b9a11'
+OTHER_NETWORK = '0e0c4c1c-7e4b-4b8a-8f0e-6a0f3d2c8b22'
+
+
+def _pool_port(project_id='a', network_id=NETWORK, **updates):
+    updates.setdefault('port_id', uuidutils.generate_uuid())
+    updates.update(project_id=project_id, network_id=network_id)
+    return pooled_port.PooledPort._create_in_db(updates)
+
+
+class PooledPortTestCase(test_base.DBTestCase):
+    def setUp(self):
+        super(PooledPortTestCase, self).setUp()
+        self.useFixture(fixtures.Database())
+
+    def test_take_oldest(self):
+        ports = [_pool_port() for _i in range(2)]
+        _pool_port(project_id='b')
+
+        taken = pooled_port.PooledPort.take('a', NETWORK)
+        self.assertEqual(ports[0].port_id, taken.port_id)
+        self.assertEqual(ports[1].port_id,
+                         port_pool.take_port('a', NETWORK))
+        self.assertIsNone(pooled_port.PooledPort.take('a', NETWORK))
+        self.assertIsNone(port_pool.take_port('a', OTHER_NETWORK))
+
+    def test_taken_port_keeps_its_row(self):
+        port = _pool_port()
+        port_pool.take_port('a', NETWORK)
+        self.assertEqual({}, pooled_port.PooledPortList.count_by_pool())
+        self.assertEqual(set([port.port_id]),
+                         pooled_port.PooledPortList.get_port_ids())
+        self.assertEqual([], pooled_port.PooledPortList.get_created_before(
+            timeutils.utcnow() + datetime.timedelta(hours=1)).objects)
+
+    def test_port_is_taken_once(self):
+        port = pooled_port.PooledPort._from_db_object(
+            pooled_port.PooledPort(), _pool_port())
+        self.assertTrue(port.destroy())
+        self.assertFalse(port.destroy())
+
+    def test_count_by_pool(self):
+        _pool_port()
+        _pool_port()
+        _pool_port(network_id=OTHER_NETWORK)
+        self.assertEqual({('a', NETWORK): 2, ('a', OTHER_NETWORK): 1},
+                         pooled_port.PooledPortList.count_by_pool())
+
+    def test_get_created_before(self):
+        now = timeutils.utcnow()
+        old = _pool_port(created_at=now - datetime.timedelta(hours=2))
+        _pool_port(created_at=now)
+        self.assertEqual(
+            [old.port_id],
+            [port.port_id for port in
+             pooled_port.PooledPortList.get_created_before(
+                 now - datetime.timedelta(hours=1))])
+
+
+class PortPoolsTestCase(test_base.DBTestCase):
+    def setUp(self):
+        super(PortPoolsTestCase, self).setUp()
+        self.useFixture(fixtures.Database())
+        self.neutron = mock.Mock()
+        self.neutron.create_port.side_effect = lambda body: {
+            'port': {'id': uuidutils.generate_uuid()}}
+        self.neutron.list_ports.return_value = {'ports': []}
+        client_pool = mock.Mock()
+        client_pool.client.return_value = self.neutron
+        self.pools = port_pool.PortPools(
+            [('a', NETWORK)], low_watermark=2, high_watermark=4,
+            max_age=3600, credentials={'handle': 'admin'},
+            client_pool=client_pool)
+
+    def _count(self):
+        return pooled_port.PooledPortList.count_by_pool().get(
+            ('a', NETWORK), 0)
+
+    def test_top_up_below_low_watermark(self):
+        self.pools.maintain()
+        self.assertEqual(4, self._count())
+        self.neutron.create_port.assert_called_with(
+            {'port': {'name': port_pool.PORT_NAME, 'network_id': NETWORK,
+                      'project_id': 'a'}})
+
+        port_pool.take_port('a', NETWORK)
+        self.pools.maintain()
+        self.assertEqual(3, self._count())
+        port_pool.take_port('a', NETWORK)
+        port_pool.take_port('a', NETWORK)
+        self.pools.maintain()
+        self.assertEqual(4, self._count())
+        self.assertEqual(7, self.neutron.create_port.call_count)
+
+    def test_collect_garbage(self):
+        two_hours_ago = timeutils.utcnow() - datetime.timedelta(hours=2)
+        old = _pool_port(created_at=two_hours_ago)
+        _pool_port()
+        unkept = _pool_port(project_id='gone')
+
+        self.assertEqual(2, self.pools.collect_garbage())
+        self.assertEqual(
+            sorted([mock.call(old.port_id), mock.call(unkept.port_id)]),
+            sorted(self.neutron.delete_port.call_args_list))
+        self.assertEqual({('a', NETWORK): 1},
+                         pooled_port.PooledPortList.count_by_pool())
+
+    def test_empty_pool_is_topped_up_without_low_watermark(self):
+        self.pools.low_watermark = 0
+        self.pools.maintain()
+        self.assertEqual(4, self._count())
+        port_pool.take_port('a', NETWORK)
+        self.pools.maintain()
+        self.assertEqual(3, self._count())
+
+    def test_failing_pool_does_not_starve_others(self):
+        self.pools.pools = [('a', NETWORK), ('a', OTHER_NETWORK)]
+        create_port = self.neutron.create_port.side_effect
+
+        def fail_on_network(body):
+            if body['port']['network_id'] == NETWORK:
+                raise Exception('no more addresses')
+            return create_port(body)
+
+        self.neutron.create_port.side_effect = fail_on_network
+        self.pools.maintain()
+        self.assertEqual({('a', OTHER_NETWORK): 4},
+                         pooled_port.PooledPortList.count_by_pool())
+
+    def test_reconcile_deletes_orphans(self):
+        pooled = _pool_port()
+        orphan = uuidutils.generate_uuid()
+        self.neutron.list_ports.return_value = {'ports': [
+            {'id': pooled.port_id, 'device_id': ''},
+            {'id': orphan, 'device_id': ''},
+            {'id': uuidutils.generate_uuid(), 'device_id': 'server'},
+        ]}
+
+        # The orphan may only be waiting for its row.
+        self.assertEqual(0, self.pools.reconcile())
+        self.neutron.list_ports.assert_called_with(name=port_pool.PORT_NAME)
+        self.assertEqual(1, self.pools.reconcile())
+        self.neutron.delete_port.assert_called_once_with(orphan)
+
+    def test_reconcile_spares_ports_recorded_meanwhile(self):
+        port_id = uuidutils.generate_uuid()
+        self.neutron.list_ports.return_value = {'ports': [
+            {'id': port_id, 'device_id': ''}]}
+        self.assertEqual(0, self.pools.reconcile())
+        _pool_port(port_id=port_id)
+        self.assertEqual(0, self.pools.reconcile())
+        self.assertFalse(self.neutron.delete_port.called)
+
+    def test_reconcile_spares_taken_ports(self):
+        port = _pool_port()
+        port_pool.take_port('a', NETWORK)
+        # The boot it was taken for has yet to bind it.
+        self.neutron.list_ports.return_value = {'ports': [
+            {'id': port.port_id, 'device_id': ''}]}
+        self.assertEqual(0, self.pools.reconcile())
+        self.assertEqual(0, self.pools.reconcile())
+        self.assertFalse(self.neutron.delete_port.called)
+
+    def test_collect_garbage_forgets_long_taken_ports(self):
+        now = timeutils.utcnow()
+        _pool_port(taken_at=now - datetime.timedelta(hours=2))
+        recent = _pool_port(taken_at=now)
+        self.assertEqual(0, self.pools.collect_garbage())
+        self.assertEqual(set([recent.port_id]),
+                         pooled_port.PooledPortList.get_port_ids())
+        self.assertFalse(self.neutron.delete_port.called)
+
+    def test_parse_pools(self):
+        self.assertEqual([('a', NETWORK)],
+                         port_pool.parse_pools(['a:%s' % NETWORK]))
+        self.assertRaises(ValueError, port_pool.parse_pools, ['a'])
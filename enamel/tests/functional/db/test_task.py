@@ -12,10 +12,15 @@
 # limitations under the License.
 
 
+import datetime
+
+from oslo_db import exception as db_exc
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from enamel.objects import exception as obj_exception
 from enamel.objects import task
+from enamel.objects import task_item
 from enamel.tests import fixtures
 from enamel.tests.unit import base as test_base
 
@@ -36,8 +41,9 @@ class TaskTestCase(test_base.DBTestCase):
             'params': '',
     }
 
-    def _create_task(self):
+    def _create_task(self, **updates):
         args = self._sample_task.copy()
+        args.update(updates)
         return self._task_obj._create_in_db(args)
 
     def test_get_by_uuid(self):
@@ -50,3 +56,220 @@ class TaskTestCase(test_base.DBTestCase):
         uuid = uuidutils.generate_uuid()
         self.assertRaisesRegexp(obj_exception.TaskNotFound, 'Task %s' % uuid,
                                 self._task_obj._get_by_uuid_from_db, uuid)
+
+    def test_save(self):
+        created = self._create_task(uuid=uuidutils.generate_uuid())
+        tsk = task.Task.get_by_uuid(created.uuid)
+        tsk.state = task.COMPLETE
+        tsk.save()
+        self.assertEqual({}, tsk.obj_get_changes())
+        self.assertEqual(task.COMPLETE,
+                         task.Task.get_by_uuid(created.uuid).state)
+
+    def _create_pending_tasks(self, count):
+        return [self._create_task(uuid=uuidutils.generate_uuid(),
+                                  state=task.PENDING)
+                for _i in range(count)]
+
+    def test_create_with_items(self):
+        new = task.Task(**dict(self._sample_task,
+                               uuid=uuidutils.generate_uuid()))
+        item = task_item.TaskItem(uuid=uuidutils.generate_uuid(),
+                                  action='boot_server',
+                                  state=task_item.PENDING)
+        new.create_with_items([item])
+        self.assertEqual(new.id, item.task_id)
+        self.assertEqual(
+            [item.uuid],
+            [i.uuid for i in task_item.TaskItemList.get_by_task_id(new.id)])
+
+    def test_create_with_items_is_atomic(self):
+        uuid = uuidutils.generate_uuid()
+        new = task.Task(**dict(self._sample_task, uuid=uuid))
+        # An item without a state cannot be stored.
+        item = task_item.TaskItem(uuid=uuidutils.generate_uuid(),
+                                  action='boot_server')
+        self.assertRaises(db_exc.DBError, new.create_with_items, [item])
+        self.assertRaises(obj_exception.TaskNotFound, task.Task.get_by_uuid,
+                          uuid)
+
+    def test_claim(self):
+        pending = self._create_pending_tasks(3)
+        self._create_task(uuid=uuidutils.generate_uuid())
+
+        claimed = task.Task.claim('host-a', limit=2)
+        self.assertEqual([t.uuid for t in pending[:2]],
+                         [t.uuid for t in claimed])
+        for claimed_task in claimed:
+            self.assertEqual(task.RUNNING, claimed_task.state)
+            self.assertEqual('host-a', claimed_task.owner)
+
+    def test_claim_does_not_share_tasks(self):
+        pending = self._create_pending_tasks(3)
+
+        first = task.Task.claim('host-a', limit=2)
+        second = task.Task.claim('host-b', limit=2)
+        self.assertEqual([pending[2].uuid], [t.uuid for t in second])
+        self.assertEqual([], task.Task.claim('host-c', limit=2))
+        self.assertEqual('host-a',
+                         task.Task.get_by_uuid(first[0].uuid).owner)
+
+    def test_claim_by_uuid(self):
+        pending = self._create_pending_tasks(3)
+
+        claimed = task.Task.claim('host-a', limit=3,
+                                  uuids=[pending[1].uuid, pending[2].uuid])
+        self.assertEqual([pending[1].uuid, pending[2].uuid],
+                         [t.uuid for t in claimed])
+        self.assertEqual([], task.Task.claim('host-b',
+                                             uuids=[pending[1].uuid]))
+
+    def test_claim_by_action(self):
+        self._create_pending_tasks(2)
+        volume = self._create_task(uuid=uuidutils.generate_uuid(),
+                                   action='create_volume',
+                                   state=task.PENDING)
+
+        claimed = task.Task.claim('host-a', limit=3,
+                                  actions=['create_volume'])
+        self.assertEqual([volume.uuid], [t.uuid for t in claimed])
+
+    def test_claim_sets_lease(self):
+        self._create_pending_tasks(1)
+        before = timeutils.utcnow()
+        claimed = task.Task.claim('host-a', lease_time=30)[0]
+        self.assertGreaterEqual(claimed.lease_expires_at.replace(tzinfo=None),
+                                before + datetime.timedelta(seconds=30))
+
+    def test_renew_leases(self):
+        pending = self._create_pending_tasks(3)
+        claimed = task.Task.claim('host-a', limit=2, lease_time=1)
+        task.Task.claim('host-b', limit=1, lease_time=1)
+        uuids = [t.uuid for t in claimed]
+
+        self.assertEqual(2, task.Task.renew_leases('host-a', uuids,
+                                                   lease_time=300))
+        # Only the owner can renew a lease.
+        self.assertEqual(0, task.Task.renew_leases('host-b', uuids))
+        renewed = task.Task.get_by_uuid(pending[0].uuid)
+        later = timeutils.utcnow() + datetime.timedelta(seconds=200)
+        self.assertGreater(renewed.lease_expires_at.replace(tzinfo=None),
+                           later)
+
+    def test_reap_expired_leases(self):
+        pending = self._create_pending_tasks(2)
+        task.Task.claim('host-a', limit=1, lease_time=-1)
+        task.Task.claim('host-b', limit=1, lease_time=300)
+
+        self.assertEqual(1, task.Task.reap_expired_leases())
+        reaped = task.Task.get_by_uuid(pending[0].uuid)
+        self.assertEqual(task.PENDING, reaped.state)
+        self.assertIsNone(reaped.owner)
+        self.assertEqual([pending[0].uuid],
+                         [t.uuid for t in task.Task.claim('host-c')])
+
+    def test_claim_nothing_pending(self):
+        self._create_task()
+        self.assertEqual([], task.Task.claim('host-a', limit=5))
+
+    def test_expire_overdue(self):
+        past = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        future = timeutils.utcnow() + datetime.timedelta(seconds=300)
+        late = self._create_task(uuid=uuidutils.generate_uuid(),
+                                 state=task.PENDING, deadline=past)
+        soon = self._create_task(uuid=uuidutils.generate_uuid(),
+                                 state=task.PENDING, deadline=future)
+        whenever = self._create_pending_tasks(1)[0]
+
+        self.assertEqual(1, task.Task.expire_overdue())
+        expired = task.Task.get_by_uuid(late.uuid)
+        self.assertEqual(task.EXPIRED, expired.state)
+        self.assertIsNotNone(expired.ended_at)
+        self.assertEqual([soon.uuid, whenever.uuid],
+                         [t.uuid for t in task.Task.claim('host-a', 5)])
+
+    def test_expire_held_tasks(self):
+        past = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        late = [self._create_task(uuid=uuidutils.generate_uuid(),
+                                  state=task.PENDING, deadline=past)
+                for _i in range(2)]
+        task.Task.claim('host-a', limit=1)
+        task.Task.claim('host-b', limit=1)
+        uuids = [t.uuid for t in late]
+
+        # Only the tasks held by the owner are expired.
+        self.assertEqual(1, task.Task.expire('host-a', uuids))
+        self.assertEqual(task.EXPIRED,
+                         task.Task.get_by_uuid(late[0].uuid).state)
+        self.assertEqual(task.RUNNING,
+                         task.Task.get_by_uuid(late[1].uuid).state)
+
+    def test_is_overdue(self):
+        now = timeutils.utcnow()
+        tsk = task.Task()
+        self.assertFalse(tsk.is_overdue())
+        tsk.deadline = now + datetime.timedelta(seconds=60)
+        self.assertFalse(tsk.is_overdue(now))
+        self.assertTrue(tsk.is_overdue(now + datetime.timedelta(seconds=61)))
+
+    def _create_listed_tasks(self):
+        # Tasks created in the same second are ordered by id.
+        created_at = timeutils.utcnow()
+        return [self._create_task(uuid=uuidutils.generate_uuid(),
+                                  created_at=created_at, **updates)
+                for updates in ({'state': task.PENDING},
+                                {'state': task.COMPLETE},
+                                {'state': task.PENDING, 'project_id': 'baz'},
+                                {'state': task.PENDING,
+                                 'action': 'delete_server'})]
+
+    def test_get_page(self):
+        created = self._create_listed_tasks()
+        uuids = [t.uuid for t in reversed(created)]
+
+        first = task.TaskList.get_page(3)
+        self.assertEqual(uuids[:3], [t.uuid for t in first])
+        second = task.TaskList.get_page(3, marker=first[-1].uuid)
+        self.assertEqual(uuids[3:], [t.uuid for t in second])
+
+    def test_get_page_filtered(self):
+        created = self._create_listed_tasks()
+
+        pending = task.TaskList.get_page(10, states=[task.PENDING],
+                                         actions=['boot_server'],
+                                         project_ids=['bar'])
+        self.assertEqual([created[0].uuid], [t.uuid for t in pending])
+        tasks = task.TaskList.get_page(10, project_ids=['baz'])
+        self.assertEqual([created[2].uuid], [t.uuid for t in tasks])
+
+    def test_get_page_marker_not_found(self):
+        self.assertRaises(obj_exception.MarkerNotFound,
+                          task.TaskList.get_page, 10,
+                          marker=uuidutils.generate_uuid())
+
+    def test_get_page_marker_of_other_project(self):
+        created = self._create_listed_tasks()
+        self.assertRaises(obj_exception.MarkerNotFound,
+                          task.TaskList.get_page, 10,
+                          marker=created[2].uuid, project_ids=['bar'])
+
+    def test_get_version(self):
+        created = self._create_task(uuid=uuidutils.generate_uuid())
+        project_id, version = task.Task.get_version(created.uuid)
+        self.assertEqual('bar', project_id)
+
+        task_item.TaskItem._create_in_db({
+            'uuid': uuidutils.generate_uuid(), 'action': 'create_server',
+            'state': task_item.PENDING, 'task_id': created.id})
+        _project_id, item_version = task.Task.get_version(created.uuid)
+        self.assertNotEqual(version, item_version)
+
+        item = task_item.TaskItemList.get_by_task_id(created.id)[0]
+        item.state = task_item.COMPLETE
+        item.save()
+        self.assertNotEqual(item_version,
+                            task.Task.get_version(created.uuid)[1])
+
+    def test_get_version_not_found(self):
+        self.assertRaises(obj_exception.TaskNotFound,
+                          task.Task.get_version, uuidutils.generate_uuid())
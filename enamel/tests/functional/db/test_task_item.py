@@ -12,6 +12,7 @@
 # limitations under the License.
 
 
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from enamel.objects import exception as obj_exception
@@ -43,10 +44,12 @@ class TaskItemTestCase(test_base.DBTestCase):
             'task_id': None,
     }
 
-    def _create_task_item(self):
-        task_args = self._sample_task.copy()
-        tsk = task.Task._create_in_db(task_args)
+    def _create_task_item(self, tsk=None):
+        if tsk is None:
+            task_args = self._sample_task.copy()
+            tsk = task.Task._create_in_db(task_args)
         task_item_args = self._sample_task_item.copy()
+        task_item_args['uuid'] = uuidutils.generate_uuid()
         task_item_args['task_id'] = tsk.id
         tsk_item = task_item.TaskItem._create_in_db(task_item_args)
         return tsk_item
@@ -63,3 +66,51 @@ class TaskItemTestCase(test_base.DBTestCase):
         self.assertRaisesRegexp(obj_exception.TaskItemNotFound,
                                 'TaskItem %s' % uuid,
                                 task_item.TaskItem._get_by_uuid_from_db, uuid)
+
+    def test_save(self):
+        created = self._create_task_item()
+        tsk_item = task_item.TaskItem.get_by_uuid(created.uuid)
+        tsk_item.state = task_item.COMPLETE
+        tsk_item.result = '"a-volume-id"'
+        tsk_item.started_at = timeutils.utcnow()
+        tsk_item.queue_wait = 1.5
+        tsk_item.save()
+        saved = task_item.TaskItem.get_by_uuid(created.uuid)
+        self.assertEqual(task_item.COMPLETE, saved.state)
+        self.assertEqual('"a-volume-id"', saved.result)
+        self.assertIsNotNone(saved.started_at)
+        self.assertEqual(1.5, saved.queue_wait)
+
+    def test_list_by_task_id(self):
+        first = self._create_task_item()
+        tsk = task.Task._get_by_uuid_from_db(self._sample_task['uuid'])
+        second = self._create_task_item(tsk)
+        self._create_task_item(task.Task._create_in_db(
+            dict(self._sample_task, uuid=uuidutils.generate_uuid())))
+
+        items = task_item.TaskItemList.get_by_task_id(tsk.id)
+        self.assertEqual([first.uuid, second.uuid],
+                         [item.uuid for item in items])
+
+    def test_list_and_count_by_task_id_filters(self):
+        tsk = task.Task._create_in_db(
+            dict(self._sample_task, uuid=uuidutils.generate_uuid()))
+        boot = self._create_task_item(tsk)
+        units = []
+        for state in (task_item.COMPLETE, task_item.PENDING):
+            unit = task_item.TaskItem(uuid=uuidutils.generate_uuid(),
+                                      action='boot_server_unit',
+                                      state=state, task_id=tsk.id)
+            unit.create()
+            units.append(unit)
+
+        items = task_item.TaskItemList.get_by_task_id(
+            tsk.id, exclude_actions=['boot_server_unit'])
+        self.assertEqual([boot.uuid], [item.uuid for item in items])
+        items = task_item.TaskItemList.get_by_task_id(
+            tsk.id, actions=['boot_server_unit'], states=[task_item.PENDING])
+        self.assertEqual([units[1].uuid], [item.uuid for item in items])
+
+        self.assertEqual(3, task_item.TaskItemList.count_by_task_id(tsk.id))
+        self.assertEqual(1, task_item.TaskItemList.count_by_task_id(
+            tsk.id, actions=['boot_server_unit'], before_id=units[1].id))
@@ -14,6 +14,8 @@ import fixtures
 from gabbi import fixture
 from keystonemiddleware import auth_token
 
+from enamel.tests import fixtures as enamel_fixtures
+
 
 # Override real microversion versions for tests.
 MOCK_VERSIONS = [
@@ -26,15 +28,13 @@ MOCK_VERSIONS = [
 # NOTE(cdent): Workaround difficulties using config as a fixture.
 # We want to use a different WSGI application and config per each
 # test file, but there is no easy way to reach into the app factory
-# except by allowing it (setup_app) to be closed over a CONF that we
+# except by allowing it (setup_app) to return an APP that we
 # manage from the fixture.
-CONF = None
+APP = None
 
 
 def setup_app():
-    from enamel.cmd import api
-    global CONF
-    return api.create_app(CONF)
+    return APP
 
 
 class BaseConfigFixture(fixture.GabbiFixture):
@@ -49,18 +49,28 @@ class BaseConfigFixture(fixture.GabbiFixture):
         self.version_fixture.setUp()
         self._manage_conf()
         self.override_config()
+        self._create_app()
+        self.db_fixture = enamel_fixtures.Database()
+        self.db_fixture.setUp()
 
     def override_config(self):
         self.conf.set_override('debug', True)
         self.conf.set_override('use_stderr', True)
+        self.conf.set_override('connection', 'sqlite://', 'database')
+        self.conf.set_override('transport', 'local', 'dispatch')
 
     def _manage_conf(self):
         from enamel.cmd import api
-        global CONF
-        conf = api.prepare_service()
-        CONF = self.conf = conf
+        self.conf = api.prepare_service()
+
+    def _create_app(self):
+        """Create the app as the WSGI script does, database included."""
+        from enamel.cmd import api
+        global APP
+        APP = api.create_app(self.conf)
 
     def stop_fixture(self):
+        self.db_fixture.cleanUp()
         self.version_fixture.cleanUp()
         self.conf.reset()
 
@@ -85,3 +95,11 @@ class AuthedConfigFixture(BaseConfigFixture):
         self.conf.register_opts(auth_token._OPTS, group='keystone_authtoken')
         self.conf.set_override('auth_uri', 'http://127.0.0.1:35357',
                                group='keystone_authtoken')
+
+
+class ServerBootConfigFixture(ConfigFixture):
+    """Accept requests to boot servers, which are refused by default."""
+
+    def override_config(self):
+        super(ServerBootConfigFixture, self).override_config()
+        self.conf.set_override('server_boot', True, 'api')
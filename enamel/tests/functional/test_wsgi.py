@@ -0,0 +1,80 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import os
+import runpy
+
+import mock
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from enamel.cmd import api
+from enamel.objects import task as task_obj
+from enamel.objects import task_item as task_item_obj
+from enamel.tests import fixtures as enamel_fixtures
+from enamel.tests.unit import base
+
+WSGI_SCRIPT = os.path.join(os.path.dirname(api.__file__), os.pardir, 'api',
+                           'app.wsgi')
+
+
+_PREPARE_SERVICE = api.prepare_service
+
+
+def _prepare_service(args=None):
+    conf = _PREPARE_SERVICE(args)
+    conf.set_override('auth_strategy', None, 'api')
+    conf.set_override('connection', 'sqlite://', 'database')
+    conf.set_override('transport', None, 'dispatch')
+    conf.set_override('server_boot', True, 'api')
+    return conf
+
+
+class TestWSGIScript(base.TestCase):
+
+    def setUp(self):
+        super(TestWSGIScript, self).setUp()
+        with mock.patch.object(api, 'prepare_service', _prepare_service):
+            app = runpy.run_path(WSGI_SCRIPT)['application']
+        self.useFixture(enamel_fixtures.Database())
+        self.client = app.test_client()
+
+    def test_boot_creates_task(self):
+        response = self.client.post('/servers', data='{"name": "wsgi"}',
+                                    content_type='application/json')
+        self.assertEqual(202, response.status_code)
+        task = jsonutils.loads(response.data)['task']
+
+        response = self.client.get('/tasks/%s' % task['uuid'],
+                                   headers={'accept': 'application/json'})
+        self.assertEqual(200, response.status_code)
+        items = jsonutils.loads(response.data)['task']['items']
+        self.assertEqual([('boot_server', task_item_obj.PENDING)],
+                         [(item['action'], item['state'])
+                          for item in items])
+
+    def test_boot_expires_after_timeout(self):
+        response = self.client.post(
+            '/servers', data='{"name": "wsgi", "timeout": 60}',
+            content_type='application/json')
+        self.assertEqual(202, response.status_code)
+        uuid = jsonutils.loads(response.data)['task']['uuid']
+        self.assertEqual(0, task_obj.Task.expire_overdue())
+
+        later = timeutils.utcnow() + datetime.timedelta(seconds=61)
+        with mock.patch.object(timeutils, 'utcnow', return_value=later):
+            self.assertEqual(1, task_obj.Task.expire_overdue())
+        response = self.client.get('/tasks/%s' % uuid,
+                                   headers={'accept': 'application/json'})
+        self.assertEqual(task_obj.EXPIRED,
+                         jsonutils.loads(response.data)['task']['state'])
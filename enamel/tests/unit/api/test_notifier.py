@@ -0,0 +1,90 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+
+from enamel.api import notifier
+from enamel.tests.unit import base
+
+
+class _FakeTasks(object):
+    """Tasks whose versions are set by the test."""
+
+    def __init__(self, versions):
+        self.versions = versions
+        self.calls = []
+
+    def get_versions(self, uuids):
+        self.calls.append(sorted(uuids))
+        return {uuid: ('a', self.versions[uuid]) for uuid in uuids
+                if uuid in self.versions}
+
+
+class TestChangeNotifier(base.TestCase):
+
+    def _wait_all(self, change_notifier, waits, timeout):
+        results = {}
+
+        def wait(name, uuid, version):
+            results[name] = change_notifier.wait(uuid, version, timeout)
+
+        threads = [threading.Thread(target=wait, args=args)
+                   for args in waits]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_waiters_share_polls(self):
+        tasks = _FakeTasks({'t1': 'v1', 't2': 'v1'})
+        change_notifier = notifier.ChangeNotifier(
+            interval=0.01, get_versions=tasks.get_versions)
+        threads, results = self._wait_all(
+            change_notifier,
+            [('a', 't1', 'v1'), ('b', 't1', 'v1'), ('c', 't2', 'v1')], 5)
+        while len(tasks.calls) < 2:
+            pass
+        tasks.versions['t1'] = 'v2'
+        threads[0].join()
+        threads[1].join()
+
+        self.assertEqual('v2', results['a'])
+        self.assertEqual('v2', results['b'])
+        self.assertNotIn('c', results)
+        # One read for all the tasks waited for.
+        self.assertEqual(['t1', 't2'], tasks.calls[0])
+
+    def test_stale_version_returns_at_first_poll(self):
+        tasks = _FakeTasks({'t1': 'v3'})
+        change_notifier = notifier.ChangeNotifier(
+            interval=0.01, get_versions=tasks.get_versions)
+        self.assertEqual('v3', change_notifier.wait('t1', 'v1', 5))
+
+    def test_timeout(self):
+        tasks = _FakeTasks({'t1': 'v1'})
+        change_notifier = notifier.ChangeNotifier(
+            interval=0.01, get_versions=tasks.get_versions)
+        self.assertIsNone(change_notifier.wait('t1', 'v1', 0.05))
+        self.assertEqual({}, change_notifier._watched)
+
+    def test_poll_failure_keeps_waiters(self):
+        calls = []
+
+        def get_versions(uuids):
+            calls.append(uuids)
+            if len(calls) == 1:
+                raise Exception('database gone')
+            return {'t1': ('a', 'v2')}
+
+        change_notifier = notifier.ChangeNotifier(
+            interval=0.01, get_versions=get_versions)
+        self.assertEqual('v2', change_notifier.wait('t1', 'v1', 5))
+        self.assertGreaterEqual(len(calls), 2)
@@ -12,6 +12,7 @@
 # limitations under the License.
 
 import fixtures
+import mock
 
 from enamel.tests.unit import base
 
@@ -123,6 +124,17 @@ class TestVersion(MockVersionedTest):
         request_version = version.parse_version_string('0.8')
         self.assertFalse(request_version.matches(min_version=(0, 9)))
 
+    def test_bounds_shared_by_versions(self):
+        self.assertEqual(version.Version(1, 0),
+                         version.Version(0, 1).max_version)
+        with mock.patch.object(version, 'parse_version_string') as parse:
+            # Other versions reuse the bounds parsed for the first.
+            self.assertEqual(version.Version(1, 0),
+                             version.Version(0, 9).max_version)
+            self.assertEqual(version.Version(0, 1),
+                             version.Version(1, 0).min_version)
+        self.assertEqual(0, parse.call_count)
+
 
 class TestHeaderExtraction(MockVersionedTest):
 
@@ -192,3 +204,38 @@ class TestHeaderExtraction(MockVersionedTest):
         headers = {'openstack-api-version':
                    'enamel -1.9'}
         self.assertRaises(ValueError, version.extract_version, headers)
+
+
+class TestVersionNegotiator(MockVersionedTest):
+
+    def test_negotiate(self):
+        negotiator = version.VersionNegotiator()
+        self.assertEqual(version.Version(0, 9),
+                         negotiator.negotiate('enamel 0.9'))
+        self.assertEqual(version.Version(1, 0),
+                         negotiator.negotiate('enamel latest'))
+        self.assertEqual(negotiator.min_version, negotiator.negotiate(None))
+
+    def test_values_resolved_once(self):
+        negotiator = version.VersionNegotiator()
+        with mock.patch.object(version, 'extract_version',
+                               side_effect=version.extract_version) as ext:
+            for _i in range(3):
+                negotiator.negotiate('enamel 0.9')
+                self.assertRaises(ValueError, negotiator.negotiate,
+                                  'enamel 0.8')
+        self.assertEqual(2, ext.call_count)
+
+    def test_allowed_fixed_at_creation(self):
+        negotiator = version.VersionNegotiator()
+        self.useFixture(fixtures.MonkeyPatch(
+            'enamel.api.version.VERSIONS', ['0.1']))
+        self.assertEqual(version.Version(0, 9),
+                         negotiator.negotiate('enamel 0.9'))
+
+    def test_cache_bounded(self):
+        negotiator = version.VersionNegotiator(max_cached=1)
+        negotiator.negotiate('enamel 0.9')
+        self.assertEqual(version.Version(1, 0),
+                         negotiator.negotiate('enamel 1.0'))
+        self.assertEqual(['enamel 0.9'], list(negotiator._outcomes))
@@ -0,0 +1,135 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+
+import fixtures
+import mock
+
+from enamel import cache
+from enamel import task_processor
+from enamel.tests.unit import base
+
+CREDENTIALS = {'handle': 'alice', 'project_id': 'p1', 'token': 'secret'}
+
+
+def _fill(shared_cache):
+    shared_cache.set('image:east:cirros:p1', {'name': 'cirros'}, 60)
+
+
+class TestSharedCache(base.TestCase):
+
+    def setUp(self):
+        super(TestSharedCache, self).setUp()
+        self.now = 1000.0
+        self.useFixture(fixtures.MockPatch('time.time', lambda: self.now))
+
+    def test_set_get_and_expiry(self):
+        shared_cache = cache.SharedCache(entries=16)
+        self.assertIsNone(shared_cache.get('a'))
+        shared_cache.set('a', {'name': 'cirros', 'size': 1}, 10)
+        self.assertEqual({'name': 'cirros', 'size': 1},
+                         shared_cache.get('a'))
+        self.now += 10
+        self.assertIsNone(shared_cache.get('a'))
+        self.assertEqual((1, 2), shared_cache.stats())
+
+    def test_hash_collision_is_a_miss(self):
+        self.useFixture(fixtures.MockPatch('enamel.cache._hash',
+                                           return_value=1.0))
+        shared_cache = cache.SharedCache(entries=16)
+        shared_cache.set('a', 'value of a', 10)
+        self.assertIsNone(shared_cache.get('b'))
+        self.assertEqual('value of a', shared_cache.get('a'))
+        self.assertEqual((1, 1), shared_cache.stats())
+
+    def test_too_large_is_not_cached(self):
+        shared_cache = cache.SharedCache(entries=4, max_entry_size=256)
+        shared_cache.set('a', 'x' * 300, 10)
+        self.assertIsNone(shared_cache.get('a'))
+
+    def test_least_recently_used_is_evicted(self):
+        shared_cache = cache.SharedCache(entries=cache.PROBE)
+        for i in range(cache.PROBE):
+            shared_cache.set('key-%d' % i, i, 60)
+            self.now += 1
+        shared_cache.get('key-0')
+        shared_cache.set('new', 'new', 60)
+        self.assertEqual(0, shared_cache.get('key-0'))
+        self.assertIsNone(shared_cache.get('key-1'))
+        self.assertEqual('new', shared_cache.get('new'))
+
+    def test_invalidate_drops_all_scopes(self):
+        shared_cache = cache.SharedCache(entries=16)
+        shared_cache.set('image:cirros:p1', 1, 60, resource='image:cirros')
+        shared_cache.set('image:cirros:p2', 2, 60, resource='image:cirros')
+        shared_cache.set('image:fedora:p1', 3, 60, resource='image:fedora')
+        self.assertEqual(2, shared_cache.invalidate('image:cirros'))
+        self.assertIsNone(shared_cache.get('image:cirros:p1'))
+        self.assertIsNone(shared_cache.get('image:cirros:p2'))
+        self.assertEqual(3, shared_cache.get('image:fedora:p1'))
+
+    def test_shared_between_processes(self):
+        shared_cache = cache.SharedCache(entries=16)
+        process = multiprocessing.Process(target=_fill,
+                                          args=(shared_cache,))
+        process.start()
+        process.join()
+        self.assertEqual(0, process.exitcode)
+        self.assertEqual({'name': 'cirros'},
+                         shared_cache.get('image:east:cirros:p1'))
+
+
+class TestMetadataLookups(base.TestCase):
+
+    def setUp(self):
+        super(TestMetadataLookups, self).setUp()
+        conf = task_processor._default_config()
+        self.shared_cache = cache.SharedCache(entries=16)
+        cache.init(conf, self.shared_cache)
+        self.addCleanup(cache.init, conf, None)
+        self.client = self.useFixture(fixtures.MockPatch(
+            'enamel.clients.client')).mock
+        glance = self.client.return_value
+        glance.images.get.return_value = {'id': 'cirros', 'size': 1}
+
+    def test_image_is_fetched_once(self):
+        for _i in range(3):
+            self.assertEqual({'id': 'cirros', 'size': 1},
+                             cache.get_image(CREDENTIALS, 'east', 'cirros'))
+        self.client.return_value.images.get.assert_called_once_with(
+            'cirros')
+
+        # Another project fetches its own.
+        other = dict(CREDENTIALS, project_id='p2')
+        cache.get_image(other, 'east', 'cirros')
+        self.assertEqual(2, self.client.return_value.images.get.call_count)
+
+        cache.invalidate_image('east', 'cirros')
+        cache.get_image(CREDENTIALS, 'east', 'cirros')
+        self.assertEqual(3, self.client.return_value.images.get.call_count)
+
+    def test_flavor(self):
+        nova = self.client.return_value
+        nova.flavors.get.return_value = mock.Mock(
+            to_dict=mock.Mock(return_value={'id': 'small', 'vcpus': 1}))
+        cache.get_flavor(CREDENTIALS, 'east', 'small')
+        self.assertEqual({'id': 'small', 'vcpus': 1},
+                         cache.get_flavor(CREDENTIALS, 'east', 'small'))
+        nova.flavors.get.assert_called_once_with('small')
+
+    def test_without_cache(self):
+        cache.init(task_processor._default_config(), None)
+        cache.get_image(CREDENTIALS, 'east', 'cirros')
+        cache.get_image(CREDENTIALS, 'east', 'cirros')
+        self.assertEqual(2, self.client.return_value.images.get.call_count)
@@ -0,0 +1,96 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fixtures
+from keystoneauth1.identity import v3
+
+from enamel import clients
+from enamel import task_processor
+from enamel.tests.unit import base
+
+
+def _credentials(handle):
+    return {'handle': handle,
+            'auth_url': 'https://keystone.example.com/v3',
+            'token': 'token-%s' % handle,
+            'project_id': 'project-%s' % handle}
+
+
+class TestClientPool(base.TestCase):
+
+    def setUp(self):
+        super(TestClientPool, self).setUp()
+        self.built = []
+
+        def build(session, region_name):
+            self.built.append((session, region_name))
+            return object()
+
+        self.useFixture(fixtures.MockPatchObject(
+            clients, 'CLIENTS', {'compute': build, 'image': build}))
+
+    def test_load_auth(self):
+        auth = clients.load_auth(_credentials('a'))
+        self.assertIsInstance(auth, v3.Token)
+        self.assertEqual('project-a', auth.project_id)
+
+    def test_clients_are_reused(self):
+        pool = clients.ClientPool()
+        nova = pool.client('compute', _credentials('a'))
+        self.assertIs(nova, pool.client('compute', _credentials('a')))
+        glance = pool.client('image', _credentials('a'))
+        self.assertIsNot(nova, glance)
+        # Both clients share the session of the handle.
+        self.assertIs(self.built[0][0], self.built[1][0])
+        self.assertEqual(2, len(self.built))
+
+    def test_sessions_by_handle_and_region(self):
+        pool = clients.ClientPool()
+        session = pool.session(_credentials('a'))
+        self.assertIs(session, pool.session(_credentials('a')))
+        self.assertIsNot(session, pool.session(_credentials('b')))
+        self.assertIsNot(session, pool.session(_credentials('a'), 'east'))
+        self.assertEqual(3, len(pool))
+
+    def test_least_recently_used_session_is_evicted(self):
+        pool = clients.ClientPool(max_sessions=2)
+        first = pool.session(_credentials('a'))
+        pool.session(_credentials('b'))
+        self.assertIs(first, pool.session(_credentials('a')))
+        pool.session(_credentials('c'))
+        self.assertEqual(2, len(pool))
+        self.assertIs(first, pool.session(_credentials('a')))
+        self.assertEqual(2, len(pool))
+        # b was the least recently used, so it was closed.
+        self.assertEqual([('a', None), ('c', None)],
+                         sorted(pool._entries))
+
+    def test_invalidate(self):
+        pool = clients.ClientPool()
+        session = pool.session(_credentials('a'))
+        pool.session(_credentials('a'), 'east')
+        pool.session(_credentials('b'))
+        pool.invalidate('a')
+        self.assertEqual(1, len(pool))
+        self.assertIsNot(session, pool.session(_credentials('a')))
+
+    def test_from_config(self):
+        conf = task_processor._default_config()
+        conf.set_override('max_sessions', 5, 'clients')
+        conf.set_override('cafile', '/etc/ssl/ca.pem', 'clients')
+        pool = clients.ClientPool.from_config(conf)
+        self.assertEqual(5, pool.max_sessions)
+        self.assertEqual('/etc/ssl/ca.pem', pool.verify)
+        conf.set_override('cafile', None, 'clients')
+        conf.set_override('insecure', True, 'clients')
+        self.assertFalse(clients.ClientPool.from_config(conf).verify)
@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+import fixtures
+from oslo_serialization import jsonutils
+
+from enamel import coalesce
+from enamel.objects import task as task_obj
+from enamel.tests.unit import base
+
+
+def _task(uuid, project_id='a', **params):
+    params.setdefault('flavorRef', 'small')
+    params.setdefault('imageRef', 'cirros')
+    return task_obj.Task(uuid=uuid, action='boot_server',
+                         project_id=project_id,
+                         params=jsonutils.dumps(params))
+
+
+class TestCoalesce(base.TestCase):
+
+    def setUp(self):
+        super(TestCoalesce, self).setUp()
+        self.now = 1000.0
+        self.useFixture(fixtures.MockPatch('time.time', lambda: self.now))
+
+    def test_batch_key(self):
+        key = coalesce.batch_key(_task('1', name='web-1'))
+        self.assertEqual(key, coalesce.batch_key(
+            _task('2', name='web-2', max_count=3)))
+        self.assertNotEqual(key, coalesce.batch_key(_task('3', 'b')))
+        self.assertNotEqual(key, coalesce.batch_key(
+            _task('4', flavorRef='large')))
+
+    def test_merge_params(self):
+        params = coalesce.merge_params([
+            _task('1', name='web-1'),
+            _task('2', name='web-2', min_count=2, max_count=3),
+        ])
+        self.assertEqual({'flavorRef': 'small', 'imageRef': 'cirros',
+                          'min_count': 3, 'max_count': 4}, params)
+
+    def test_batches_close_after_window(self):
+        coalescer = coalesce.Coalescer(window=0.5, max_batch=10)
+        coalescer.add(_task('1'))
+        coalescer.add(_task('2', 'b'))
+        self.now += 0.2
+        coalescer.add(_task('3'))
+        self.assertEqual([], coalescer.ready())
+        self.assertEqual(2, len(coalescer))
+        self.assertEqual(set(['1', '2', '3']), coalescer.uuids())
+
+        self.now += 0.3
+        self.assertEqual([('boot_server', ('1', '3'), 'a', None),
+                          ('boot_server', ('2',), 'b', None)],
+                         coalescer.ready())
+        self.assertEqual(0, len(coalescer))
+
+    def test_full_batch_closes_early(self):
+        coalescer = coalesce.Coalescer(window=0.5, max_batch=2)
+        for uuid in ('1', '2', '3'):
+            coalescer.add(_task(uuid))
+        self.assertEqual([('boot_server', ('1', '2'), 'a', None)],
+                         coalescer.ready())
+        self.assertEqual(set(['3']), coalescer.uuids())
+
+    def test_batch_deadline_is_latest(self):
+        coalescer = coalesce.Coalescer(window=0, max_batch=10)
+        for uuid, seconds in (('1', 10), ('2', 30)):
+            task = _task(uuid)
+            task.deadline = datetime.datetime(2026, 1, 1, 0, 0, seconds)
+            coalescer.add(task)
+        coalescer.add(_task('3', 'b'))
+        batch, open_ended = coalescer.ready()
+        self.assertEqual(1767225630, batch[3])
+        self.assertIsNone(open_ended[3])
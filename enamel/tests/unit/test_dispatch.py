@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+
+import fixtures
+
+from enamel import dispatch
+from enamel import exception
+from enamel.objects import task as task_obj
+from enamel import task_processor
+from enamel.tests.unit import base
+
+
+class TestLocalTransport(base.TestCase):
+
+    def setUp(self):
+        super(TestLocalTransport, self).setUp()
+        self.transport = dispatch.LocalTransport()
+
+    def _consumer(self, topic):
+        consumer = self.transport.consumer(topic)
+        self.addCleanup(consumer.close)
+        return consumer
+
+    def test_publish_consume(self):
+        consumer = self._consumer('boot_server')
+        self.assertTrue(self.transport.publish('boot_server', 'hello'))
+        self.assertEqual('hello', consumer.receive(1))
+        self.assertIsNone(consumer.receive(0))
+
+    def test_publish_falls_back_to_default_topic(self):
+        consumer = self._consumer(dispatch.DEFAULT_TOPIC)
+        self.assertTrue(self.transport.publish('boot_server', 'hello'))
+        self.assertEqual('hello', consumer.receive(1))
+
+    def test_publish_without_consumer(self):
+        self.assertFalse(self.transport.publish('boot_server', 'hello'))
+
+
+class TestUnixSocketTransport(base.TestCase):
+
+    def setUp(self):
+        super(TestUnixSocketTransport, self).setUp()
+        self.conf = task_processor._default_config()
+        self.socket_dir = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'sockets')
+        self.conf.set_override('transport', 'unix', 'dispatch')
+        self.conf.set_override('socket_dir', self.socket_dir, 'dispatch')
+        self.transport = dispatch.get_transport(self.conf)
+        self.addCleanup(self.transport.close)
+
+    def test_publish_consume(self):
+        consumer = self.transport.consumer('boot_server')
+        self.addCleanup(consumer.close)
+        self.assertTrue(self.transport.publish('boot_server', 'hello'))
+        self.assertTrue(self.transport.publish('boot_server', 'world'))
+        self.assertEqual('hello', consumer.receive(1))
+        self.assertEqual('world', consumer.receive(0))
+        self.assertIsNone(consumer.receive(0))
+
+    def test_publish_without_consumer(self):
+        self.assertFalse(self.transport.publish('boot_server', 'hello'))
+
+    def test_topic_consumed_once(self):
+        consumer = self.transport.consumer('boot_server')
+        self.addCleanup(consumer.close)
+        self.assertRaises(exception.DispatchSocketInUse,
+                          self.transport.consumer, 'boot_server')
+        self.assertTrue(self.transport.publish('boot_server', 'hello'))
+        self.assertEqual('hello', consumer.receive(1))
+
+    def test_stale_socket_replaced(self):
+        os.makedirs(self.socket_dir)
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        stale.bind(os.path.join(self.socket_dir, 'boot_server.sock'))
+        stale.close()
+        consumer = self.transport.consumer('boot_server')
+        self.addCleanup(consumer.close)
+        self.assertTrue(self.transport.publish('boot_server', 'hello'))
+        self.assertEqual('hello', consumer.receive(1))
+
+    def test_topic_free_once_closed(self):
+        self.transport.consumer('boot_server').close()
+        consumer = self.transport.consumer('boot_server')
+        self.addCleanup(consumer.close)
+        self.assertTrue(self.transport.publish('boot_server', 'hello'))
+        self.assertEqual('hello', consumer.receive(1))
+
+
+class TestDispatchDefaults(base.TestCase):
+
+    def test_no_transport_by_default(self):
+        conf = task_processor._default_config()
+        conf([], project='enamel')
+        self.assertIsNone(dispatch.get_transport(conf))
+
+
+class TestTaskMessages(base.TestCase):
+
+    def test_publish_decode_task(self):
+        transport = dispatch.LocalTransport()
+        consumer = transport.consumer('boot_server')
+        self.addCleanup(consumer.close)
+        task = task_obj.Task(uuid='2c0b1e0c-8ecd-4a63-9ab5-6a6cf3da8f4c',
+                             action='boot_server', state=task_obj.PENDING,
+                             params='{}')
+
+        self.assertTrue(dispatch.publish_task(transport, task))
+        received = dispatch.decode_task(consumer.receive(1))
+        self.assertEqual(task.uuid, received.uuid)
+        self.assertEqual('boot_server', received.action)
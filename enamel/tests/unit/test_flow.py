@@ -0,0 +1,275 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import threading
+import time
+
+import fixtures
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+
+from enamel import exception
+from enamel import flow
+from enamel import metrics
+from enamel.objects import task as task_obj
+from enamel.objects import task_item as task_item_obj
+from enamel import task_processor
+from enamel.tests.unit import base
+
+# Seconds an action waits for the action it expects to run alongside.
+PARALLEL_TIMEOUT = 5
+
+_started = {}
+
+
+class _WaitForOther(flow.ItemAction):
+    """Only succeeds if the other action of the pair runs concurrently."""
+
+    mine = None
+    other = None
+
+    def execute(self, params):
+        _started[self.mine].set()
+        if not _started[self.other].wait(PARALLEL_TIMEOUT):
+            raise Exception('%s did not run in parallel' % self.other)
+        return self.mine
+
+
+class LookupImage(_WaitForOther):
+    default_provides = 'image'
+    mine = 'image'
+    other = 'port'
+
+
+class CreatePort(_WaitForOther):
+    default_provides = 'port'
+    mine = 'port'
+    other = 'image'
+
+
+class BootServer(flow.ItemAction):
+    default_provides = 'server'
+
+    def execute(self, image, port, params):
+        return '%s-%s-%s' % (params['name'], image, port)
+
+
+class BatchBootServer(flow.ItemAction):
+    default_provides = 'server'
+    splits_batch = True
+
+    def execute(self, image, port, params, tasks):
+        return ['%s-%d-of-%d' % (image, index, params['max_count'])
+                for index in range(len(tasks))]
+
+
+class TestFlow(base.TestCase):
+
+    def setUp(self):
+        super(TestFlow, self).setUp()
+        self.useFixture(fixtures.MockPatchObject(flow, 'ACTIONS', {
+            'lookup_image': LookupImage,
+            'create_port': CreatePort,
+            'boot_server': BootServer,
+            'batch_boot_server': BatchBootServer,
+        }))
+        self.saved = []
+        self.useFixture(fixtures.MockPatchObject(
+            task_item_obj.TaskItem, 'save',
+            lambda item: self.saved.append((item.action, item.state))))
+        _started.clear()
+        _started.update(image=threading.Event(), port=threading.Event())
+        self.conf = task_processor._default_config()
+        self.task = task_obj.Task(uuid=uuidutils.generate_uuid(),
+                                  params='{"name": "web"}')
+
+    def _items(self, *actions):
+        return [task_item_obj.TaskItem(uuid=uuidutils.generate_uuid(),
+                                       action=action,
+                                       state=task_item_obj.PENDING)
+                for action in actions]
+
+    def test_independent_items_run_in_parallel(self):
+        items = self._items('boot_server', 'lookup_image', 'create_port')
+        flow.run_flow(self.conf, self.task, items)
+
+        for item in items:
+            self.assertEqual(task_item_obj.COMPLETE, item.state)
+        # The boot waited for both of the items it depends on.
+        self.assertEqual(('boot_server', task_item_obj.RUNNING),
+                         self.saved[-2])
+        self.assertEqual(('boot_server', task_item_obj.COMPLETE),
+                         self.saved[-1])
+
+    def test_item_timings(self):
+        items = self._items('boot_server', 'lookup_image', 'create_port')
+        created_at = timeutils.utcnow() - datetime.timedelta(seconds=5)
+        for item in items:
+            item.created_at = created_at
+        metrics.take_report()
+        flow.run_flow(self.conf, self.task, items)
+
+        for item in items:
+            self.assertLessEqual(item.started_at, item.ended_at)
+            self.assertGreaterEqual(item.queue_wait, 5)
+        report = metrics.take_report()['items']
+        self.assertEqual(['boot_server', 'create_port', 'lookup_image'],
+                         sorted(action for action, _s, _d, _w in report))
+        self.assertEqual(set([task_item_obj.COMPLETE]),
+                         set(state for _a, state, _d, _w in report))
+
+    def test_completed_items_are_checkpointed(self):
+        items = self._items('boot_server', 'lookup_image', 'create_port')
+        flow.run_flow(self.conf, self.task, items)
+        self.assertEqual('"web-image-port"', items[0].result)
+        self.assertEqual('"image"', items[1].result)
+
+    def test_resume_skips_completed_items(self):
+        items = self._items('lookup_image', 'create_port', 'boot_server')
+        for item, result in zip(items[:2], ('"saved-image"', '"saved-port"')):
+            item.state = task_item_obj.COMPLETE
+            item.result = result
+
+        flow.run_flow(self.conf, self.task, items)
+        self.assertEqual([('boot_server', task_item_obj.RUNNING),
+                          ('boot_server', task_item_obj.COMPLETE)],
+                         self.saved)
+        self.assertEqual('"web-saved-image-saved-port"', items[2].result)
+
+    def test_build_flow_links_dependencies(self):
+        items = self._items('lookup_image', 'create_port', 'boot_server')
+        graph = flow.build_flow(self.task, items).iter_links()
+        links = sorted((u.item.action, v.item.action) for u, v, _ in graph)
+        self.assertEqual([('create_port', 'boot_server'),
+                          ('lookup_image', 'boot_server')], links)
+
+    def test_unknown_action(self):
+        items = self._items('lookup_image', 'paint_server')
+        self.assertRaises(exception.UnknownItemAction,
+                          flow.build_flow, self.task, items)
+
+    def test_run_batch_splits_results(self):
+        tasks = [self.task,
+                 task_obj.Task(uuid=uuidutils.generate_uuid(),
+                               params='{"name": "db", "max_count": 2}')]
+        items = [self._items('lookup_image', 'create_port',
+                             'batch_boot_server')
+                 for _task in tasks]
+        flow.run_batch(self.conf, tasks, items)
+
+        for task_items in items:
+            for item in task_items:
+                self.assertEqual(task_item_obj.COMPLETE, item.state)
+        # Outputs not split between the tasks are saved on each of them.
+        self.assertEqual('"image"', items[1][0].result)
+        self.assertEqual('"image-0-of-3"', items[0][2].result)
+        self.assertEqual('"image-1-of-3"', items[1][2].result)
+
+
+class BootServers(flow.WindowedItemAction):
+    unit_action = 'boot_server_unit'
+    running = 0
+    most_running = 0
+    lock = threading.Lock()
+
+    def unit_count(self, params):
+        return params['count']
+
+    def execute_unit(self, index, params):
+        cls = type(self)
+        with cls.lock:
+            cls.running += 1
+            cls.most_running = max(cls.most_running, cls.running)
+        time.sleep(0.01)
+        with cls.lock:
+            cls.running -= 1
+        if index in params.get('fail', ()):
+            raise Exception('boot %d failed' % index)
+        return 'server-%d' % index
+
+
+class TestWindowedItems(base.TestCase):
+
+    def setUp(self):
+        super(TestWindowedItems, self).setUp()
+        self.useFixture(fixtures.MockPatchObject(
+            flow, 'ACTIONS', {'boot_servers': BootServers}))
+        self.items = []
+        self.useFixture(fixtures.MockPatchObject(
+            task_item_obj.TaskItem, 'create',
+            lambda item: self._create(item)))
+        self.saved = {}
+        self.useFixture(fixtures.MockPatchObject(
+            task_item_obj.TaskItem, 'save',
+            lambda item: self.saved.__setitem__(
+                item.uuid, (item.state, item.result))))
+        self.useFixture(fixtures.MockPatchObject(
+            task_item_obj.TaskItemList, 'get_by_task_id',
+            lambda task_id, actions=None, states=None: [
+                item for item in self.items if item.state in states]))
+        self.useFixture(fixtures.MockPatchObject(
+            task_item_obj.TaskItemList, 'count_by_task_id',
+            lambda task_id, actions=None, before_id=None: len(
+                [item for item in self.items
+                 if before_id is None or item.id < before_id])))
+        BootServers.most_running = 0
+        self.conf = task_processor._default_config()
+        self.conf.set_override('item_window', 3, 'task-processor')
+        self.task = task_obj.Task(id=1, uuid=uuidutils.generate_uuid(),
+                                  params='{"count": 10}')
+
+    def _create(self, item):
+        item.id = len(self.items) + 1
+        item.result = None
+        self.items.append(item)
+
+    def _run(self):
+        items = [task_item_obj.TaskItem(uuid=uuidutils.generate_uuid(),
+                                        action='boot_servers',
+                                        state=task_item_obj.PENDING)]
+        flow.run_flow(self.conf, self.task, items)
+        return items[0]
+
+    def test_units_run_through_window(self):
+        item = self._run()
+        self.assertEqual('10', item.result)
+        self.assertEqual(10, len(self.items))
+        self.assertLessEqual(BootServers.most_running, 3)
+        self.assertEqual(
+            ['"server-%d"' % index for index in range(10)],
+            [self.saved[unit.uuid][1] for unit in self.items])
+        self.assertEqual(set([task_item_obj.COMPLETE]),
+                         set(self.saved[unit.uuid][0] for unit in self.items))
+
+    def test_failed_unit_stops_new_units(self):
+        self.task.params = '{"count": 10, "fail": [1]}'
+        self.assertRaises(exception.ItemUnitsFailed, self._run)
+        self.assertLess(len(self.items), 10)
+        self.assertEqual(task_item_obj.ERROR,
+                         self.saved[self.items[1].uuid][0])
+
+    def test_resume_runs_unfinished_units(self):
+        for index in range(4):
+            self._create(task_item_obj.TaskItem(
+                uuid=uuidutils.generate_uuid(), action='boot_server_unit',
+                state=(task_item_obj.RUNNING if index == 2
+                       else task_item_obj.COMPLETE),
+                task_id=1))
+        self._run()
+        self.assertEqual(10, len(self.items))
+        # Only the unfinished unit and those never started were run.
+        self.assertEqual(['"server-2"'] + ['"server-%d"' % index
+                                           for index in range(4, 10)],
+                         [self.saved[unit.uuid][1] for unit in self.items
+                          if unit.uuid in self.saved])
@@ -0,0 +1,109 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+import requests
+
+from enamel import metrics
+from enamel.tests.unit import base
+
+
+class TestMetrics(base.TestCase):
+
+    def test_counter_and_gauge(self):
+        registry = metrics.Registry()
+        counter = registry.counter('claimed_total', 'Claimed.', ['action'])
+        gauge = registry.gauge('workers', 'Workers.')
+        counter.inc(action='boot_server')
+        counter.inc(2, action='boot_server')
+        counter.inc(action='say "hi"')
+        gauge.set(4)
+        self.assertEqual(3, counter.get(action='boot_server'))
+        self.assertEqual(
+            '# HELP claimed_total Claimed.\n'
+            '# TYPE claimed_total counter\n'
+            'claimed_total{action="boot_server"} 3.0\n'
+            'claimed_total{action="say \\"hi\\""} 1.0\n'
+            '# HELP workers Workers.\n'
+            '# TYPE workers gauge\n'
+            'workers 4.0\n', registry.render())
+
+    def test_histogram(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram('duration_seconds', 'Duration.',
+                                       ['action'], buckets=(1, 5))
+        for value in (0.5, 2, 7):
+            histogram.observe(value, action='boot')
+        self.assertEqual(
+            ['duration_seconds_bucket{action="boot",le="1.0"} 1.0',
+             'duration_seconds_bucket{action="boot",le="5.0"} 2.0',
+             'duration_seconds_bucket{action="boot",le="+Inf"} 3.0',
+             'duration_seconds_sum{action="boot"} 9.5',
+             'duration_seconds_count{action="boot"} 3.0'],
+            registry.render().splitlines()[2:])
+
+    def test_log_histogram_quantiles(self):
+        histogram = metrics.LogHistogram()
+        for value in range(1, 1001):
+            histogram.add(value / 100.0)
+        for q, expected in ((0.5, 5.0), (0.95, 9.5), (0.99, 9.9)):
+            estimate = histogram.quantile(q)
+            self.assertLess(abs(estimate - expected) / expected, 0.1)
+        self.assertEqual(201, len(histogram.counts))
+
+    def test_log_histogram_extremes(self):
+        histogram = metrics.LogHistogram(minimum=0.001, buckets=10)
+        histogram.add(0)
+        histogram.add(10 ** 6)
+        self.assertEqual(0.001, histogram.quantile(0.5))
+        self.assertEqual(0.001 * 1.1 ** 9.5, histogram.quantile(0.99))
+
+    def test_summary(self):
+        registry = metrics.Registry()
+        summary = registry.summary('latency_seconds', 'Latency.', ['action'],
+                                   quantiles=(0.5,))
+        summary.observe(2.0, action='boot')
+        self.assertEqual(2, round(summary.quantile(0.5, action='boot')))
+        self.assertTrue(math.isnan(summary.quantile(0.5, action='other')))
+        lines = registry.render().splitlines()
+        self.assertEqual('# TYPE latency_seconds summary', lines[1])
+        name, value = lines[2].split(' ')
+        self.assertEqual('latency_seconds{action="boot",quantile="0.5"}',
+                         name)
+        self.assertEqual(2, round(float(value)))
+        self.assertEqual(['latency_seconds_sum{action="boot"} 2.0',
+                          'latency_seconds_count{action="boot"} 1.0'],
+                         lines[3:])
+
+    def test_take_report(self):
+        metrics.take_report()
+        metrics.record_item('boot_server', 'complete', 1.5, 0.25)
+        self.assertEqual([('boot_server', 'complete', 1.5, 0.25)],
+                         metrics.take_report()['items'])
+        self.assertEqual([], metrics.take_report()['items'])
+
+    def test_server(self):
+        registry = metrics.Registry()
+        registry.gauge('workers', 'Workers.').set(2)
+        server = metrics.MetricsServer(registry, '127.0.0.1', 0)
+        server.start()
+        self.addCleanup(server.stop)
+        url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        response = requests.get(url + '/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(metrics.CONTENT_TYPE,
+                         response.headers['content-type'])
+        self.assertIn('workers 2.0\n', response.text)
+        self.assertEqual(404, requests.get(url + '/nothing').status_code)
@@ -0,0 +1,126 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+
+import fixtures
+
+from enamel import exception
+from enamel import ratelimit
+from enamel.tests.unit import base
+
+
+class _Overloaded(Exception):
+    http_status = 503
+
+
+def _take_tokens(limiter, count):
+    for _i in range(count):
+        limiter.acquire('compute')
+
+
+class TestRateLimiter(base.TestCase):
+
+    def setUp(self):
+        super(TestRateLimiter, self).setUp()
+        self.now = 1000.0
+        self.slept = []
+        self.useFixture(fixtures.MockPatch('time.time',
+                                           lambda: self.now))
+        self.useFixture(fixtures.MockPatch('time.sleep', self._sleep))
+
+    def _sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def test_burst_then_wait(self):
+        limiter = ratelimit.RateLimiter({'compute': '2'})
+        for _i in range(2):
+            limiter.acquire('compute')
+        self.assertEqual([], self.slept)
+        limiter.acquire('compute')
+        self.assertEqual([0.5], self.slept)
+
+    def test_unlisted_service_is_not_limited(self):
+        limiter = ratelimit.RateLimiter({'compute': '1'})
+        for _i in range(10):
+            limiter.acquire('image')
+        self.assertEqual([], self.slept)
+        self.assertIsNone(limiter.rate('image'))
+
+    def test_endpoint_class_and_service_limits(self):
+        limiter = ratelimit.RateLimiter({'compute': '10',
+                                         'compute.boot': '1'})
+        limiter.acquire('compute', 'boot')
+        limiter.acquire('compute', 'show')
+        self.assertEqual([], self.slept)
+        limiter.acquire('compute', 'boot')
+        self.assertEqual([1.0], self.slept)
+
+    def test_max_wait(self):
+        limiter = ratelimit.RateLimiter({'compute': '1'}, max_wait=0.5)
+        limiter.acquire('compute')
+        self.assertRaises(exception.RateLimited, limiter.acquire, 'compute')
+
+    def test_backoff_and_recovery(self):
+        limiter = ratelimit.RateLimiter({'compute': '8'}, recovery_time=10)
+        limiter.backoff('compute')
+        self.assertEqual(4.0, limiter.rate('compute'))
+        limiter.backoff('compute')
+        self.assertEqual(2.0, limiter.rate('compute'))
+        self.now += 5
+        self.assertEqual(6.0, limiter.rate('compute'))
+        self.now += 5
+        self.assertEqual(8.0, limiter.rate('compute'))
+
+    def test_backoff_floor(self):
+        limiter = ratelimit.RateLimiter({'compute': '20'})
+        for _i in range(10):
+            limiter.backoff('compute')
+        self.assertEqual(1.0, limiter.rate('compute'))
+
+    def test_limited_backs_off_when_overloaded(self):
+        limiter = ratelimit.RateLimiter({'compute': '8'})
+        ratelimit.set_limiter(limiter)
+        self.addCleanup(ratelimit.set_limiter, None)
+
+        def call():
+            with ratelimit.limited('compute'):
+                raise _Overloaded()
+
+        self.assertRaises(_Overloaded, call)
+        self.assertEqual(4.0, limiter.rate('compute'))
+
+    def test_rates_and_burst_must_be_positive(self):
+        for rate in ('0', '-1', 'nan', 'inf', 'fast'):
+            self.assertRaises(ValueError, ratelimit.RateLimiter,
+                              {'compute': rate})
+        self.assertRaises(ValueError, ratelimit.RateLimiter,
+                          {'compute': '1'}, burst_seconds=0)
+
+    def test_limited_without_limiter(self):
+        with ratelimit.limited('compute'):
+            pass
+
+
+class TestSharedRateLimiter(base.TestCase):
+
+    def test_buckets_are_shared_between_processes(self):
+        limiter = ratelimit.RateLimiter({'compute': '0.01'},
+                                        burst_seconds=300, max_wait=0)
+        process = multiprocessing.Process(target=_take_tokens,
+                                          args=(limiter, 3))
+        process.start()
+        process.join()
+        self.assertEqual(0, process.exitcode)
+        self.assertRaises(exception.RateLimited, limiter.acquire, 'compute')
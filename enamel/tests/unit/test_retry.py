@@ -0,0 +1,208 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+
+import fixtures
+from keystoneauth1 import exceptions as ks_exceptions
+import mock
+import requests
+from requests.packages.urllib3 import exceptions as urllib3_exceptions
+
+from enamel import exception
+from enamel import ratelimit
+from enamel import retry
+from enamel.tests.unit import base
+
+
+class _ServerError(Exception):
+    http_status = 500
+
+
+class _NotFound(Exception):
+    http_status = 404
+
+
+class _Throttled(Exception):
+    http_status = 429
+
+
+def _connect_failure(reason):
+    """Fail the way keystoneauth does when requests' connection fails."""
+    try:
+        try:
+            try:
+                raise urllib3_exceptions.MaxRetryError(None, '/', reason)
+            except urllib3_exceptions.MaxRetryError as exc:
+                raise requests.exceptions.ConnectionError(exc)
+        except requests.exceptions.ConnectionError:
+            raise ks_exceptions.ConnectFailure('Unable to establish '
+                                               'connection')
+    except ks_exceptions.ConnectFailure as exc:
+        return exc
+
+
+def _fail(breakers, count):
+    for _i in range(count):
+        breakers.record_failure('compute', 'boot')
+
+
+class _Service(object):
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class TestRetry(base.TestCase):
+
+    def setUp(self):
+        super(TestRetry, self).setUp()
+        self.now = 1000.0
+        self.slept = []
+        self.useFixture(fixtures.MockPatch('time.time', lambda: self.now))
+        self.useFixture(fixtures.MockPatch('time.sleep', self._sleep))
+        self.breakers = retry.CircuitBreakers(failure_threshold=3,
+                                              reset_timeout=30)
+        self.useFixture(fixtures.MockPatchObject(
+            retry, '_POLICY', retry.RetryPolicy(max_attempts=3)))
+        self.useFixture(fixtures.MockPatchObject(
+            retry, '_BREAKERS', self.breakers))
+
+    def _sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def test_delay_is_jittered_below_ceiling(self):
+        policy = retry.RetryPolicy(base_delay=1, max_delay=5)
+        for attempt, ceiling in ((1, 1), (2, 2), (3, 4), (4, 5), (10, 5)):
+            delays = [policy.delay(attempt) for _i in range(50)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+
+    def test_transient_failure_is_retried(self):
+        service = _Service(_ServerError(), ks_exceptions.ConnectFailure())
+        self.assertEqual('ok', retry.call('compute', 'show', service))
+        self.assertEqual(3, service.calls)
+        self.assertEqual(2, len(self.slept))
+        self.assertEqual(retry.CLOSED,
+                         self.breakers.state('compute', 'show'))
+
+    def test_client_error_is_not_retried(self):
+        service = _Service(_NotFound())
+        self.assertRaises(_NotFound, retry.call, 'compute', 'show', service)
+        self.assertEqual(1, service.calls)
+
+    def test_gives_up_after_max_attempts(self):
+        service = _Service(*[_ServerError()] * 5)
+        self.assertRaises(_ServerError, retry.call, 'compute', 'show',
+                          service)
+        self.assertEqual(3, service.calls)
+
+    def test_not_idempotent_only_retried_if_not_sent(self):
+        refused = urllib3_exceptions.NewConnectionError(
+            None, 'Connection refused')
+        service = _Service(_connect_failure(refused), _ServerError())
+        self.assertRaises(_ServerError, retry.call, 'compute', 'boot',
+                          service, idempotent=False)
+        self.assertEqual(2, service.calls)
+
+    def test_not_idempotent_not_retried_if_connection_broke(self):
+        aborted = urllib3_exceptions.ProtocolError('Connection aborted.')
+        service = _Service(_connect_failure(aborted))
+        self.assertRaises(ks_exceptions.ConnectFailure, retry.call,
+                          'compute', 'boot', service, idempotent=False)
+        self.assertEqual(1, service.calls)
+        # An idempotent call is retried all the same.
+        service = _Service(_connect_failure(aborted))
+        self.assertEqual('ok', retry.call('compute', 'show', service))
+
+    def test_breaker_opens_and_fails_fast(self):
+        service = _Service(*[_ServerError()] * 3)
+        self.assertRaises(_ServerError, retry.call, 'compute', 'boot',
+                          service)
+        self.assertEqual(retry.OPEN, self.breakers.state('compute', 'boot'))
+        self.assertRaises(exception.CircuitOpen, retry.call, 'compute',
+                          'boot', service)
+        self.assertEqual(3, service.calls)
+        # Other endpoints are not affected.
+        self.assertEqual('ok', retry.call('compute', 'show', service))
+        self.assertEqual(1, self.breakers.open_count())
+
+    def test_half_open_probe(self):
+        _fail(self.breakers, 3)
+        self.now += 30
+        self.breakers.allow('compute', 'boot')
+        self.assertEqual(retry.HALF_OPEN,
+                         self.breakers.state('compute', 'boot'))
+        # Only one probe goes through at a time.
+        self.assertRaises(exception.CircuitOpen, self.breakers.allow,
+                          'compute', 'boot')
+
+        # A failed probe opens the breaker for another reset_timeout.
+        self.breakers.record_failure('compute', 'boot')
+        self.assertEqual(retry.OPEN, self.breakers.state('compute', 'boot'))
+        self.now += 29
+        self.assertRaises(exception.CircuitOpen, self.breakers.allow,
+                          'compute', 'boot')
+
+        self.now += 1
+        self.assertEqual('ok', retry.call('compute', 'boot', _Service()))
+        self.assertEqual(retry.CLOSED,
+                         self.breakers.state('compute', 'boot'))
+
+    def test_throttled_probe_lets_next_call_probe(self):
+        _fail(self.breakers, 3)
+        self.now += 30
+        service = _Service(_Throttled())
+        self.assertEqual('ok', retry.call('compute', 'boot', service))
+        self.assertEqual(2, service.calls)
+        self.assertEqual(retry.CLOSED,
+                         self.breakers.state('compute', 'boot'))
+
+    def test_rate_limited_probe_does_not_close_breaker(self):
+        limiter = mock.Mock()
+        limiter.acquire.side_effect = exception.RateLimited(
+            service='compute')
+        self.useFixture(fixtures.MockPatchObject(
+            ratelimit, '_LIMITER', limiter))
+        _fail(self.breakers, 3)
+        self.now += 30
+        service = _Service()
+        self.assertRaises(exception.RateLimited, retry.call, 'compute',
+                          'boot', service)
+        self.assertEqual(0, service.calls)
+        self.assertEqual(retry.HALF_OPEN,
+                         self.breakers.state('compute', 'boot'))
+        # The probe that was never made does not hold up the next one.
+        self.breakers.allow('compute', 'boot')
+
+    def test_without_breakers(self):
+        self.useFixture(fixtures.MockPatchObject(retry, '_BREAKERS', None))
+        self.assertEqual('ok', retry.call('compute', 'boot',
+                                          _Service(_ServerError())))
+
+    def test_breakers_are_shared_between_processes(self):
+        process = multiprocessing.Process(target=_fail,
+                                          args=(self.breakers, 3))
+        process.start()
+        process.join()
+        self.assertEqual(0, process.exitcode)
+        self.assertRaises(exception.CircuitOpen, self.breakers.allow,
+                          'compute', 'boot')
@@ -0,0 +1,140 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from enamel import scheduler
+from enamel import task_processor
+from enamel.tests.unit import base
+
+
+class TestFairShareScheduler(base.TestCase):
+
+    def _drain(self, sched, eligible=None):
+        popped = []
+        item = sched.pop(eligible)
+        while item is not None:
+            popped.append(item[1])
+            item = sched.pop(eligible)
+        return popped
+
+    def test_fifo_within_project(self):
+        sched = scheduler.FairShareScheduler()
+        for uuid in ('a', 'b', 'c'):
+            sched.push('boot_server', uuid, 'project')
+        self.assertEqual(3, len(sched))
+        self.assertEqual(['a', 'b', 'c'], self._drain(sched))
+        self.assertEqual(0, len(sched))
+
+    def test_projects_take_turns(self):
+        sched = scheduler.FairShareScheduler()
+        for i in range(4):
+            sched.push('boot_server', 'noisy-%d' % i, 'noisy')
+        sched.push('boot_server', 'quiet-0', 'quiet')
+        sched.push('boot_server', 'quiet-1', 'quiet')
+        self.assertEqual(['noisy-0', 'quiet-0', 'noisy-1', 'quiet-1',
+                          'noisy-2', 'noisy-3'], self._drain(sched))
+
+    def test_late_project_does_not_wait_for_backlog(self):
+        sched = scheduler.FairShareScheduler()
+        for i in range(5):
+            sched.push('boot_server', 'noisy-%d' % i, 'noisy')
+        self.assertEqual(('boot_server', 'noisy-0'), sched.pop())
+        self.assertEqual(('boot_server', 'noisy-1'), sched.pop())
+        sched.push('boot_server', 'quiet-0', 'quiet')
+        self.assertEqual(('boot_server', 'quiet-0'), sched.pop())
+
+    def test_weights(self):
+        sched = scheduler.FairShareScheduler(weights={'big': 2.0})
+        for i in range(4):
+            sched.push('boot_server', 'big-%d' % i, 'big')
+            sched.push('boot_server', 'small-%d' % i, 'small')
+        self.assertEqual(['big-0', 'small-0', 'big-1', 'small-1', 'big-2',
+                          'big-3'], self._drain(sched)[:6])
+
+    def test_weights_must_be_positive(self):
+        for weight in (0.0, -1.0, float('inf'), float('nan')):
+            self.assertRaises(ValueError, scheduler.FairShareScheduler,
+                              weights={'p': weight})
+
+    def test_from_config(self):
+        conf = task_processor._default_config()
+        conf.set_override('action_priorities', {'boot_server': '2'},
+                          'task-processor')
+        conf.set_override('project_weights', {'big': '2.5'},
+                          'task-processor')
+        sched = scheduler.FairShareScheduler.from_config(conf)
+        self.assertEqual(2, sched.priority('boot_server'))
+        self.assertEqual(2.5, sched.weight('big'))
+
+        conf.set_override('project_weights', {'big': '0'}, 'task-processor')
+        self.assertRaises(ValueError, scheduler.FairShareScheduler.from_config,
+                          conf)
+        conf.set_override('project_weights', {}, 'task-processor')
+        conf.set_override('action_priorities', {'boot_server': 'high'},
+                          'task-processor')
+        self.assertRaises(ValueError, scheduler.FairShareScheduler.from_config,
+                          conf)
+        conf.set_override('action_priorities', {'boot_server': '1.5'},
+                          'task-processor')
+        self.assertRaises(ValueError, scheduler.FairShareScheduler.from_config,
+                          conf)
+
+    def test_priority_classes(self):
+        sched = scheduler.FairShareScheduler(priorities={'delete_server': 1})
+        sched.push('boot_server', 'boot', 'a')
+        sched.push('delete_server', 'delete', 'b')
+        self.assertEqual(['delete', 'boot'], self._drain(sched))
+
+    def test_ineligible_actions_are_skipped(self):
+        sched = scheduler.FairShareScheduler()
+        sched.push('boot_server', 'boot', 'a')
+        sched.push('create_volume', 'volume', 'a')
+        self.assertEqual(['volume'], self._drain(
+            sched, lambda action: action != 'boot_server'))
+        self.assertEqual(set(['boot']), sched.uuids())
+
+    def test_stats(self):
+        sched = scheduler.FairShareScheduler()
+        sched.push('boot_server', 'a-0', 'a')
+        sched.push('boot_server', 'a-1', 'a')
+        sched.push('boot_server', 'b-0', 'b')
+        sched.pop()
+
+        stats = sched.stats()[0]
+        self.assertEqual(2, stats['depth'])
+        self.assertEqual({'a': 1, 'b': 1}, stats['projects'])
+        self.assertEqual(1, stats['started'])
+        self.assertGreaterEqual(stats['wait_max'], 0)
+        self.assertGreaterEqual(stats['oldest_wait'], 0)
+
+    def test_earliest_deadline_first_within_project(self):
+        sched = scheduler.FairShareScheduler()
+        sched.push('boot_server', 'whenever', 'a')
+        sched.push('boot_server', 'later', 'a', deadline=2000)
+        sched.push('create_volume', 'sooner', 'a', deadline=1000)
+        sched.push('boot_server', 'other', 'b')
+        self.assertEqual(['sooner', 'other', 'later', 'whenever'],
+                         self._drain(sched))
+
+    def test_expire(self):
+        sched = scheduler.FairShareScheduler()
+        sched.push('boot_server', 'whenever', 'a')
+        sched.push('boot_server', 'late', 'a', deadline=900)
+        sched.push('boot_server', 'soon', 'a', deadline=1100)
+        sched.push('create_volume', 'late-too', 'b', deadline=950)
+        self.assertEqual(set([('boot_server', 'late'),
+                              ('create_volume', 'late-too')]),
+                         set(sched.expire(now=1000)))
+        self.assertEqual(2, len(sched))
+        self.assertEqual(set(['soon', 'whenever']), sched.uuids())
+        # Expired tasks were never started.
+        self.assertEqual(0, sched.stats()[0]['started'])
@@ -11,13 +11,411 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import multiprocessing
+import signal
+import time
+
+import fixtures
+import mock
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from enamel import dispatch
+from enamel.objects import task as task_obj
 from enamel import task_processor
 from enamel.tests.unit import base
 
 
+def _claimed(action, uuid, project_id='a', deadline=None, **kwargs):
+    return mock.Mock(action=action, uuid=uuid, project_id=project_id,
+                     deadline_time=mock.Mock(return_value=deadline),
+                     **kwargs)
+
+
 class TestTaskProcessor(base.TestCase):
+    def setUp(self):
+        super(TestTaskProcessor, self).setUp()
+        self.conf = task_processor._default_config()
+        self.conf.set_override('workers', 2, 'task-processor')
+        self.conf.set_override('bind_port', 0, 'task-processor')
+        self.conf.set_override('transport', None, 'dispatch')
+        self.claim = self.useFixture(fixtures.MockPatchObject(
+            task_obj.Task, 'claim', return_value=[])).mock
+
     def test_is_running(self):
-        p = task_processor.TaskProcessor()
+        self.conf.set_override('workers', 1, 'task-processor')
+        self.conf.set_override('bind_address', '127.0.0.1', 'task-processor')
+        p = task_processor.TaskProcessor(self.conf)
+        self.addCleanup(p.stop)
         self.assertFalse(p.is_running())
         p.run()
         self.assertTrue(p.is_running())
+
+    def test_stop(self):
+        p = task_processor.TaskProcessor(self.conf)
+        p.run()
+        p.stop()
+        self.assertFalse(p.is_running())
+        self.assertEqual({}, p._workers)
+
+    def test_port_pools_share_rate_limits(self):
+        self.conf.set_override('pools', ['a:net'], 'port-pool')
+        self.useFixture(fixtures.MockPatch(
+            'enamel.port_pool.PortPools.from_config'))
+        self.useFixture(fixtures.MockPatch('enamel.retry.init'))
+        set_limiter = self.useFixture(fixtures.MockPatch(
+            'enamel.ratelimit.set_limiter')).mock
+        p = task_processor.TaskProcessor(self.conf)
+        self.useFixture(fixtures.MockPatchObject(p, '_maintain_port_pools'))
+        p._start_port_pools()
+        p._port_pool_thread.join()
+        set_limiter.assert_called_once_with(p._rate_limiter)
+
+    def test_action_limit(self):
+        self.conf.set_override('workers', 8, 'task-processor')
+        self.conf.set_override('action_concurrency', {'boot_server': '3'},
+                               'task-processor')
+        p = task_processor.TaskProcessor(self.conf)
+        self.assertEqual(3, p.action_limit('boot_server'))
+        self.assertEqual(8, p.action_limit('create_volume'))
+        self.conf.set_override('default_action_concurrency', 2,
+                               'task-processor')
+        self.assertEqual(2, p.action_limit('create_volume'))
+
+    def test_next_batch_honours_action_limits(self):
+        self.conf.set_override('workers', 4, 'task-processor')
+        self.conf.set_override('action_concurrency', {'boot_server': '1'},
+                               'task-processor')
+        p = task_processor.TaskProcessor(self.conf)
+        for i in range(3):
+            p.submit('boot_server', 'boot-%d' % i)
+        for i in range(3):
+            p.submit('create_volume', 'vol-%d' % i)
+
+        batch = p._next_batch(4)
+        self.assertEqual([('boot_server', 'boot-0'),
+                          ('create_volume', 'vol-0'),
+                          ('create_volume', 'vol-1'),
+                          ('create_volume', 'vol-2')], batch)
+        self.assertEqual([], p._next_batch(4))
+
+        p._task_done('boot_server', 'boot-0', True)
+        self.assertEqual([('boot_server', 'boot-1')], p._next_batch(4))
+
+    def test_run_executes_submitted_tasks(self):
+        self.useFixture(fixtures.MockPatch(
+            'enamel.task_processor.execute_task', return_value=True))
+        p = task_processor.TaskProcessor(self.conf)
+        self.addCleanup(p.stop)
+        p.run()
+        for i in range(5):
+            p.submit('create_volume', 'vol-%d' % i)
+        deadline = time.time() + 10
+        while (len(p._scheduler) or p._in_flight) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(0, len(p._scheduler))
+        self.assertFalse(p._in_flight)
+
+    def _idle_processor(self, workers):
+        p = task_processor.TaskProcessor(self.conf)
+        for index in range(workers):
+            p._workers[index] = task_processor._Worker(index, None, None)
+        return p
+
+    def test_supervisor_survives_failed_passes(self):
+        p = task_processor.TaskProcessor(self.conf)
+        for name in ('_collect_results', '_replace_dead_workers',
+                     '_flush_batches', '_expire_overdue', '_autoscale'):
+            self.useFixture(fixtures.MockPatchObject(p, name))
+        self.useFixture(fixtures.MockPatchObject(p._stopped, 'wait'))
+        claim = self.useFixture(fixtures.MockPatchObject(
+            p, '_claim', side_effect=[OSError('fork failed'), None])).mock
+
+        def dispatch():
+            p._running = False
+
+        self.useFixture(fixtures.MockPatchObject(p, '_dispatch',
+                                                 side_effect=dispatch))
+        p._running = True
+        p._supervise()
+        self.assertEqual(2, claim.call_count)
+
+    def test_claim_fills_idle_workers(self):
+        self.conf.set_override('claim_batch_size', 10, 'task-processor')
+        p = self._idle_processor(3)
+        p.submit('boot_server', 'waiting')
+        self.claim.return_value = [
+            _claimed('create_volume', 'vol-0'),
+            _claimed('create_volume', 'vol-1'),
+        ]
+
+        p._claim()
+        self.claim.assert_called_once_with(p.owner, 2, actions=[],
+                                           lease_time=60)
+        self.assertEqual(set(['waiting', 'vol-0', 'vol-1']),
+                         p._scheduler.uuids())
+
+        # The next claim waits for claim_interval to pass.
+        p._claim()
+        self.assertEqual(1, self.claim.call_count)
+
+    def test_claim_for_workers_to_grow_by(self):
+        self.conf.set_override('workers', 4, 'task-processor')
+        p = self._idle_processor(1)
+        p._claim()
+        self.claim.assert_called_once_with(p.owner, 4, actions=[],
+                                           lease_time=60)
+
+    def test_claim_respects_batch_size(self):
+        self.conf.set_override('claim_batch_size', 2, 'task-processor')
+        p = self._idle_processor(5)
+        p._claim()
+        self.claim.assert_called_once_with(p.owner, 2, actions=[],
+                                           lease_time=60)
+
+    def test_claim_disabled(self):
+        self.conf.set_override('claim_interval', 0, 'task-processor')
+        p = self._idle_processor(2)
+        p._claim()
+        self.assertFalse(self.claim.called)
+
+    def test_claim_only_served_topics(self):
+        self.conf.set_override('workers', 1, 'task-processor')
+        self.conf.set_override('topics', ['boot_server'], 'task-processor')
+        p = self._idle_processor(1)
+        p._claim()
+        self.claim.assert_called_once_with(p.owner, 1,
+                                           actions=['boot_server'],
+                                           lease_time=60)
+
+    def _message(self, uuid, action='boot_server'):
+        return jsonutils.dumps(task_obj.Task(
+            uuid=uuid, action=action).obj_to_primitive())
+
+    def test_claim_dispatched(self):
+        uuids = ['2c0b1e0c-8ecd-4a63-9ab5-6a6cf3da8f4c',
+                 'a4b1d1d2-5b0c-4f50-9a0b-0d8f0bd0e41e']
+        p = self._idle_processor(1)
+        p._result_queue = mock.Mock()
+        self.claim.return_value = [_claimed('boot_server', uuids[1])]
+
+        messages = [self._message(uuid) for uuid in uuids]
+        messages.append('not a task')
+        p._claim_dispatched(messages)
+        self.claim.assert_called_once_with(p.owner, 2, uuids=uuids,
+                                           lease_time=60)
+        self.assertEqual(set([uuids[1]]), p._scheduler.uuids())
+        p._result_queue.put.assert_called_once_with(None)
+
+    def test_run_consumes_dispatched_tasks(self):
+        self.conf.set_override('transport', 'local', 'dispatch')
+        self.conf.set_override('claim_interval', 0, 'task-processor')
+        uuid = '2c0b1e0c-8ecd-4a63-9ab5-6a6cf3da8f4c'
+        self.claim.return_value = [_claimed('boot_server', uuid)]
+        p = task_processor.TaskProcessor(self.conf)
+        self.addCleanup(p.stop)
+        p.run()
+
+        transport = dispatch.LocalTransport()
+        self.assertTrue(transport.publish('boot_server', self._message(uuid)))
+        deadline = time.time() + 10
+        while not self.claim.called and time.time() < deadline:
+            time.sleep(0.05)
+        self.claim.assert_called_once_with(p.owner, 1, uuids=[uuid],
+                                           lease_time=60)
+
+    def test_renew_leases_of_held_tasks(self):
+        renew = self.useFixture(fixtures.MockPatchObject(
+            task_obj.Task, 'renew_leases', return_value=2)).mock
+        reap = self.useFixture(fixtures.MockPatchObject(
+            task_obj.Task, 'reap_expired_leases', return_value=0)).mock
+        expire_overdue = self.useFixture(fixtures.MockPatchObject(
+            task_obj.Task, 'expire_overdue', return_value=0)).mock
+        self.conf.set_override('lease_time', 30, 'task-processor')
+        p = self._idle_processor(2)
+        p.submit('boot_server', 'waiting')
+        p._workers[0].task = ('create_volume', 'running')
+
+        p._renew_leases()
+        renew.assert_called_once_with(p.owner, set(['waiting', 'running']),
+                                      lease_time=30)
+        reap.assert_called_once_with()
+        expire_overdue.assert_called_once_with()
+
+    def test_overdue_queued_tasks_expire(self):
+        expire = self.useFixture(fixtures.MockPatchObject(
+            task_obj.Task, 'expire')).mock
+        p = self._idle_processor(1)
+        now = time.time()
+        p.submit('boot_server', 'late', deadline=now - 1)
+        p.submit('boot_server', ('late-0', 'late-1'), deadline=now - 1)
+        p.submit('boot_server', 'soon', deadline=now + 60)
+        p.submit('boot_server', 'whenever')
+
+        p._expire_overdue()
+        expire.assert_called_once_with(
+            p.owner, set(['late', 'late-0', 'late-1']))
+        self.assertEqual(set(['soon', 'whenever']), p._scheduler.uuids())
+        self.assertIn('enamel_tasks_expired_total{action="boot_server"} 3.0',
+                      p.metrics.render())
+
+    def test_overdue_task_is_not_run(self):
+        deadline = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        task = task_obj.Task(uuid='late', action='boot_server',
+                             deadline=deadline)
+        task.save = mock.Mock()
+        self.useFixture(fixtures.MockPatchObject(
+            task_obj.Task, 'get_by_uuid', return_value=task))
+        self.useFixture(fixtures.MockPatch(
+            'enamel.task_processor._top_items', return_value=[]))
+        run_flow = self.useFixture(fixtures.MockPatch(
+            'enamel.flow.run_flow')).mock
+
+        self.assertFalse(task_processor.execute_task(self.conf, 'boot_server',
+                                                     'late'))
+        self.assertFalse(run_flow.called)
+        self.assertEqual(task_obj.EXPIRED, task.state)
+        task.save.assert_called_once_with()
+
+    def test_next_batch_shares_workers_between_projects(self):
+        self.conf.set_override('workers', 4, 'task-processor')
+        p = task_processor.TaskProcessor(self.conf)
+        for i in range(10):
+            p.submit('boot_server', 'noisy-%d' % i, 'noisy')
+        p.submit('boot_server', 'quiet-0', 'quiet')
+
+        batch = p._next_batch(2)
+        self.assertEqual([('boot_server', 'noisy-0'),
+                          ('boot_server', 'quiet-0')], batch)
+        self.assertEqual(9, p.stats()[0]['projects']['noisy'])
+
+    def test_claimed_tasks_are_coalesced(self):
+        self.conf.set_override('coalesce_window', 0.2, 'task-processor')
+        p = self._idle_processor(2)
+        params = '{"flavorRef": "small", "imageRef": "cirros"}'
+        self.claim.return_value = [
+            _claimed('boot_server', 'boot-%d' % i, params=params)
+            for i in range(3)]
+        self.claim.return_value.append(_claimed('create_volume', 'vol-0'))
+
+        p._claim()
+        self.assertEqual(set(['vol-0']), p._scheduler.uuids())
+        self.assertEqual(set(['boot-0', 'boot-1', 'boot-2', 'vol-0']),
+                         p._held_tasks())
+
+        p._coalescer.window = 0
+        p._flush_batches()
+        self.assertEqual([('create_volume', 'vol-0'),
+                          ('boot_server', ('boot-0', 'boot-1', 'boot-2'))],
+                         p._next_batch(2))
+
+    def test_worker_runs_batches(self):
+        self.addCleanup(signal.signal, signal.SIGINT,
+                        signal.getsignal(signal.SIGINT))
+        execute_batch = self.useFixture(fixtures.MockPatch(
+            'enamel.task_processor.execute_batch', return_value=False)).mock
+        work_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        work_queue.put(('boot_server', ('boot-0', 'boot-1')))
+        work_queue.put(None)
+        task_processor._worker_main(self.conf, 0, work_queue, result_queue,
+                                    None, None, None)
+        execute_batch.assert_called_once_with(self.conf, 'boot_server',
+                                              ('boot-0', 'boot-1'))
+        result = result_queue.get(timeout=5)
+        self.assertEqual((0, 'boot_server', ('boot-0', 'boot-1'), False),
+                         result[:4])
+        self.assertEqual([], result[4]['items'])
+
+    def test_metrics(self):
+        p = self._idle_processor(2)
+        p._result_queue = multiprocessing.Queue()
+        for worker in p._workers.values():
+            worker.work_queue = mock.Mock()
+        p.submit('boot_server', 'boot-0')
+        p.submit('boot_server', 'boot-1')
+        p._dispatch()
+        p.submit('create_volume', 'vol-0')
+        p._result_queue.put((0, 'boot_server', 'boot-0', True, {
+            'items': [('boot_server', 'complete', 0.3, 1.2)],
+            'db_queries': 4,
+        }))
+        p._collect_results(5)
+
+        text = p.metrics.render()
+        self.assertIn('enamel_tasks_queued{action="create_volume"} 1.0', text)
+        self.assertIn('enamel_tasks_completed_total{action="boot_server",'
+                      'result="success"} 1.0', text)
+        self.assertIn('enamel_task_item_duration_seconds_bucket{'
+                      'action="boot_server",state="complete",le="0.5"} 1.0',
+                      text)
+        self.assertIn('enamel_workers 2.0', text)
+        self.assertIn('enamel_workers_busy 1.0', text)
+        self.assertIn('enamel_db_queries_total{process="worker"} 4.0', text)
+        self.assertIn('enamel_task_item_queue_wait_seconds_count{'
+                      'action="boot_server"} 1.0', text)
+        self.assertEqual(0.3, round(p.item_latency('boot_server', 0.5), 1))
+
+    def test_desired_workers(self):
+        self.conf.set_override('workers', 10, 'task-processor')
+        self.conf.set_override('min_workers', 2, 'task-processor')
+        self.conf.set_override('scale_drain_time', 10, 'task-processor')
+        self.conf.set_override('action_concurrency', {'boot_server': '3'},
+                               'task-processor')
+        p = self._idle_processor(2)
+        self.assertEqual(2, p.desired_workers())
+
+        # Until their items have run, waiting tasks get a worker each,
+        # as far as the action's concurrency limit lets them start.
+        for i in range(5):
+            p.submit('boot_server', 'boot-%d' % i)
+        self.assertEqual(3, p.desired_workers())
+
+        # Quick items are shared out between fewer workers.
+        p._item_latency_metric.observe(2.0, action='create_volume')
+        for i in range(20):
+            p.submit('create_volume', 'vol-%d' % i)
+        self.assertEqual(7, p.desired_workers())
+
+        for i in range(20):
+            p.submit('create_volume', 'more-vol-%d' % i)
+        self.assertEqual(10, p.desired_workers())
+
+    def test_autoscale(self):
+        self.conf.set_override('workers', 4, 'task-processor')
+        self.conf.set_override('scale_interval', 0, 'task-processor')
+        self.conf.set_override('scale_down_delay', 60, 'task-processor')
+        now = [1000.0]
+        self.useFixture(fixtures.MockPatch('time.time', lambda: now[0]))
+        p = self._idle_processor(1)
+        p._workers[0].work_queue = mock.Mock()
+
+        def spawn():
+            index = p._next_worker_index = len(p._workers)
+            worker = task_processor._Worker(index, None, mock.Mock())
+            p._workers[index] = worker
+            return worker
+
+        self.useFixture(fixtures.MockPatchObject(p, '_spawn_worker', spawn))
+        for i in range(3):
+            p.submit('create_volume', 'vol-%d' % i)
+        p._autoscale()
+        self.assertEqual(3, len(p._workers))
+
+        # The pool only shrinks once it had idle workers for long enough.
+        for i in range(3):
+            p._scheduler.pop(lambda action: True)
+        p._autoscale()
+        now[0] += 30
+        p._autoscale()
+        self.assertEqual(3, len(p._workers))
+        p._workers[0].task = ('create_volume', 'vol-0')
+        now[0] += 30
+        p._autoscale()
+        self.assertEqual([0], list(p._workers))
+        self.assertEqual(2, len(p._retired))
+        for worker in p._retired:
+            worker.work_queue.put.assert_called_once_with(None)
+        self.assertIn('enamel_worker_scaling_total{direction="down"} 2.0',
+                      p.metrics.render())
@@ -0,0 +1,140 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import threading
+import time
+
+import mock
+from oslo_utils import timeutils
+
+from enamel import exception
+from enamel.tests.unit import base
+from enamel import watcher
+
+CREDENTIALS = {'handle': 'alice', 'token': 'secret'}
+
+
+class _FakeNova(object):
+    """Servers that go ACTIVE after a number of list calls."""
+
+    def __init__(self, polls_to_active):
+        self.polls_to_active = polls_to_active
+        self.calls = []
+
+    def list_changes(self, credentials, region_name, since):
+        self.calls.append((credentials['handle'], region_name))
+        servers = []
+        for server_id, polls in self.polls_to_active.items():
+            self.polls_to_active[server_id] = polls - 1
+            if polls == 1:
+                status = 'ERROR' if server_id.startswith('bad') else 'ACTIVE'
+                servers.append(mock.Mock(id=server_id, status=status))
+        return servers
+
+
+class TestServerWatcher(base.TestCase):
+
+    def _wait_all(self, server_watcher, server_ids, **kwargs):
+        results = {}
+
+        def wait(server_id):
+            try:
+                results[server_id] = server_watcher.wait(
+                    CREDENTIALS, 'east', server_id, **kwargs)
+            except exception.ServerWaitTimeout as exc:
+                results[server_id] = exc
+
+        threads = [threading.Thread(target=wait, args=(server_id,))
+                   for server_id in server_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_one_list_call_for_many_servers(self):
+        servers = ['server-%d' % i for i in range(20)]
+        nova = _FakeNova(dict((server_id, 3) for server_id in servers))
+        server_watcher = watcher.ServerWatcher(
+            min_interval=0.01, max_interval=0.01,
+            list_changes=nova.list_changes)
+
+        results = self._wait_all(server_watcher, servers, timeout=10)
+        for server_id in servers:
+            self.assertEqual('ACTIVE', results[server_id].status)
+        # Each poll covers every server waited for, so the number of
+        # calls does not grow with the number of servers.
+        self.assertLess(len(nova.calls), 10)
+        self.assertEqual(set([('alice', 'east')]), set(nova.calls))
+        self.assertEqual({}, server_watcher._groups)
+
+    def test_failed_server_wakes_waiter(self):
+        nova = _FakeNova({'bad-server': 1})
+        server_watcher = watcher.ServerWatcher(
+            min_interval=0.01, list_changes=nova.list_changes)
+        server = server_watcher.wait(CREDENTIALS, 'east', 'bad-server',
+                                     timeout=10)
+        self.assertEqual('ERROR', server.status)
+
+    def test_timeout(self):
+        nova = _FakeNova({})
+        server_watcher = watcher.ServerWatcher(
+            min_interval=0.01, list_changes=nova.list_changes)
+        self.assertRaises(exception.ServerWaitTimeout, server_watcher.wait,
+                          CREDENTIALS, 'east', 'missing', timeout=0.1)
+        self.assertEqual({}, server_watcher._groups)
+
+    def test_poll_reports_changes(self):
+        nova = _FakeNova({})
+        server_watcher = watcher.ServerWatcher(
+            list_changes=nova.list_changes)
+        since = timeutils.utcnow()
+        group = watcher._Group(CREDENTIALS, 'east', since)
+        group.waiters['server'].append(watcher._Waiter('server', ('ACTIVE',)))
+        self.assertFalse(server_watcher.poll(group))
+        nova.polls_to_active['server'] = 1
+        self.assertTrue(server_watcher.poll(group))
+        self.assertGreater(group.since, since - datetime.timedelta(
+            seconds=watcher.CLOCK_SKEW))
+
+    def test_poll_ignores_servers_listed_again(self):
+        server_watcher = watcher.ServerWatcher(list_changes=lambda *a: [
+            mock.Mock(id='server', status='BUILD',
+                      **{'OS-EXT-STS:task_state': 'spawning'})])
+        group = watcher._Group(CREDENTIALS, 'east', timeutils.utcnow())
+        group.waiters['server'].append(watcher._Waiter('server', ('ACTIVE',)))
+        self.assertTrue(server_watcher.poll(group))
+        self.assertFalse(server_watcher.poll(group))
+
+    def test_new_waiter_cuts_backoff_short(self):
+        nova = _FakeNova({'slow': 1000})
+        server_watcher = watcher.ServerWatcher(
+            min_interval=0.01, max_interval=30,
+            list_changes=nova.list_changes)
+        slow = threading.Thread(target=self._wait_all,
+                                args=(server_watcher, ['slow']),
+                                kwargs={'timeout': 2})
+        slow.start()
+        self.addCleanup(slow.join)
+        while not nova.calls:
+            time.sleep(0.01)
+        # Back off well past the test's patience.
+        with server_watcher._lock:
+            server_watcher.interval = server_watcher.max_interval
+        time.sleep(0.1)
+        nova.polls_to_active['fast'] = 1
+        started = time.time()
+        server = server_watcher.wait(CREDENTIALS, 'east', 'fast', timeout=1)
+        self.assertEqual('ACTIVE', server.status)
+        self.assertLess(time.time() - started, 1)
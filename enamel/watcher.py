@@ -0,0 +1,240 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Watching nova servers until they reach the state a task waits for.
+
+Rather than each task item polling each of its servers, items register
+the servers they wait for with the worker's ServerWatcher. Its thread
+makes one list call per set of credentials and region, asking nova for
+the servers changed since the previous call, and wakes the items whose
+server reached a state they wait for. The number of calls depends on
+how many users have servers in flight, not on how many servers.
+
+The interval between polls adapts: it drops to the minimum while servers
+are changing and backs off towards the maximum while nothing happens.
+"""
+
+import collections
+import datetime
+import threading
+import time
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from enamel import clients
+from enamel import exception
+from enamel import retry
+
+LOG = logging.getLogger(__name__)
+
+ACTIVE = 'ACTIVE'
+# States after which a server will not reach the state waited for.
+FAILED_STATES = ('ERROR', 'DELETED', 'SOFT_DELETED')
+
+# How much the poll interval grows after a poll that saw no change.
+BACKOFF = 1.5
+
+# Seconds subtracted from changes-since to allow for clock skew with nova.
+CLOCK_SKEW = 2
+
+_WATCHER = None
+
+
+def list_changed_servers(credentials, region_name, since):
+    """Return the servers changed since a time, deleted ones included."""
+    nova = clients.client('compute', credentials, region_name)
+    return retry.call('compute', 'list', nova.servers.list, search_opts={
+        'changes-since': since.isoformat(),
+    })
+
+
+class _Waiter(object):
+
+    def __init__(self, server_id, states):
+        self.server_id = server_id
+        self.states = states
+        self.server = None
+        self.event = threading.Event()
+
+
+class _Group(object):
+    """The servers watched with one set of credentials in one region."""
+
+    def __init__(self, credentials, region_name, since):
+        self.credentials = credentials
+        self.region_name = region_name
+        self.since = since
+        self.waiters = collections.defaultdict(list)
+        # The (status, task_state) each watched server was last listed
+        # in.
+        self.seen = {}
+
+
+class ServerWatcher(object):
+    """Wait for servers to reach a state with a few bulk list calls.
+
+    :param min_interval: seconds between polls while servers change
+    :param max_interval: most seconds between polls while none change
+    :param list_changes: callable(credentials, region_name, since)
+                         returning the servers changed since a time
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=10.0,
+                 list_changes=list_changed_servers):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._list_changes = list_changes
+        self._lock = threading.Lock()
+        self._groups = {}
+        self._thread = None
+        self._wakeup = threading.Event()
+
+    @classmethod
+    def from_config(cls, conf):
+        options = conf['task-processor']
+        return cls(min_interval=options.server_poll_min_interval,
+                   max_interval=options.server_poll_max_interval)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def wait(self, credentials, region_name, server_id, states=(ACTIVE,),
+             timeout=None, since=None):
+        """Wait for a server to reach one of states.
+
+        :param since: time from which changes of the server are of
+                      interest, such as just before it was booted; by
+                      default, now
+        :returns: the server as last listed, which is in one of states or
+                  in one of FAILED_STATES
+        :raises: ServerWaitTimeout if it did not get there within timeout
+        """
+        waiter = _Waiter(server_id, states)
+        key = (credentials['handle'], region_name)
+        since = timeutils.normalize_time(
+            since or timeutils.utcnow()) - datetime.timedelta(
+                seconds=CLOCK_SKEW)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = _Group(credentials, region_name, since)
+                self._groups[key] = group
+            group.since = min(group.since, since)
+            group.waiters[server_id].append(waiter)
+            # Look at the new server soon rather than after a long backoff.
+            self.interval = self.min_interval
+            self._wakeup.set()
+            self._start()
+        try:
+            if not waiter.event.wait(timeout):
+                raise exception.ServerWaitTimeout(server_id=server_id,
+                                                  states=', '.join(states))
+        finally:
+            self._forget(key, waiter)
+        return waiter.server
+
+    def _forget(self, key, waiter):
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                return
+            waiters = group.waiters.get(waiter.server_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                group.waiters.pop(waiter.server_id, None)
+                group.seen.pop(waiter.server_id, None)
+            if not group.waiters:
+                del self._groups[key]
+
+    def _run(self):
+        last_poll = time.time()
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                delay = last_poll + self.interval - time.time()
+            if delay > 0:
+                # wait() cuts a long backoff short; polls
+                # are still min_interval apart.
+                self._wakeup.wait(delay)
+                continue
+            last_poll = time.time()
+            with self._lock:
+                groups = list(self._groups.values())
+                if not groups:
+                    # Nothing left to watch; the next wait() starts a
+                    # new thread.
+                    self._thread = None
+                    return
+            changed = False
+            for group in groups:
+                changed = self.poll(group) or changed
+            with self._lock:
+                if changed:
+                    self.interval = self.min_interval
+                else:
+                    self.interval = min(self.max_interval,
+                                        self.interval * BACKOFF)
+
+    def poll(self, group):
+        """List the group's changed servers and wake whom they concern.
+
+        :returns: whether any watched server changed
+        """
+        started = timeutils.utcnow()
+        with self._lock:
+            since = group.since
+        try:
+            servers = self._list_changes(group.credentials,
+                                         group.region_name, since)
+        except Exception:
+            LOG.exception("Unable to list changed servers")
+            return False
+        changed = False
+        with self._lock:
+            # A waiter may have asked for older changes meanwhile.
+            if group.since >= since:
+                group.since = started - datetime.timedelta(
+                    seconds=CLOCK_SKEW)
+            for server in servers:
+                waiters = group.waiters.get(server.id)
+                if not waiters:
+                    continue
+                # A server listed again without moving on is no change.
+                seen = (server.status,
+                        getattr(server, 'OS-EXT-STS:task_state', None))
+                if group.seen.get(server.id) != seen:
+                    group.seen[server.id] = seen
+                    changed = True
+                failed = server.status in FAILED_STATES
+                for waiter in list(waiters):
+                    if failed or server.status in waiter.states:
+                        waiter.server = server
+                        waiter.event.set()
+        return changed
+
+
+def init(conf):
+    """Give this process a watcher of its own."""
+    global _WATCHER
+    _WATCHER = ServerWatcher.from_config(conf)
+
+
+def wait_for_server(credentials, region_name, server_id, states=(ACTIVE,),
+                    timeout=None, since=None):
+    """Wait with this process's watcher for a server to reach states."""
+    return _WATCHER.wait(credentials, region_name, server_id, states,
+                         timeout, since)